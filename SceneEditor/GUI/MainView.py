@@ -18,7 +18,6 @@ from SceneEditor.GUI.MenuBar import MenuBar
 from SceneEditor.GUI.ToolBar import ToolBar
 from SceneEditor.GUI.panels.PropertiesPanel import PropertiesPanel
 from SceneEditor.GUI.panels.StructurePanel import StructurePanel
-from SceneEditor.GUI.dialogs.ShaderLoaderDialogManager import ShaderLoaderDialogManager
 
 
 class MainView(DirectObject):
@@ -215,6 +214,8 @@ class MainView(DirectObject):
             height - self.menuBarHeight - self.toolBarHeight)
 
     def show_load_shader_dialog(self):
+        # the dialog is imported on first use to keep the startup time down
+        from SceneEditor.GUI.dialogs.ShaderLoaderDialogManager import ShaderLoaderDialogManager
         base.messenger.send("unregisterKeyboardAndMouseEvents")
         ShaderLoaderDialogManager(self.close_load_shader_dialog, self.core.scene_objects)
 
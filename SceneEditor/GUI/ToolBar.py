@@ -9,6 +9,7 @@ from direct.gui.DirectButton import DirectButton
 from direct.gui.DirectSlider import DirectSlider
 from direct.gui.DirectFrame import DirectFrame
 from direct.gui.DirectCheckBox import DirectCheckBox
+from direct.gui.DirectWaitBar import DirectWaitBar
 from DirectGuiExtension.DirectMenuItem import DirectMenuItem, DirectMenuItemEntry, DirectMenuItemSubMenu
 from DirectGuiExtension.DirectBoxSizer import DirectBoxSizer
 
@@ -223,10 +224,44 @@ class ToolBar(DirectObject):
         self.toolBar.addItem(btn)
         '''
 
+        self.add_separator()
+
+        # progress of background work like loading models
+        self.progressBar = DirectWaitBar(
+            text="",
+            text_scale=12,
+            text_pos=(75, -4),
+            text_fg=(1,1,1,1),
+            range=1,
+            value=0,
+            relief=DGG.FLAT,
+            frameSize=(0,150,-10,10),
+            frameColor=(0.15, 0.15, 0.15, 1),
+            barColor=(0.25, 0.25, 1, 1))
+        self.toolBar.addItem(self.progressBar)
+        self.progressBar.hide()
+
+        # stops loading a project, only shown while one is loaded
+        self.btnCancelLoading = DirectButton(
+            text="x",
+            text_scale=16,
+            text_pos=(0, -5),
+            frameSize=(-10,10,-10,10),
+            frameColor=buttonColor,
+            relief=DGG.FLAT,
+            command=base.messenger.send,
+            extraArgs=["cancel_project_loading"])
+        self.btnCancelLoading.bind(DGG.ENTER, self.tt.show, ["Cancel loading the project (Esc)"])
+        self.btnCancelLoading.bind(DGG.EXIT, self.tt.hide)
+        self.toolBar.addItem(self.btnCancelLoading)
+        self.btnCancelLoading.hide()
+
         if not ConfigVariableBool("show-toolbar", True).getValue():
             self.toolBar.hide()
 
         self.accept("toggleGrid", self.setGrid)
+        self.accept("loading_progress", self.setProgress)
+        self.accept("project_loading", self.setProjectLoading)
 
     def add_separator(self):
         placeholder = DirectFrame(
@@ -249,3 +284,18 @@ class ToolBar(DirectObject):
 
         self.cb_grid.setImage()
 
+    def setProjectLoading(self, loading):
+        if loading:
+            self.btnCancelLoading.show()
+        else:
+            self.tt.hide()
+            self.btnCancelLoading.hide()
+
+    def setProgress(self, done, total, text=""):
+        if total <= 0 or done >= total:
+            self.progressBar.hide()
+            return
+        self.progressBar["range"] = total
+        self.progressBar["value"] = done
+        self.progressBar["text"] = f"{text} {done}/{total}"
+        self.progressBar.show()
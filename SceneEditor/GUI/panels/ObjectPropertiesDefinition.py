@@ -169,6 +169,7 @@ DEFINITIONS = {
     #
     "model":DEFAULT_DEFINITIONS + [
         Definition('filepath', 'Filepath', str, setAsTag=True),
+        Definition('keep_dynamic', 'Keep dynamic on export', bool, setAsTag=True),
         Definition('', 'Clear Shader', None, editType=t.command, valueOptions="clear_shader")
     ],
 
@@ -41,6 +41,7 @@ from DirectGuiExtension.DirectAutoSizer import DirectAutoSizer
 from DirectGuiExtension.DirectCollapsibleFrame import DirectCollapsibleFrame
 
 from SceneEditor.GUI.panels import ObjectPropertiesDefinition
+from SceneEditor.tools.PropertyCodec import is_tag_enabled
 
 DGG.BELOW = "below"
 MWUP = PGButton.getPressPrefix() + MouseButton.wheel_up().getName() + '-'
@@ -68,6 +69,8 @@ class PropertyHelper:
             for lookupAttr, lookupAttrArgs in definition.lookupAttrs.items():
                 editObj = getattr(editObj, lookupAttr)(*lookupAttrArgs)
         if definition.setAsTag:
+            if definition.type == bool:
+                return is_tag_enabled(editObj.get_tag(definition.internalName))
             return editObj.get_tag(definition.internalName)
         if definition.getFunctionName:
             return getattr(editObj, definition.getFunctionName)()
@@ -86,7 +89,13 @@ class PropertyHelper:
                     logging.debug(f"couldn't convert value {value} to type {definition.type}")
             getattr(editObj, definition.setFunctionName)(value)
         elif definition.setAsTag:
-            editObj.set_tag(definition.internalName, value)
+            if definition.type != bool:
+                editObj.set_tag(definition.internalName, value)
+            elif value:
+                editObj.set_tag(definition.internalName, "True")
+            else:
+                # a disabled flag must not hide the one set on a parent
+                editObj.clear_tag(definition.internalName)
         else:
             setattr(editObj, definition.internalName, value)
 
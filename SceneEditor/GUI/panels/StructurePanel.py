@@ -19,14 +19,28 @@ from DirectGuiExtension.DirectBoxSizer import DirectBoxSizer
 from DirectGuiExtension.DirectAutoSizer import DirectAutoSizer
 
 class StructurePanel():
+    # height of a single row in the structure tree
+    ROW_HEIGHT = 16
+    # rows created above and below the visible part of the scrolled frame
+    ROW_OVERSCAN = 4
+    # key of the selectable element button in a rows widget dict
+    ROW_BUTTON_KEY = "button"
+
     def __init__(self, parent):
         height = DGH.getRealHeight(parent)
-        self.collapsedElements = []
+        self.collapsedElements = set()
 
         self.parent = parent
 
         self.object_list = []
 
+        # flat model of the visible tree as (nodepath, level) tuples
+        self.rows = []
+        # nodepath to row index lookup
+        self.row_index = {}
+        # widgets of rows that are currently created, by row index
+        self.row_widgets = {}
+
         self.box = DirectBoxSizer(
             frameColor=(0.25, 0.25, 0.25, 1),
             autoUpdateFrameSize=False,
@@ -77,9 +91,12 @@ class StructurePanel():
         self.box.addItem(self.structureFrame)
         self.structureFrame.bind(DGG.MWDOWN, self.scroll, [0.01])
         self.structureFrame.bind(DGG.MWUP, self.scroll, [-0.01])
+        # only rows within the scroll window get widgets, so recreate them
+        # whenever the scrollbar moves
+        self.structureFrame.verticalScroll["command"] = self.__update_visible_rows
         self.maxWidth = parent["frameSize"][1]-20
 
-        self.skipped_nodes = ["DirectGrid", "selection_highlight_marker", "show_collisions", "Pivot Point"]
+        self.skipped_nodes = ["DirectGrid", "selection_highlight_marker", "show_collisions", "Pivot Point", "model_load_placeholder"]
 
     def scroll(self, scrollStep, event):
         self.structureFrame.verticalScroll.scrollStep(scrollStep)
@@ -105,47 +122,118 @@ class StructurePanel():
                     self.parent["frameSize"][2]+DGH.getRealHeight(self.lblHeader), self.parent["frameSize"][3])
 
             self.recalcScrollSize()
+            self.__update_visible_rows()
 
     def refreshStructureTree(self, objects, selected_objects):
+        """Rebuilds the row model of the scene graph and recreates the widgets
+        of the rows which are currently visible in the scrolled frame"""
         self.objects = objects
         self.selected_objects = selected_objects
 
-        # cleanup the structure tree
-        for element in self.structureFrame.getCanvas().getChildren():
-            element.removeNode()
+        # rebuild the flat row model of the tree
+        self.rows = []
+        self.row_index = {}
+        self.__fill_structure_tree(render, 0)
+        self.object_list = [obj for obj, level in self.rows]
 
+        # cleanup all created row widgets
+        for index in list(self.row_widgets.keys()):
+            self.__destroy_row(index)
         self.maxWidth = self.parent["frameSize"][1]-20
-        self.itemCounter = 1
 
-        # create the tree
-        self.__fill_structure_tree(render, 0, -16)
+        self.__update_canvas_size()
+        self.__update_visible_rows()
+
+    def refreshSelection(self, selected_objects):
+        """Patches the highlighting of the visible rows to the given selection
+        without rebuilding the tree"""
+        self.selected_objects = selected_objects
+        selected = set(selected_objects)
+        for index, widgets in self.row_widgets.items():
+            obj = self.rows[index][0]
+            btn = widgets[self.ROW_BUTTON_KEY]
+            if btn is None:
+                continue
+            if obj in selected:
+                btn.setColorScale(1,1,0,1)
+            else:
+                btn.clearColorScale()
+
+    def refreshRows(self, objs):
+        """Recreates the widgets of the rows showing the given objects if they
+        are currently visible"""
+        for obj in objs:
+            if obj not in self.row_index:
+                continue
+            index = self.row_index[obj]
+            if index in self.row_widgets:
+                self.__destroy_row(index)
+                self.__create_row(index)
 
+    def __update_canvas_size(self):
         self.structureFrame["canvasSize"] = (
             self.structureFrame["frameSize"][0], self.maxWidth,
-            self.itemCounter*-16, 0)
+            (len(self.rows)+1)*-self.ROW_HEIGHT, 0)
         self.structureFrame.setCanvasSize()
         self.recalcScrollSize()
 
-    def __fill_structure_tree(self, root, level, z):
+    def __get_visible_row_range(self):
+        frame_height = abs(self.structureFrame["frameSize"][3] - self.structureFrame["frameSize"][2])
+        canvas_height = (len(self.rows)+1) * self.ROW_HEIGHT
+        scroll_value = self.structureFrame.verticalScroll["value"]
+        offset = max(0, canvas_height - frame_height) * scroll_value
+
+        first = max(0, int(offset / self.ROW_HEIGHT) - self.ROW_OVERSCAN)
+        last = min(
+            len(self.rows),
+            int((offset + frame_height) / self.ROW_HEIGHT) + self.ROW_OVERSCAN)
+        return first, last
+
+    def __update_visible_rows(self, args=None):
+        """Creates the widgets for all rows in the visible scroll window and
+        destroys the ones that left it"""
+        first, last = self.__get_visible_row_range()
+
+        for index in list(self.row_widgets.keys()):
+            if index < first or index >= last:
+                self.__destroy_row(index)
+
+        pre_width = self.maxWidth
+        for index in range(first, last):
+            if index not in self.row_widgets:
+                self.__create_row(index)
+
+        if self.maxWidth != pre_width:
+            self.__update_canvas_size()
+
+    def __fill_structure_tree(self, root, level):
         if root.getName() in self.skipped_nodes: return
 
-        #if level > 0:
         scene_roots = ["scene_root", "scene_model_parent"]
         if root.get_name() not in scene_roots and root.get_name() != "":
-            self.itemCounter += 1
-            self.__make_structure_frame_tree_item(root, level, z)
+            self.row_index[root] = len(self.rows)
+            self.rows.append((root, level))
         if hasattr(root, "getChildren") \
         and root not in self.collapsedElements:
             for child in root.getChildren():
                 if not child.is_stashed():
-                    z=-16*self.itemCounter
-                    self.__fill_structure_tree(child, level+1, z)
+                    self.__fill_structure_tree(child, level+1)
+
+    def __create_row(self, index):
+        obj, level = self.rows[index]
+        z = -self.ROW_HEIGHT * (index+1)
+        self.row_widgets[index] = self.__make_structure_frame_tree_item(obj, level, z)
+
+    def __destroy_row(self, index):
+        for widget in self.row_widgets.pop(index).values():
+            if widget is not None:
+                widget.destroy()
 
     def __make_structure_frame_tree_item(self, obj, parents_level, z):
         parent_shift = 10
         margin = 5
         shift = 6
-        self.object_list.append(obj)
+        widgets = {self.ROW_BUTTON_KEY: None}
         if not obj.has_tag("scene_object_id"):
             if hasattr(obj, "getChildren") and obj.getNumChildren() > 0:
                 is_good = False
@@ -171,6 +259,7 @@ class StructurePanel():
                     btnC.setTransparency(TransparencyAttrib.M_alpha)
                     btnC.bind(DGG.MWDOWN, self.scroll, [0.01])
                     btnC.bind(DGG.MWUP, self.scroll, [-0.01])
+                    widgets["collapse"] = btnC
 
             lbl = DirectLabel(
                 text=obj.getName(),
@@ -181,6 +270,7 @@ class StructurePanel():
                 scale=16,
                 parent=self.structureFrame.getCanvas())
             self.maxWidth = max(self.maxWidth, lbl.getX() + lbl.getWidth()*lbl.getScale()[0])
+            widgets["label"] = lbl
         else:
 
             if hasattr(obj, "getChildren") and obj.getNumChildren() > 0:
@@ -201,6 +291,7 @@ class StructurePanel():
                 btnC.setTransparency(TransparencyAttrib.M_alpha)
                 btnC.bind(DGG.MWDOWN, self.scroll, [0.01])
                 btnC.bind(DGG.MWUP, self.scroll, [-0.01])
+                widgets["collapse"] = btnC
 
             # Element Name
             btn = DirectButton(
@@ -218,6 +309,7 @@ class StructurePanel():
                 parent=self.structureFrame.getCanvas())
             btn.bind(DGG.MWDOWN, self.scroll, [0.01])
             btn.bind(DGG.MWUP, self.scroll, [-0.01])
+            widgets[self.ROW_BUTTON_KEY] = btn
 
             if obj in self.selected_objects:
                 btn.setColorScale(1,1,0,1)
@@ -237,6 +329,7 @@ class StructurePanel():
             btnX.setTransparency(TransparencyAttrib.M_multisample)
             btnX.bind(DGG.MWDOWN, self.scroll, [0.01])
             btnX.bind(DGG.MWUP, self.scroll, [-0.01])
+            widgets["delete"] = btnX
 
             x += margin + btnX.getWidth()
             # Visibility Button
@@ -257,6 +350,7 @@ class StructurePanel():
             btnV.bind(DGG.MWDOWN, self.scroll, [0.01])
             btnV.bind(DGG.MWUP, self.scroll, [-0.01])
             self.maxWidth = max(self.maxWidth, btnV.getX() + 8)
+            widgets["visibility"] = btnV
 
             x += margin + btnV.getWidth()
             # Move Up Button
@@ -273,6 +367,7 @@ class StructurePanel():
             btnUp.setTransparency(TransparencyAttrib.M_multisample)
             btnUp.bind(DGG.MWDOWN, self.scroll, [0.01])
             btnUp.bind(DGG.MWUP, self.scroll, [-0.01])
+            widgets["up"] = btnUp
 
             x += margin + btnUp.getWidth()
             # Move Down Button
@@ -289,6 +384,9 @@ class StructurePanel():
             btnDown.setTransparency(TransparencyAttrib.M_multisample)
             btnDown.bind(DGG.MWDOWN, self.scroll, [0.01])
             btnDown.bind(DGG.MWUP, self.scroll, [-0.01])
+            widgets["down"] = btnDown
+
+        return widgets
 
     def __select_element(self, obj, args=None):
         if obj is not None:
@@ -309,16 +407,14 @@ class StructurePanel():
     def __collapse_element(self, collapse, obj, update_tree=True):
         if obj is not None:
             if collapse:
-                if obj not in self.collapsedElements:
-                    self.collapsedElements.append(obj)
+                self.collapsedElements.add(obj)
             else:
-                if obj in self.collapsedElements:
-                    self.collapsedElements.remove(obj)
+                self.collapsedElements.discard(obj)
             if update_tree:
                 base.messenger.send("update_structure")
 
     def collapse_all(self):
-        self.collapsedElements = []
+        self.collapsedElements = set()
         scene_roots = ["scene_root", "scene_model_parent", "render"]
         for obj in self.object_list:
             if obj.get_name() in scene_roots or obj.get_name() == "":
@@ -0,0 +1,213 @@
+import os
+import time
+import builtins
+import logging
+
+from panda3d.core import loadPrcFileData, ConfigVariableSearchPath
+
+from direct.showbase.ShowBase import ShowBase
+
+from SceneEditor.core.Core import Core
+from SceneEditor.export.ExportPy import ExporterPy
+from SceneEditor.export.ExportProject import ExporterProject
+from SceneEditor.export.ExportBam import ExporterBam
+from SceneEditor.loader.LoadProject import ProjectLoader
+from SceneEditor.tools.CustomExporters import (
+    get_custom_export_path,
+    load_headless_exporters)
+from SceneEditor.GUI.panels.ObjectPropertiesDefinition import DEFINITIONS
+from SceneEditor.GUI.panels.PropertiesPanel import PropertyHelper
+
+# everything is done synchronously and without a window
+HEADLESS_PRC = """
+window-type none
+audio-library-name null
+scene-editor-streaming-project-load #f
+scene-editor-async-model-loading #f
+scene-editor-streaming-bam-export #f
+scene-editor-autosave #f
+scene-editor-journal #f
+"""
+
+
+class HeadlessEditor:
+    """The editor core without a window or GUI to open, change, save and
+    export projects from scripts.
+
+    One editor can handle any number of projects one after the other, the
+    engine and the model cache are kept in between. If load_models is
+    False, models are only created as their placeholders without loading
+    their files, which is enough for edits of the project data like
+    retagging or changing model paths but not for exports.
+
+        editor = HeadlessEditor(load_models=False)
+        def repath(editor):
+            for obj in editor.find(object_type="model"):
+                path = obj.get_tag("filepath")
+                editor.set_model_path(obj, path.replace("old/", "new/"))
+        editor.process(["a.scene", "b.scene"], repath)
+    """
+
+    def __init__(self, prc_data="", load_models=True, custom_export_path=None):
+        start = time.perf_counter()
+        loadPrcFileData("", prc_data)
+        # make sure to load the custom model paths of the editor config
+        paths_cfg = ConfigVariableSearchPath("custom-model-path", "").getValue()
+        for path in paths_cfg.getDirectories():
+            loadPrcFileData("", "model-path {}".format(str(path)))
+        loadPrcFileData("", HEADLESS_PRC)
+        if not load_models:
+            loadPrcFileData("", "scene-editor-load-model-geometry #f")
+        self.load_models = load_models
+
+        if not hasattr(builtins, "base"):
+            ShowBase()
+
+        self.core = Core()
+        self.path = None
+
+        self.custom_export_path = custom_export_path or get_custom_export_path()
+        # custom exporters by their id, loaded on first use
+        self.custom_exporters = None
+
+        self.startup_time = time.perf_counter() - start
+        logging.debug(f"Started headless editor in {self.startup_time:0.3f}s")
+
+    #
+    # PROJECTS
+    #
+    def new(self):
+        self.core.new_project()
+        self.path = None
+
+    def open(self, path):
+        """Loads the project at the given path, replacing the current scene"""
+        self.core.new_project()
+        loader = ProjectLoader(
+            os.path.dirname(path),
+            os.path.basename(path),
+            self.core,
+            newProjectCall=lambda: True,
+            directLoading=True)
+        if loader.hasErrors:
+            raise IOError(f"Couldn't load project {path}")
+        self.path = path
+
+    def save(self, path=None):
+        """Saves the project to the given path, defaults to the path it has
+        been opened from"""
+        if path is None:
+            path = self.path
+        if path is None:
+            raise ValueError("No path to save the project to")
+        ExporterProject(
+            os.path.dirname(path),
+            os.path.basename(path),
+            self.core.scene_model_parent,
+            self.core.scene_objects,
+            direct_save=True)
+        self.path = path
+
+    def export(self, target, path):
+        """Writes the scene to the given path with the exporter of the given
+        target, which is py, bam or the id of a custom exporter"""
+        if target == "py":
+            exporter_class = ExporterPy
+        elif target == "bam":
+            exporter_class = ExporterBam
+        else:
+            exporter_class = self.get_custom_exporters()[target].Exporter
+        if not self.load_models and target != "py":
+            logging.warning(f"Exporting {path} without the geometry of its models")
+
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        exporter_class(
+            os.path.dirname(path),
+            os.path.basename(path),
+            self.core.scene_model_parent,
+            self.core.scene_objects,
+            None,
+            direct_save=True)
+        if not os.path.exists(path) or os.path.getmtime(path) == mtime:
+            raise IOError(f"{path} has not been written")
+
+    def get_custom_exporters(self):
+        if self.custom_exporters is None:
+            self.custom_exporters = load_headless_exporters(self.custom_export_path)
+        return self.custom_exporters
+
+    def process(self, paths, function, save=True):
+        """Opens each of the given projects, calls function with this editor
+        and saves the project again. Returns a dict of path -> error message
+        or None if the project has been processed."""
+        results = {}
+        for path in paths:
+            try:
+                self.open(path)
+                function(self)
+                if save:
+                    self.save(path)
+                results[path] = None
+            except Exception as e:
+                logging.error(f"Couldn't process project {path}")
+                logging.exception(e)
+                results[path] = str(e)
+        return results
+
+    #
+    # SCENE OBJECTS
+    #
+    def find(self, name=None, object_type=None):
+        """Returns the scene objects with the given name and type, both are
+        optional"""
+        if name is not None:
+            objects = self.core.scene_objects.get_by_name(name)
+            if object_type is not None:
+                objects = [obj for obj in objects if obj.get_tag("object_type") == object_type]
+            return objects
+        if object_type is not None:
+            return self.core.scene_objects.get_by_type(object_type)
+        return self.core.scene_objects[:]
+
+    def get_definition(self, obj, name):
+        """Returns the property definition with the given internal name for
+        the object"""
+        object_type = obj.get_tag("object_type")
+        if object_type == "light":
+            object_type = obj.get_tag("light_type")
+        elif object_type == "collision":
+            object_type = obj.get_tag("collision_solid_type")
+        elif object_type == "camera":
+            object_type = obj.get_tag("camera_type")
+
+        for definition in DEFINITIONS.get(object_type, []):
+            if definition.internalName == name:
+                return definition
+        raise KeyError(f"{object_type} has no property {name}")
+
+    def get_property(self, obj, name):
+        return PropertyHelper.getValues(self.get_definition(obj, name), obj)
+
+    def set_property(self, obj, name, value):
+        """Sets the property as if it was edited in the properties panel"""
+        PropertyHelper.setValue(self.get_definition(obj, name), obj, value)
+        if name == "name":
+            self.core.scene_objects.update_name(obj)
+        self.core.mark_object_dirty(obj)
+
+    def set_model_path(self, obj, path):
+        """Points the model to another file, replacing its geometry if models
+        are loaded"""
+        self.set_property(obj, "filepath", str(path))
+        if not self.load_models:
+            return
+
+        model = self.core.model_cache.get(path)
+        if model is None:
+            model = loader.loadModel(path)
+            self.core.model_cache.add(path, model)
+        # scene objects placed below the model are kept
+        for child in obj.get_children():
+            if not child.has_tag("scene_object_id"):
+                child.remove_node()
+        self.core.swap_in_model(obj, model)
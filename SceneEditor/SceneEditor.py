@@ -1,7 +1,6 @@
 import sys
 import os
 import logging
-from importlib.machinery import SourceFileLoader
 
 from panda3d.core import (
     TextNode,
@@ -17,10 +16,11 @@ from direct.showbase.DirectObject import DirectObject
 
 from SceneEditor.core.CameraController import CameraController
 from SceneEditor.core.Core import Core
-from SceneEditor.export.ExportPy import ExporterPy
-from SceneEditor.export.ExportProject import ExporterProject
-from SceneEditor.export.ExportBam import ExporterBam
-from SceneEditor.loader.LoadProject import ProjectLoader
+from SceneEditor.tools.RefreshScheduler import RefreshScheduler
+from SceneEditor.tools.AutosaveService import AutosaveService
+from SceneEditor.tools.CustomExporters import read_manifest, import_custom_exporter
+from SceneEditor.tools.BinaryProjectTools import BINARY_PROJECT_EXTENSION
+from SceneEditor.tools.StartupTimer import startup_timer
 from SceneEditor.GUI.MainView import MainView
 
 from direct.gui import DirectGuiGlobals as DGG
@@ -28,14 +28,17 @@ from direct.gui.DirectFrame import DirectFrame
 from direct.gui.DirectDialog import OkCancelDialog
 
 from DirectGuiExtension.DirectTooltip import DirectTooltip
-from DirectFolderBrowser.DirectFolderBrowser import DirectFolderBrowser
 
+# exporters, the project loader, dialogs and simplepbr are only imported
+# once they are used to keep the startup time down
 
-SIMPLE_PBR_SUPPORT = True
-try:
-    import simplepbr
-except:
-    SIMPLE_PBR_SUPPORT = False
+# mouse events which only move the camera, these stay enabled while a
+# project is being loaded
+CAMERA_MOUSE_EVENTS = [
+    "mouse2", "mouse2-up",
+    "shift", "shift-up",
+    "shift-mouse2", "shift-mouse2-up",
+    "wheel_up", "wheel_down"]
 
 class SceneEditor(DirectObject):
     def __init__(self, parent):
@@ -51,14 +54,23 @@ class SceneEditor(DirectObject):
 
         self.opened_dialog_close_functions = []
 
+        # coalesces UI refresh events to one refresh per frame
+        self.refresh_scheduler = RefreshScheduler()
+        self.register_ui_refreshes()
+
         # setup core
         self.core = Core()
+        startup_timer.mark("core")
+
+        # saves unsaved changes periodically in the background
+        self.autosave = AutosaveService(self.core)
 
         # setup 3D scene camera movements
         self.camcontroller = CameraController()
 
         # setup Editor UI
         self.setup_gui()
+        startup_timer.mark("gui")
 
         # enable engines collision system
         base.cTrav = CollisionTraverser("base traverser")
@@ -71,10 +83,17 @@ class SceneEditor(DirectObject):
         self.scale_object = False
         self.mouse_events_disabled = True
         self.keyboard_events_disabled = True
+        # editing is blocked while a project is loaded over several frames
+        self.project_loading = False
 
         # Decide which shading system to use
-        if ConfigVariableBool("scene-editor-want-simplepbr", False).getValue() \
-        and SIMPLE_PBR_SUPPORT:
+        simplepbr = None
+        if ConfigVariableBool("scene-editor-want-simplepbr", False).getValue():
+            try:
+                import simplepbr
+            except ImportError:
+                logging.warning("simplepbr is not installed, using the auto shader")
+        if simplepbr is not None:
             # Use simple PBR
             simplepbr.init(
                 render_node=self.core.scene_model_parent,
@@ -86,9 +105,6 @@ class SceneEditor(DirectObject):
             self.core.scene_root.set_shader_auto()
             #self.core.scene_root.setAntialias(AntialiasAttrib.MAuto)
 
-        # enable physics and particles
-        base.enableParticles()
-
         # Event actions
         self.mouseEvents = {
             # CAM MOUSE HANDLING
@@ -104,6 +120,8 @@ class SceneEditor(DirectObject):
             # MOUSE PICKING
             "mouse1": [self.core.handle_pick, [False]],
             "shift-mouse1": [self.core.handle_pick, [True]],
+            "mouse1-up": [self.core.stop_box_selection],
+            "shift-mouse1-up": [self.core.stop_box_selection],
             "mouse3": [self.core.deselect_all],
         }
 
@@ -159,6 +177,8 @@ class SceneEditor(DirectObject):
         # saving/loading path
         self.lastDirPath = ConfigVariableString("work-dir-path", "~").getValue()
         self.lastFileNameWOExtension = "scene"
+        # either .scene for json or .sceneb for binary projects
+        self.lastProjectExtension = ".scene"
 
         self.enable_events()
 
@@ -168,8 +188,13 @@ class SceneEditor(DirectObject):
         # setup custom exporters
         self.custom_exporters = {}
         self.add_custom_exporters()
+        startup_timer.mark("custom exporters")
+
+        self.autosave.start()
 
         base.taskMgr.step()
+        startup_timer.mark("first frame")
+        startup_timer.report()
         base.taskMgr.do_method_later(0, self.mainView.update_3d_display_region, "SceneEditor_delayed_display_region_update", extraArgs=[])
 
     def enable_editor(self):
@@ -232,6 +257,9 @@ class SceneEditor(DirectObject):
         self.accept("setDirtyFlag", self.set_dirty)
         self.accept("clearDirtyFlag", self.set_clean)
         self.accept("update_selection_highlight_marker", self.core.update_selection_highlight_marker)
+        self.accept("suspend_ui_refreshes", self.refresh_scheduler.suspend)
+        self.accept("resume_ui_refreshes", self.refresh_scheduler.resume)
+        self.accept("project_loading", self.set_project_loading)
 
         #
         # UI EVENTS
@@ -268,9 +296,7 @@ class SceneEditor(DirectObject):
         self.accept("addPhysicsNode", self.core.add_physics_node)
         self.accept("addShader", self.core.add_shader)
 
-        self.accept("update_structure", self.update_structure_panel)
-        self.accept("update_properties", self.update_properties_panel)
-        self.accept("collapse_structure", self.collapse_structure)
+        self.refresh_scheduler.unpause()
 
         # UI ELEMENT EDITING
         self.accept("toggleElementVisibility", self.core.toggle_visibility)
@@ -290,17 +316,43 @@ class SceneEditor(DirectObject):
         self.accept("reregisterKeyboardAndMouseEvents", self.register_keyboard_and_mouse_events)
         self.register_keyboard_and_mouse_events()
 
+    def register_ui_refreshes(self):
+        # these are batched and run at most once per frame
+        self.refresh_scheduler.register(
+            "update_structure",
+            self.update_structure_panel,
+            supersedes=["update_structure_selection", "update_structure_rows"])
+        self.refresh_scheduler.register(
+            "update_structure_selection",
+            self.update_structure_panel_selection)
+        self.refresh_scheduler.register(
+            "update_structure_rows",
+            self.update_structure_panel_rows,
+            merge_func=lambda pending, new: [pending[0] + new[0]])
+        self.refresh_scheduler.register(
+            "collapse_structure",
+            self.collapse_structure)
+        self.refresh_scheduler.register(
+            "update_properties",
+            self.update_properties_panel)
+
+    def ignore_ui_refreshes(self):
+        # queued refreshes and the statistics are kept for the next enable
+        self.refresh_scheduler.pause()
+
     def register_keyboard_and_mouse_events(self):
         self.register_mouse_events()
         self.register_keyboard_events()
 
     def register_mouse_events(self):
+        if self.project_loading: return
         if self.mouse_events_disabled:
             for event, action_set in self.mouseEvents.items():
                 self.__register_events(event, action_set)
             self.mouse_events_disabled = False
 
     def register_keyboard_events(self):
+        if self.project_loading: return
         if self.keyboard_events_disabled:
             for event, action_set in self.keyboard_events.items():
                 self.__register_events(event, action_set)
@@ -328,23 +380,50 @@ class SceneEditor(DirectObject):
                 self.ignore(event)
             self.keyboard_events_disabled = True
 
+    def set_project_loading(self, loading):
+        """Blocks editing while a project is being loaded, only the camera
+        can be moved. Changes made in the meantime would otherwise mix with
+        the loading of the project."""
+        if loading:
+            self.ignore_keyboard_and_mouse_events()
+            for event in CAMERA_MOUSE_EVENTS:
+                self.__register_events(event, self.mouseEvents[event])
+            self.project_loading = True
+        else:
+            self.project_loading = False
+            for event in CAMERA_MOUSE_EVENTS:
+                self.ignore(event)
+            self.register_keyboard_and_mouse_events()
+
     def inteligentEscape(self):
+        # loading a project is only canceled if escape isn't needed to stop
+        # anything else
+        consumed = False
         dlg_list = [self.dlg_quit, self.dlg_new_project]
         if not all(dlg is None for dlg in dlg_list):
             self.opened_dialog_close_functions[-1](None)
+            consumed = True
 
         if self.camcontroller.startCameraMovement:
             self.camcontroller.setMoveCamera(False)
+            consumed = True
 
-        if self.keyboard_events_disabled:
+        if self.keyboard_events_disabled and not self.project_loading:
             self.register_keyboard_and_mouse_events()
+            consumed = True
 
         if self.move_object:
-            self.stop_move_objects()
+            self.stop_moving(True)
+            consumed = True
         if self.rotate_object:
-            self.stop_rotate_objects()
+            self.stop_rotating(True)
+            consumed = True
         if self.scale_object:
-            self.stop_scale_objects()
+            self.stop_scaling(True)
+            consumed = True
+
+        if not consumed:
+            base.messenger.send("cancel_project_loading")
 
     def is_dirty(self):
         return self.core.dirty
@@ -462,6 +541,7 @@ class SceneEditor(DirectObject):
         self.scale_object = False
 
     def load_model_browser(self):
+        from DirectFolderBrowser.DirectFolderBrowser import DirectFolderBrowser
         self.browser = DirectFolderBrowser(
             self.load_model_browser_action,
             True,
@@ -480,6 +560,13 @@ class SceneEditor(DirectObject):
             self.core.scene_objects,
             self.core.selected_objects)
 
+    def update_structure_panel_selection(self):
+        self.mainView.structurePanel.refreshSelection(
+            self.core.selected_objects)
+
+    def update_structure_panel_rows(self, objs):
+        self.mainView.structurePanel.refreshRows(objs)
+
     def collapse_structure(self):
         self.mainView.structurePanel.collapse_all()
 
@@ -490,6 +577,7 @@ class SceneEditor(DirectObject):
 
     def disable_events(self):
         self.ignore_all()
+        self.ignore_ui_refreshes()
 
     def new(self):
         if self.core.dirty:
@@ -520,6 +608,8 @@ class SceneEditor(DirectObject):
 
     def __newProject(self, selection):
         if selection == 1:
+            # stop a project that is still being loaded
+            base.messenger.send("cancel_project_loading")
             self.core.new_project()
             base.messenger.send("clearDirtyFlag")
         if self.dlg_new_project is not None:
@@ -533,16 +623,22 @@ class SceneEditor(DirectObject):
         fn = os.path.splitext(os.path.basename(path))[0]
         if fn != "":
             self.lastFileNameWOExtension = os.path.splitext(os.path.basename(path))[0]
+        ext = os.path.splitext(path)[1].lower()
+        if ext in [".scene", BINARY_PROJECT_EXTENSION]:
+            self.lastProjectExtension = ext
 
     def save(self):
+        from SceneEditor.export.ExportProject import ExporterProject
         ExporterProject(
             self.lastDirPath,
-            self.lastFileNameWOExtension + ".scene",
+            self.lastFileNameWOExtension + self.lastProjectExtension,
             self.core.scene_model_parent,
             self.core.scene_objects,
-            tooltip=self.tt)
+            tooltip=self.tt,
+            journal=self.core.project_journal)
 
     def export_python(self):
+        from SceneEditor.export.ExportPy import ExporterPy
         ExporterPy(
             self.lastDirPath,
             self.lastFileNameWOExtension + ".py",
@@ -551,6 +647,10 @@ class SceneEditor(DirectObject):
             self.tt)
 
     def export_bam(self):
+        if self.core.has_pending_model_loads():
+            base.messenger.send("showWarning", ["Models are still loading, please wait until they are done."])
+            return
+        from SceneEditor.export.ExportBam import ExporterBam
         ExporterBam(
             self.lastDirPath,
             self.lastFileNameWOExtension + ".bam",
@@ -559,43 +659,24 @@ class SceneEditor(DirectObject):
             self.tt)
 
     def add_custom_exporters(self):
-        # get the custom exporter modules path
-        custom_export_path = ConfigVariableString(
-            "scene-editor-custom-export-path",
-            os.path.join(".","SceneEditor", "custom_export")).getValue()
-
-        # check if the path is good
-        if not os.path.exists(custom_export_path):
-            return
-
-        # walk through the folders
-        for root, dirs, files in os.walk(custom_export_path):
-            for mod_dir in dirs:
-                # ignore these
-                if mod_dir in ["__pycache__"]:
-                    continue
-
-                filepath = os.path.join(root, mod_dir, 'exporter.py')
-
-                # check if the required python file exists
-                if not os.path.exists(filepath):
-                    continue
-
-                # imports the module from the given path
-                logging.debug(f"importing custom exporter {filepath}")
-                exporter = SourceFileLoader("exporter", filepath).load_module()
-
-                # get exporter meta
-                exporter_name = exporter.get_name()
-                exporter_id = exporter.get_name()
+        # the exporters are only listed here and imported on first use
+        self.custom_exporters = {}
+        for entry in read_manifest():
+            self.custom_exporters[entry["name"]] = entry
+            self.mainView.menuBar.add_export_entry(entry["name"], entry["name"])
 
-                # add the exporter
-                self.custom_exporters[exporter_id] = exporter
-                self.mainView.menuBar.add_export_entry(exporter_name, exporter_id)
+    def get_custom_exporter(self, exporter):
+        entry = self.custom_exporters[exporter]
+        if "module" not in entry:
+            entry["module"] = import_custom_exporter(entry["file"])
+        return entry["module"]
 
     def custom_export(self, exporter):
         logging.debug(f"Export with {exporter}")
-        self.custom_exporters[exporter].Exporter(
+        if self.core.has_pending_model_loads():
+            base.messenger.send("showWarning", ["Models are still loading, please wait until they are done."])
+            return
+        self.get_custom_exporter(exporter).Exporter(
             self.lastDirPath,
             self.lastFileNameWOExtension + ".bam",
             self.core.scene_model_parent,
@@ -603,15 +684,17 @@ class SceneEditor(DirectObject):
             self.tt)
 
     def load(self):
+        from SceneEditor.loader.LoadProject import ProjectLoader
         ProjectLoader(
             self.lastDirPath,
-            self.lastFileNameWOExtension + ".scene",
+            self.lastFileNameWOExtension + self.lastProjectExtension,
             self.core,
             False,
             self.tt,
             self.new)
 
     def load_file(self, filename):
+        from SceneEditor.loader.LoadProject import ProjectLoader
         (path, projectname) = os.path.split(filename)
         ProjectLoader(
             path,
@@ -621,6 +704,7 @@ class SceneEditor(DirectObject):
             directLoading=True)
 
     def do_exception_save(self):
+        from SceneEditor.export.ExportProject import ExporterProject
         ExporterProject(
             self.lastDirPath,
             self.lastFileNameWOExtension + ".scene",
@@ -636,6 +720,11 @@ class SceneEditor(DirectObject):
 
     def __quit(self, selection):
         if selection == 1:
+            self.refresh_scheduler.log_stats()
+            self.core.log_kill_ring_stats()
+            self.autosave.stop()
+            # changes that haven't been saved are not wanted anymore
+            self.core.project_journal.discard()
             self.userExit()
         else:
             self.dlg_quit.destroy()
@@ -7,10 +7,16 @@ from SceneEditor.directtoolsOverrides.DirectGrid import DirectGrid
 from SceneEditor.core.TransformationHandler import TransformationHandler
 from SceneEditor.core.SelectionHandler import SelectionHandler
 from SceneEditor.core.CoreKillRingHandler import CoreKillRingHandler
-
-from panda3d.physics import ActorNode
+from SceneEditor.core.SceneObjectRegistry import SceneObjectRegistry
+from SceneEditor.core.NameAllocator import NameAllocator
+from SceneEditor.core.ModelCache import ModelCache
+from SceneEditor.tools.ProjectJournal import ProjectJournal
 
 from panda3d.core import (
+    ConfigVariableBool,
+    ConfigVariableInt,
+    Filename,
+    ModelRoot,
     Plane,
     Vec3,
     Vec4,
@@ -53,7 +59,10 @@ class Core(TransformationHandler, SelectionHandler, CoreKillRingHandler):
 
         CoreKillRingHandler.__init__(self)
 
-        self.scene_objects = []
+        # all objects of the scene with lookups by id, name and type
+        self.scene_objects = SceneObjectRegistry()
+        # unique names for lights, cameras, collision solids and the like
+        self.name_allocator = NameAllocator(self.scene_objects)
 
         self.selected_objects = []
 
@@ -71,22 +80,49 @@ class Core(TransformationHandler, SelectionHandler, CoreKillRingHandler):
         self.scene_root = render.attach_new_node("scene_root")
         self.scene_model_parent = self.scene_root.attach_new_node("scene_model_parent")
 
-        self.load_corner_axis_display()
+        # the corner axis can only be displayed if there is a window
+        self.axis = None
+        if base.win is not None:
+            self.load_corner_axis_display()
 
         self.show_collisions = False
 
+        # every model file is loaded once and cloned into the scene
+        self.model_cache = ModelCache(
+            ConfigVariableInt("scene-editor-model-cache-size-mb", 512).getValue() * 1024 * 1024,
+            ConfigVariableBool("scene-editor-model-cache-instancing", True).getValue())
+
+        # models which are loaded in the background. Maps the placeholder
+        # NodePath to the path of the model it waits for
+        self.pending_model_loads = {}
+        # path -> (loader request, list of placeholders waiting for it)
+        self.model_load_requests = {}
+        self.model_loads_total = 0
+        self.model_loads_done = 0
+        # without geometry, models are only represented by their placeholder,
+        # which is enough to edit and save the scene data
+        self.load_model_geometry = ConfigVariableBool(
+            "scene-editor-load-model-geometry", True).getValue()
+        self.load_placeholder_model = loader.loadModel("models/misc/xyzAxis")
+        self.load_placeholder_model.set_color_scale(1, 1, 1, 0.5)
+
+        # records the changes since the project has last been saved
+        self.project_journal = ProjectJournal(self.scene_objects, self.scene_model_parent)
+
         TransformationHandler.__init__(self)
         SelectionHandler.__init__(self)
 
     def disable(self):
         self.scene_root.hide()
         self.grid.hide()
-        self.axis.hide()
+        if self.axis is not None:
+            self.axis.hide()
 
     def enable(self):
         self.scene_root.show()
         self.grid.show()
-        self.axis.show()
+        if self.axis is not None:
+            self.axis.show()
 
     #
     # PROJECT HANDLING
@@ -96,13 +132,22 @@ class Core(TransformationHandler, SelectionHandler, CoreKillRingHandler):
         self.limiting_y = False
         self.limiting_z = False
 
+        self.cancel_model_loads()
+
         for obj in self.scene_objects[:]:
             self.deselect(obj)
             obj.remove_node()
 
         self.scene_model_parent.clearLight()
 
-        self.scene_objects = []
+        # unsaved changes are dropped together with the scene
+        self.project_journal.discard()
+        self.project_journal.unbind()
+
+        self.scene_objects.clear()
+        self.name_allocator.reset()
+        # the history refers to the removed objects
+        self.clearKillRing()
         self.limit_line.reset()
         self.limit_line_np.stash()
         base.messenger.send("update_structure")
@@ -147,8 +192,24 @@ class Core(TransformationHandler, SelectionHandler, CoreKillRingHandler):
     #
     # SCENE GRAPH HANDLING
     #
-    def load_model(self, path):
-        model = loader.loadModel(path)
+    def load_model(self, path, asynchronous=None):
+        """Loads the model at the given path into the scene.
+        Models are taken from the model cache if possible. Otherwise, if
+        asynchronous is enabled, a placeholder will be returned right away
+        which will get the models geometry once it finished loading in the
+        background. Defaults to the scene-editor-async-model-loading config
+        variable."""
+        if asynchronous is None:
+            asynchronous = ConfigVariableBool(
+                "scene-editor-async-model-loading", True).getValue()
+
+        cached_model = self.model_cache.get(path)
+        if cached_model is None and not asynchronous and self.load_model_geometry:
+            cached_model = loader.loadModel(path)
+            self.model_cache.add(path, cached_model)
+
+        model = self.create_model_placeholder(
+            path, cached_model is None and self.load_model_geometry)
         model.set_tag("filepath", str(path))
         model.set_tag("object_type", "model")
         model.set_tag("scene_object_id", str(uuid4()))
@@ -160,10 +221,125 @@ class Core(TransformationHandler, SelectionHandler, CoreKillRingHandler):
 
         self.set_edited_tag(model, "filepath")
 
+        if cached_model is not None:
+            self.swap_in_model(model, cached_model)
+        elif self.load_model_geometry:
+            self.request_model_load(model, path)
+
         base.messenger.send("update_structure")
         base.messenger.send("collapse_structure")
         return model
 
+    #
+    # ASYNCHRONOUS MODEL LOADING
+    #
+    def create_model_placeholder(self, path, show_indicator=True):
+        """Creates an empty model root which will stand in for the model at
+        the given path until it has been loaded"""
+        placeholder = NodePath(ModelRoot(Filename(path).get_basename()))
+        if show_indicator:
+            placeholder.set_tag("model_loading", "1")
+            indicator = self.load_placeholder_model.instance_to(placeholder)
+            indicator.set_name("model_load_placeholder")
+        return placeholder
+
+    def request_model_load(self, placeholder, path):
+        if len(self.pending_model_loads) == 0:
+            # start a new batch for the progress display
+            self.model_loads_total = 0
+            self.model_loads_done = 0
+
+        key = str(path)
+        self.pending_model_loads[placeholder] = key
+        if key in self.model_load_requests:
+            # the same file is already on its way, wait for that one
+            self.model_load_requests[key][1].append(placeholder)
+        else:
+            request = loader.loadModel(
+                path,
+                callback=self.__model_loaded,
+                extraArgs=[key])
+            self.model_load_requests[key] = (request, [placeholder])
+
+        self.model_loads_total += 1
+        self.__send_model_load_progress()
+
+    def has_pending_model_loads(self):
+        return len(self.pending_model_loads) > 0
+
+    def cancel_model_loads(self):
+        for request, placeholders in self.model_load_requests.values():
+            loader.cancelRequest(request)
+        self.model_load_requests = {}
+        self.pending_model_loads = {}
+        self.model_loads_total = 0
+        self.model_loads_done = 0
+        self.__send_model_load_progress()
+
+    def drop_model_load(self, placeholder):
+        """Stops waiting for the model of the given placeholder"""
+        if placeholder not in self.pending_model_loads:
+            return
+        del self.pending_model_loads[placeholder]
+        self.model_loads_done += 1
+        self.__send_model_load_progress()
+
+    def __model_loaded(self, model, path):
+        if path not in self.model_load_requests:
+            # the load has been canceled, e.g. by creating a new project
+            if model is not None:
+                model.remove_node()
+            return
+        request, placeholders = self.model_load_requests.pop(path)
+
+        if model is None:
+            logging.error(f"Couldn't load model {path}")
+            base.messenger.send("showWarning", [f"Couldn't load model {path}"])
+        else:
+            self.model_cache.add(path, model)
+
+        for placeholder in placeholders:
+            if placeholder not in self.pending_model_loads:
+                continue
+            del self.pending_model_loads[placeholder]
+            self.model_loads_done += 1
+            if model is not None:
+                self.swap_in_model(placeholder, model)
+                base.messenger.send("model_loaded", [placeholder])
+
+        self.__send_model_load_progress()
+        base.messenger.send("update_structure")
+        if len(self.selected_objects):
+            base.messenger.send("update_selection_highlight_marker")
+
+    def swap_in_model(self, placeholder, model):
+        """Clones the loaded models content into the placeholder so all
+        references to the scene object stay valid"""
+        indicator = placeholder.find("model_load_placeholder")
+        if not indicator.is_empty():
+            indicator.remove_node()
+        placeholder.clear_tag("model_loading")
+
+        self.model_cache.instantiate(model, placeholder)
+
+        placeholder.node().set_fullpath(model.node().get_fullpath())
+        placeholder.node().set_timestamp(model.node().get_timestamp())
+        # the saved data of the object doesn't change by loading its model
+        self.picking_engine.mark_dirty(placeholder)
+        self.selection_bounds.mark_dirty(placeholder)
+
+        # use the name the loader gave the model if it hasn't been renamed
+        if placeholder.get_name() == Filename(placeholder.get_tag("filepath")).get_basename():
+            placeholder.set_name(model.get_name())
+            self.scene_objects.update_name(placeholder)
+            self.project_journal.mark_changed(placeholder)
+
+    def __send_model_load_progress(self):
+        base.messenger.send("loading_progress", [
+            self.model_loads_done,
+            self.model_loads_total,
+            "Loading models"])
+
     def add_empty(self):
         model = loader.loadModel("models/misc/xyzAxis")
         model.set_tag("object_type", "empty")
@@ -181,14 +357,14 @@ class Core(TransformationHandler, SelectionHandler, CoreKillRingHandler):
         return model
 
     def add_physics_node(self):
+        # physics are only needed by scenes with physics nodes
+        from panda3d.physics import ActorNode
+        if not base.particleMgrEnabled:
+            base.enableParticles()
         actor_node = ActorNode("ActorNode")
         base.physicsMgr.attach_physical_node(actor_node)
 
-        i = 1
-        physics_node_name = f"PhysicsNode_{i}"
-        while self.scene_model_parent.find(f"**/{physics_node_name}"):
-            i += 1
-            physics_node_name = f"PhysicsNode_{i}"
+        physics_node_name = self.name_allocator.allocate("PhysicsNode")
 
         physics_np = NodePath(physics_node_name)
         physics_np.set_tag("object_type", "physics")
@@ -204,12 +380,7 @@ class Core(TransformationHandler, SelectionHandler, CoreKillRingHandler):
         return physics_np
 
     def get_new_col_solid_name(self, solid_type):
-        i = 1
-        solid_name = f"{solid_type}_{i}"
-        while self.scene_model_parent.find(f"**/{solid_name}"):
-            i += 1
-            solid_name = f"{solid_type}_{i}"
-        return solid_name
+        return self.name_allocator.allocate(solid_type)
 
     def add_collision_solid(self, solid_type, solid_info):
         solid_name = self.get_new_col_solid_name(solid_type)
@@ -342,11 +513,7 @@ class Core(TransformationHandler, SelectionHandler, CoreKillRingHandler):
         light = None
         lens_node = None
 
-        i = 1
-        light_name = f"{light_type}_{i}"
-        while self.scene_model_parent.find(f"**/{light_name}"):
-            i += 1
-            light_name = f"{light_type}_{i}"
+        light_name = self.name_allocator.allocate(light_type)
 
         if light_type == "PointLight":
             light_model_np = loader.loadModel("models/misc/Pointlight")
@@ -411,11 +578,7 @@ class Core(TransformationHandler, SelectionHandler, CoreKillRingHandler):
         else:
             lens = PerspectiveLens()
 
-        i = 1
-        cam_name = f"{cam_type}_camera_{i}"
-        while self.scene_model_parent.find(f"**/{cam_name}"):
-            i += 1
-            cam_name = f"{cam_type}_camera_{i}"
+        cam_name = self.name_allocator.allocate(f"{cam_type}_camera")
         model.set_name(cam_name)
 
         cam = Camera("Camera", lens)
@@ -451,6 +614,8 @@ class Core(TransformationHandler, SelectionHandler, CoreKillRingHandler):
             newSort = max(0, obj.getSort()+direction)
 
             obj.reparentTo(parent, newSort)
+        # the journal doesn't store the order of objects
+        self.project_journal.invalidate()
 
         base.messenger.send("update_structure")
 
@@ -532,6 +697,7 @@ class Core(TransformationHandler, SelectionHandler, CoreKillRingHandler):
                         collisionNode.show()
 
         self.show_collisions = not self.show_collisions
+        self.picking_id_map.invalidate()
         base.messenger.send("update_structure")
 
     #
@@ -546,74 +712,73 @@ class Core(TransformationHandler, SelectionHandler, CoreKillRingHandler):
         self.cut_objects = self.selected_objects[:]
 
     def paste_elements(self):
-        if len(self.cut_objects) > 0:
-            parent = self.scene_model_parent
-            if len(self.selected_objects) > 0:
-                parent = self.selected_objects[-1]
-            self.deselect_all()
-            for obj in self.cut_objects:
-                if obj == parent: continue
-                base.messenger.send("addToKillRing",
-                    [obj, "cut", "element", obj.get_parent(), parent])
-                obj.reparent_to(parent)
-                self.select(obj, True)
-            self.cut_objects = []
-        elif len(self.copied_objects) > 0:
-            parent = self.scene_model_parent
-            if len(self.selected_objects) > 0:
-                parent = self.selected_objects[-1]
-
-            self.deselect_all()
-
-            for obj in self.copied_objects:
-                new_obj = obj.copy_to(parent)
-                new_obj.set_tag("scene_object_id", str(uuid4()))
-                if obj.has_tag("edited_properties"):
-                    new_obj.set_tag(
-                        "edited_properties",
-                        obj.get_tag("edited_properties"))
-                if obj.get_tag("object_type") == "collision":
-                    solid_type = obj.get_tag("collision_solid_type")
-                    src_solid = obj.node().get_solid(0)
-                    dst_solid = new_obj.node().modify_solid(0)
-                    new_solid_name = self.get_new_col_solid_name(solid_type)
-                    new_obj.set_name(new_solid_name)
-                    if solid_type == "CollisionSphere":
-                        dst_solid.set_center(src_solid.center)
-                        dst_solid.radius = src_solid.radius
-                    elif solid_type == "CollisionBox":
-                        dst_solid.set_center(src_solid.center)
-                        # TODO: isn't there any way to copy the dimension of a box
-                        #dst_solid.min = src_solid.min
-                        #dst_solid.max = src_solid.max
-                    elif solid_type == "CollisionPlane":
-                        dst_solid.plane = src_solid.plane
-                    elif solid_type == "CollisionCapsule":
-                        dst_solid.point_a = src_solid.point_a
-                        dst_solid.point_b = src_solid.point_b
-                        dst_solid.radius = src_solid.radius
-                    elif solid_type == "CollisionLine":
-                        dst_solid.origin = src_solid.origin
-                        dst_solid.direction = src_solid.direction
-                    elif solid_type == "CollisionSegment":
-                        dst_solid.point_a = src_solid.point_a
-                        dst_solid.point_b = src_solid.point_b
-                    elif solid_type == "CollisionRay":
-                        dst_solid.origin = src_solid.origin
-                        dst_solid.direction = src_solid.direction
-                    elif solid_type == "CollisionInvSphere":
-                        dst_solid.set_center(src_solid.center)
-                        dst_solid.radius = src_solid.radius
-                elif obj.get_tag("object_type") == "light":
-                    light_np = light_model_np.attachNewNode(light)
-                    new_obj.set_tag("object_type", "light")
-                    new_obj.set_tag("light_type", light_type)
-                    self.scene_model_parent.setLight(new_obj.children[0])
-                self.scene_objects.append(new_obj)
-                self.select(new_obj, True)
-
-                base.messenger.send("addToKillRing",
-                    [new_obj, "copy", "element", None, None])
+        with self.transaction("paste"):
+            if len(self.cut_objects) > 0:
+                parent = self.scene_model_parent
+                if len(self.selected_objects) > 0:
+                    parent = self.selected_objects[-1]
+                self.deselect_all()
+                for obj in self.cut_objects:
+                    if obj == parent: continue
+                    base.messenger.send("addToKillRing",
+                        [obj, "cut", "element", obj.get_parent(), parent])
+                    obj.reparent_to(parent)
+                    self.select(obj, True)
+                self.cut_objects = []
+            elif len(self.copied_objects) > 0:
+                parent = self.scene_model_parent
+                if len(self.selected_objects) > 0:
+                    parent = self.selected_objects[-1]
+
+                self.deselect_all()
+
+                for obj in self.copied_objects:
+                    new_obj = obj.copy_to(parent)
+                    new_obj.set_tag("scene_object_id", str(uuid4()))
+                    if obj.has_tag("edited_properties"):
+                        new_obj.set_tag(
+                            "edited_properties",
+                            obj.get_tag("edited_properties"))
+                    if obj.get_tag("object_type") == "collision":
+                        solid_type = obj.get_tag("collision_solid_type")
+                        src_solid = obj.node().get_solid(0)
+                        dst_solid = new_obj.node().modify_solid(0)
+                        new_solid_name = self.get_new_col_solid_name(solid_type)
+                        new_obj.set_name(new_solid_name)
+                        if solid_type == "CollisionSphere":
+                            dst_solid.set_center(src_solid.center)
+                            dst_solid.radius = src_solid.radius
+                        elif solid_type == "CollisionBox":
+                            dst_solid.set_center(src_solid.center)
+                            # TODO: isn't there any way to copy the dimension of a box
+                            #dst_solid.min = src_solid.min
+                            #dst_solid.max = src_solid.max
+                        elif solid_type == "CollisionPlane":
+                            dst_solid.plane = src_solid.plane
+                        elif solid_type == "CollisionCapsule":
+                            dst_solid.point_a = src_solid.point_a
+                            dst_solid.point_b = src_solid.point_b
+                            dst_solid.radius = src_solid.radius
+                        elif solid_type == "CollisionLine":
+                            dst_solid.origin = src_solid.origin
+                            dst_solid.direction = src_solid.direction
+                        elif solid_type == "CollisionSegment":
+                            dst_solid.point_a = src_solid.point_a
+                            dst_solid.point_b = src_solid.point_b
+                        elif solid_type == "CollisionRay":
+                            dst_solid.origin = src_solid.origin
+                            dst_solid.direction = src_solid.direction
+                        elif solid_type == "CollisionInvSphere":
+                            dst_solid.set_center(src_solid.center)
+                            dst_solid.radius = src_solid.radius
+                    elif obj.get_tag("object_type") == "light":
+                        # the light node and its tags have been copied already
+                        self.scene_model_parent.set_light(new_obj.find("+Light"))
+                    self.scene_objects.append(new_obj)
+                    self.select(new_obj, True)
+
+                    base.messenger.send("addToKillRing",
+                        [new_obj, "copy", "element", None, None])
 
         base.messenger.send("update_structure")
         base.messenger.send("start_moving")
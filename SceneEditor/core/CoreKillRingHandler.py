@@ -1,9 +1,24 @@
 import logging
-from SceneEditor.core.KillRing import KillRing
+from contextlib import contextmanager
+
+from SceneEditor.core.KillRing import KillRing, KillRingEntry
+
+from panda3d.core import ConfigVariableInt
 
 class CoreKillRingHandler:
     def __init__(self):
-        self.killRing = KillRing()
+        # the undo history is bounded, the oldest entries will be dropped
+        # once either of these limits is exceeded. 0 disables a limit
+        self.killRing = KillRing(
+            ConfigVariableInt("scene-editor-undo-max-entries", 1000).getValue(),
+            ConfigVariableInt("scene-editor-undo-max-mb", 256).getValue() * 1024 * 1024,
+            self.__estimate_kill_ring_entry_size,
+            self.__release_kill_ring_entry)
+
+        # entries collected by the currently open transaction
+        self.transaction_entries = None
+        self.transaction_depth = 0
+        self.transaction_name = ""
 
     #
     # KILL RING HANDLING
@@ -12,51 +27,101 @@ class CoreKillRingHandler:
         if action == "set" and oldValue == newValue:
             logging.debug(f"action={action}, type={objectType} was not added to killring, reason: old={oldValue} equals new={newValue}")
             return
+        if action == "set" and objectType == "name":
+            # keep the name lookup of the scene objects in sync
+            # the new name is applied after the kill ring entry was added
+            self.scene_objects.update_name(obj, newValue)
         logging.debug(f"Add to killring action={action}, type={objectType}, old={oldValue}, new={newValue}")
+        if obj is not None:
+            self.mark_object_dirty(obj)
+        if self.transaction_entries is not None:
+            self.transaction_entries.append(
+                KillRingEntry(obj, action, objectType, oldValue, newValue))
+            return
         self.killRing.push(obj, action, objectType, oldValue, newValue)
 
-    def undo(self):
-        # undo this action
-        workOn = self.killRing.pop()
+    #
+    # TRANSACTIONS
+    #
+    def begin_transaction(self, name=""):
+        """Collects all following kill ring entries until the transaction is
+        committed. They will be undone and redone as one step. Transactions
+        can be nested, only the outermost one adds an entry to the kill ring"""
+        self.transaction_depth += 1
+        if self.transaction_depth > 1:
+            return
+        self.transaction_name = name
+        self.transaction_entries = []
 
-        if workOn is None:
+    def commit_transaction(self):
+        if self.transaction_depth == 0:
+            logging.warning("commit_transaction called without an open transaction")
+            return
+        self.transaction_depth -= 1
+        if self.transaction_depth > 0:
             return
 
-        if workOn.action == "set":
-            if workOn.objectType == "pos":
-                logging.debug(f"undo Position to {workOn.oldValue}")
-                workOn.editObject.set_pos(workOn.oldValue)
-            elif workOn.objectType == "hpr":
-                logging.debug(f"undo Rotation to {workOn.oldValue}")
-                workOn.editObject.set_hpr(workOn.oldValue)
-            elif workOn.objectType == "scale":
-                logging.debug(f"undo Scale to {workOn.oldValue}")
-                workOn.editObject.set_scale(workOn.oldValue)
-        elif workOn.action == "add":
-            logging.debug(f"undo remove added element {workOn.editObject}")
-            self.remove([workOn.editObject], False)
-
-        elif workOn.action == "kill" and workOn.objectType == "element":
-            logging.debug(f"undo last kill {workOn.editObject}")
-            workOn.editObject.unstash()
-            if workOn.editObject.get_tag("object_type") == "light":
-                self.scene_model_parent.set_light(workOn.editObject.find("+Light"))
-            base.messenger.send("update_structure")
+        entries = self.transaction_entries
+        self.transaction_entries = None
+        self.push_entries(entries, self.transaction_name)
 
-        elif workOn.action == "copy":
-            logging.debug(f"undo last copy {workOn.objectType}")
-            if workOn.objectType == "element":
-                self.remove([workOn.editObject], False)
+    def detach_transaction(self):
+        """Closes the transaction like commit_transaction but returns the
+        collected entries instead of adding them to the kill ring. They can
+        be added later on with push_entries, e.g. once a change that spans
+        several frames is done."""
+        if self.transaction_depth == 0:
+            logging.warning("detach_transaction called without an open transaction")
+            return []
+        self.transaction_depth -= 1
+        if self.transaction_depth > 0:
+            return []
 
-        elif workOn.action == "cut":
-            logging.debug(f"undo last cut {workOn.objectType}")
-            if workOn.objectType == "element":
-                workOn.editObject.reparent_to(workOn.oldValue)
+        entries = self.transaction_entries
+        self.transaction_entries = None
+        return entries
 
-        if len(self.selected_objects):
-            base.messenger.send("update_selection_highlight_marker")
+    def push_entries(self, entries, name=""):
+        """Adds the entries to the kill ring as one step"""
+        if len(entries) == 1:
+            entry = entries[0]
+            self.killRing.push(
+                entry.editObject, entry.action, entry.objectType,
+                entry.oldValue, entry.newValue)
+        elif len(entries) > 1:
+            logging.debug(f"Add transaction {name} with {len(entries)} entries to killring")
+            self.killRing.pushGroup(entries, name)
 
-        base.messenger.send("setDirtyFlag")
+    def cancel_transaction(self):
+        """Reverts everything that has been recorded in the outermost open
+        transaction and drops it"""
+        if self.transaction_depth == 0:
+            return
+        entries = self.transaction_entries
+        self.transaction_depth = 0
+        self.transaction_entries = None
+        self.__revert_entries(entries)
+
+    @contextmanager
+    def transaction(self, name=""):
+        """Context manager around begin_transaction and commit_transaction"""
+        self.begin_transaction(name)
+        try:
+            yield
+        finally:
+            self.commit_transaction()
+
+    #
+    # UNDO AND REDO
+    #
+    def undo(self):
+        # undo this action
+        workOn = self.killRing.pop()
+
+        if workOn is None:
+            return
+
+        self.__revert_entries(workOn.getEntries())
 
     def redo(self):
         # redo this
@@ -66,50 +131,159 @@ class CoreKillRingHandler:
             logging.debug("nothing to redo")
             return
 
-        if workOn.action == "set":
-            if workOn.objectType == "pos":
-                if type(workOn.newValue) is list:
-                    workOn.editObject.set_pos(*workOn.newValue)
-                else:
-                    workOn.editObject.set_pos(workOn.newValue)
-            elif workOn.objectType == "hpr":
-                if type(workOn.newValue) is list:
-                    workOn.editObject.set_hpr(*workOn.newValue)
-                else:
-                    workOn.editObject.set_hpr(workOn.newValue)
-            elif workOn.objectType == "scale":
-                if type(workOn.newValue) is list:
-                    workOn.editObject.set_scale(*workOn.newValue)
-                else:
-                    workOn.editObject.set_scale(workOn.newValue)
-
-        elif workOn.action == "add":
-            workOn.editObject.unstash()
-            base.messenger.send("update_structure")
-            if workOn.editObject.get_tag("object_type") == "light":
-                self.scene_model_parent.set_light(workOn.editObject.find("+Light"))
+        self.__apply_entries(workOn.getEntries())
 
-        elif workOn.action == "kill" and workOn.objectType == "element":
-            self.remove([workOn.editObject], False)
-            base.messenger.send("update_structure")
+    def __revert_entries(self, entries):
+        """Reverts the given entries in reverse order and notifies the UI
+        once afterwards"""
+        # objects which will be removed together
+        remove_objects = []
+        structure_changed = False
+
+        for workOn in reversed(entries):
+            self.mark_object_dirty(workOn.editObject)
+            if workOn.action == "set":
+                if workOn.objectType == "pos":
+                    logging.debug(f"undo Position to {workOn.oldValue}")
+                    workOn.editObject.set_pos(workOn.oldValue)
+                elif workOn.objectType == "hpr":
+                    logging.debug(f"undo Rotation to {workOn.oldValue}")
+                    workOn.editObject.set_hpr(workOn.oldValue)
+                elif workOn.objectType == "scale":
+                    logging.debug(f"undo Scale to {workOn.oldValue}")
+                    workOn.editObject.set_scale(workOn.oldValue)
+            elif workOn.action == "add":
+                logging.debug(f"undo remove added element {workOn.editObject}")
+                remove_objects.append(workOn.editObject)
+
+            elif workOn.action == "kill" and workOn.objectType == "element":
+                logging.debug(f"undo last kill {workOn.editObject}")
+                workOn.editObject.unstash()
+                if workOn.editObject.get_tag("object_type") == "light":
+                    self.scene_model_parent.set_light(workOn.editObject.find("+Light"))
+                structure_changed = True
 
-        elif workOn.action == "copy":
-            if workOn.objectType == "element":
+            elif workOn.action == "copy":
+                logging.debug(f"undo last copy {workOn.objectType}")
+                if workOn.objectType == "element":
+                    remove_objects.append(workOn.editObject)
+
+            elif workOn.action == "cut":
+                logging.debug(f"undo last cut {workOn.objectType}")
+                if workOn.objectType == "element":
+                    workOn.editObject.reparent_to(workOn.oldValue)
+                    structure_changed = True
+
+        self.__finish_kill_ring_step(remove_objects, structure_changed)
+
+    def __apply_entries(self, entries):
+        """Applies the given entries in order and notifies the UI once
+        afterwards"""
+        remove_objects = []
+        structure_changed = False
+
+        for workOn in entries:
+            self.mark_object_dirty(workOn.editObject)
+            if workOn.action == "set":
+                if workOn.objectType == "pos":
+                    if type(workOn.newValue) is list:
+                        workOn.editObject.set_pos(*workOn.newValue)
+                    else:
+                        workOn.editObject.set_pos(workOn.newValue)
+                elif workOn.objectType == "hpr":
+                    if type(workOn.newValue) is list:
+                        workOn.editObject.set_hpr(*workOn.newValue)
+                    else:
+                        workOn.editObject.set_hpr(workOn.newValue)
+                elif workOn.objectType == "scale":
+                    if type(workOn.newValue) is list:
+                        workOn.editObject.set_scale(*workOn.newValue)
+                    else:
+                        workOn.editObject.set_scale(workOn.newValue)
+
+            elif workOn.action == "add":
                 workOn.editObject.unstash()
-                base.messenger.send("update_structure")
+                structure_changed = True
                 if workOn.editObject.get_tag("object_type") == "light":
                     self.scene_model_parent.set_light(workOn.editObject.find("+Light"))
 
-        elif workOn.action == "cut":
-            logging.debug(f"undo last cut {workOn.objectType}")
-            if workOn.objectType == "element":
-                workOn.editObject.reparent_to(workOn.newValue)
+            elif workOn.action == "kill" and workOn.objectType == "element":
+                remove_objects.append(workOn.editObject)
+
+            elif workOn.action == "copy":
+                if workOn.objectType == "element":
+                    workOn.editObject.unstash()
+                    structure_changed = True
+                    if workOn.editObject.get_tag("object_type") == "light":
+                        self.scene_model_parent.set_light(workOn.editObject.find("+Light"))
+
+            elif workOn.action == "cut":
+                logging.debug(f"redo last cut {workOn.objectType}")
+                if workOn.objectType == "element":
+                    workOn.editObject.reparent_to(workOn.newValue)
+                    structure_changed = True
+
+        self.__finish_kill_ring_step(remove_objects, structure_changed)
+
+    def __finish_kill_ring_step(self, remove_objects, structure_changed):
+        if len(remove_objects) > 0:
+            # removing sends the structure update already
+            self.remove(remove_objects, False)
+        elif structure_changed:
+            base.messenger.send("update_structure")
 
         if len(self.selected_objects):
             base.messenger.send("update_selection_highlight_marker")
 
         base.messenger.send("setDirtyFlag")
 
+    def clearKillRing(self):
+        self.killRing.clear()
+
+    def get_kill_ring_stats(self):
+        return self.killRing.getStats()
+
+    def log_kill_ring_stats(self):
+        stats = self.get_kill_ring_stats()
+        logging.debug(
+            f"kill ring: entries={stats['entries']}/{stats['max_entries']}, "
+            f"bytes={stats['bytes']}/{stats['max_bytes']}, "
+            f"pruned={stats['pruned']}")
+
+    def __estimate_kill_ring_entry_size(self, entry):
+        size = KillRingEntry.BASE_SIZE
+        keeps_object = entry.action == "add" \
+            or (entry.action in ["kill", "copy"] and entry.objectType == "element")
+        if keeps_object and not entry.editObject.is_empty():
+            # these entries keep the objects geometry alive while the
+            # object is stashed
+            size += self.model_cache.estimate_size(entry.editObject)
+        return size
+
+    def __release_kill_ring_entry(self, entry, applied):
+        """Frees the object of a dropped kill ring entry if it is stashed and
+        no other entry can bring it back to the scene anymore"""
+        obj = entry.editObject
+        if obj is None or obj.is_empty() or not obj.is_stashed():
+            return
+        if self.killRing.getReferenceCount(obj) > 0:
+            return
+        if obj in self.copied_objects or obj in self.cut_objects:
+            return
+
+        scene_objects = [obj] + list(obj.find_all_matches("**/=scene_object_id;+s"))
+        for scene_object in scene_objects[1:]:
+            if self.killRing.getReferenceCount(scene_object) > 0:
+                # a sub object may still be needed by another entry
+                return
+
+        logging.debug(f"release {obj} from the kill ring, applied={applied}")
+        for scene_object in scene_objects:
+            if scene_object in self.scene_objects:
+                self.scene_objects.remove(scene_object)
+            self.drop_model_load(scene_object)
+        obj.remove_node()
+
     def cycleKillRing(self):
         """Cycles through the redo branches at the current depth of the kill ring"""
         self.undo()
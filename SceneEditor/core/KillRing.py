@@ -1,6 +1,9 @@
 
 class KillRingEntry():
-    def __init__(self, editObject=None, action="", objectType="", oldValue=None, newValue=None):
+    # rough memory overhead of an entry without any geometry
+    BASE_SIZE = 256
+
+    def __init__(self, editObject=None, action="", objectType="", oldValue=None, newValue=None, subEntries=None):
         self.activeChild = None
         self.children = []
         self.parent = None
@@ -11,6 +14,22 @@ class KillRingEntry():
         self.oldValue = oldValue
         self.newValue = newValue
 
+        # entries of a grouped action which are undone and redone together
+        self.subEntries = subEntries
+
+        # estimated memory this entry keeps alive
+        self.size = self.BASE_SIZE
+
+    def isGroup(self):
+        return self.subEntries is not None
+
+    def getEntries(self):
+        """Returns the single actions of this entry in the order they have
+        been applied"""
+        if self.subEntries is not None:
+            return self.subEntries
+        return [self]
+
     def addChild(self, child):
         self.children.append(child)
         self.activeChild = child
@@ -24,15 +43,60 @@ class KillRingEntry():
         self.activeChild = self.children[-1]
 
 class KillRing():
-    def __init__(self):
+    """Undo/redo history stored as a tree of entries.
+
+    The history is bounded by a number of entries and an estimated amount of
+    memory. Once one of them is exceeded, abandoned redo branches are pruned
+    first, then the oldest entries of the history and last the far end of
+    the redo chain. Every pruned entry is handed to the release callback
+    together with the info whether its action is currently applied."""
+
+    def __init__(self, maxEntries=0, maxBytes=0, sizeEstimator=None, releaseCallback=None):
         self.currentRoot = KillRingEntry()
         self.currentRoot.setParent(self.currentRoot)
+        self.sentinel = self.currentRoot
+
+        # zero disables the respective limit
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+
+        # function returning the estimated size of an entry in bytes
+        self.sizeEstimator = sizeEstimator
+        # function called with a pruned entry and whether it is applied
+        self.releaseCallback = releaseCallback
+
+        self.numEntries = 0
+        self.totalBytes = 0
+
+        # edit object -> number of entries referencing it
+        self.references = {}
+
+        self.numPruned = 0
 
     def push(self, editObject, action, objectType, oldValue, newValue):
         newKill = KillRingEntry(editObject, action, objectType, oldValue, newValue)
+        if self.sizeEstimator is not None:
+            newKill.size = self.sizeEstimator(newKill)
         self.currentRoot.addChild(newKill)
         newKill.setParent(self.currentRoot)
-        self.currentRoot = newKill
+        self.__append(newKill)
+
+    def pushGroup(self, entries, objectType=""):
+        """Adds a list of KillRingEntries as one entry which is undone and
+        redone at once"""
+        group = KillRingEntry(action="group", objectType=objectType, subEntries=entries)
+        if self.sizeEstimator is not None:
+            for entry in entries:
+                entry.size = self.sizeEstimator(entry)
+        group.size = sum(entry.size for entry in entries)
+        self.currentRoot.addChild(group)
+        group.setParent(self.currentRoot)
+        self.__append(group)
+
+    def __append(self, entry):
+        self.currentRoot = entry
+        self.__track(entry)
+        self.compact()
 
     def pop(self):
         # revert last push
@@ -50,3 +114,143 @@ class KillRing():
     def cycleChildren(self):
         # change the active child to the next one in the active kill ring entry
         self.currentRoot.cycleChildren()
+
+    def clear(self):
+        """Drops the whole history, releasing all entries"""
+        self.__releaseSubtree(self.sentinel, self.__getAppliedEntries())
+        self.currentRoot = KillRingEntry()
+        self.currentRoot.setParent(self.currentRoot)
+        self.sentinel = self.currentRoot
+        self.numEntries = 0
+        self.totalBytes = 0
+        self.references = {}
+
+    #
+    # BUDGET HANDLING
+    #
+    def isOverBudget(self):
+        if self.maxEntries > 0 and self.numEntries > self.maxEntries:
+            return True
+        if self.maxBytes > 0 and self.totalBytes > self.maxBytes:
+            return True
+        return False
+
+    def compact(self):
+        """Prunes entries until the history fits into its budget"""
+        if not self.isOverBudget():
+            return
+
+        # abandoned redo branches go first
+        applied = self.__getAppliedEntries()
+        line = [self.sentinel] + applied + self.__getRedoEntries()
+        for i, entry in enumerate(line):
+            nextEntry = line[i+1] if i+1 < len(line) else None
+            for child in entry.children[:]:
+                if child is nextEntry:
+                    continue
+                if not self.isOverBudget():
+                    return
+                self.__removeChild(entry, child)
+                self.__releaseSubtree(child, applied)
+
+        # then the oldest history
+        while self.isOverBudget() and self.sentinel is not self.currentRoot:
+            self.__shiftSentinel(self.__getAppliedEntries()[0])
+
+        # last the entries that are farthest away in the redo chain
+        while self.isOverBudget():
+            redo = self.__getRedoEntries()
+            if len(redo) == 0:
+                break
+            last = redo[-1]
+            self.__removeChild(last.parent, last)
+            self.__releaseEntry(last, False)
+
+    def getStats(self):
+        return {
+            "entries": self.numEntries,
+            "bytes": self.totalBytes,
+            "max_entries": self.maxEntries,
+            "max_bytes": self.maxBytes,
+            "pruned": self.numPruned,
+            "referenced_objects": len(self.references),
+        }
+
+    def getReferenceCount(self, editObject):
+        return self.references.get(editObject, 0)
+
+    def __getAppliedEntries(self):
+        """Returns the entries from the oldest to the current one"""
+        entries = []
+        entry = self.currentRoot
+        while entry is not self.sentinel:
+            entries.append(entry)
+            entry = entry.parent
+        entries.reverse()
+        return entries
+
+    def __getRedoEntries(self):
+        """Returns the entries that can be redone, nearest first"""
+        entries = []
+        entry = self.currentRoot.activeChild
+        while entry is not None:
+            entries.append(entry)
+            entry = entry.activeChild
+        return entries
+
+    def __shiftSentinel(self, oldest):
+        """Makes the oldest applied entry the new root of the history"""
+        oldSentinel = self.sentinel
+        applied = self.__getAppliedEntries()
+        for child in oldSentinel.children:
+            if child is not oldest:
+                self.__releaseSubtree(child, applied)
+
+        # the oldest entry becomes the new sentinel, its action stays applied
+        self.__releaseEntry(oldest, True)
+        oldest.setParent(oldest)
+        oldest.editObject = None
+        oldest.action = ""
+        oldest.objectType = ""
+        oldest.oldValue = None
+        oldest.newValue = None
+        oldest.subEntries = None
+        self.sentinel = oldest
+
+    def __removeChild(self, parent, child):
+        parent.children.remove(child)
+        if parent.activeChild is child:
+            parent.activeChild = parent.children[-1] if len(parent.children) > 0 else None
+
+    def __releaseSubtree(self, root, applied):
+        applied = set(applied)
+        stack = [root]
+        while len(stack) > 0:
+            entry = stack.pop()
+            stack += entry.children
+            if entry is self.sentinel:
+                continue
+            self.__releaseEntry(entry, entry in applied)
+
+    def __track(self, entry):
+        self.numEntries += 1
+        self.totalBytes += entry.size
+        for obj in self.__getEntryObjects(entry):
+            self.references[obj] = self.references.get(obj, 0) + 1
+
+    def __releaseEntry(self, entry, applied):
+        self.numEntries -= 1
+        self.totalBytes -= entry.size
+        self.numPruned += 1
+        for obj in self.__getEntryObjects(entry):
+            self.references[obj] -= 1
+            if self.references[obj] <= 0:
+                del self.references[obj]
+        if self.releaseCallback is not None:
+            for subEntry in entry.getEntries():
+                self.releaseCallback(subEntry, applied)
+
+    def __getEntryObjects(self, entry):
+        return [
+            subEntry.editObject for subEntry in entry.getEntries()
+            if subEntry.editObject is not None]
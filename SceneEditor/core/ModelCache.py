@@ -0,0 +1,157 @@
+import os
+import logging
+from collections import OrderedDict
+
+from panda3d.core import Filename, ModelPool, ModelRoot
+
+
+class ModelCacheEntry:
+    def __init__(self, model, size, timestamp, os_path):
+        # the loaded model which will be cloned into the scene
+        self.model = model
+        # approximate memory footprint in bytes
+        self.size = size
+        # modification time of the file on disk when it was loaded
+        self.timestamp = timestamp
+        self.os_path = os_path
+
+
+class ModelCache:
+    """Keeps one loaded copy of every model path and hands out clones of it.
+
+    Clones either share the geometry nodes with the cached model (instancing)
+    or get an independent deep copy. The least recently used models are
+    evicted once the approximate memory footprint exceeds the budget, and a
+    model is reloaded if its file on disk has been modified."""
+
+    def __init__(self, max_bytes, instancing=True):
+        self.max_bytes = max_bytes
+        self.instancing = instancing
+
+        # path -> ModelCacheEntry, least recently used first
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, path):
+        """Returns the cached model for the given path or None if it isn't
+        cached or outdated"""
+        key = str(path)
+        if key not in self.entries:
+            self.misses += 1
+            return None
+
+        entry = self.entries[key]
+        if self.__get_timestamp(entry.os_path) != entry.timestamp:
+            logging.debug(f"model {key} changed on disk, reloading it")
+            self.invalidate(key)
+            self.invalidations += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry.model
+
+    def add(self, path, model):
+        """Stores the loaded model for the given path. The model must not be
+        part of the scene"""
+        key = str(path)
+        if key in self.entries:
+            self.invalidate(key)
+
+        os_path = ""
+        if isinstance(model.node(), ModelRoot):
+            os_path = model.node().get_fullpath().to_os_specific()
+
+        entry = ModelCacheEntry(
+            model,
+            self.estimate_size(model),
+            self.__get_timestamp(os_path),
+            os_path)
+        self.entries[key] = entry
+        self.total_bytes += entry.size
+
+        self.__evict()
+
+    def invalidate(self, path):
+        key = str(path)
+        if key not in self.entries:
+            return
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry.size
+        if entry.os_path != "":
+            # make sure the engines model pool doesn't hand out the old
+            # version again
+            ModelPool.release_model(Filename.from_os_specific(entry.os_path))
+
+    def clear(self):
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+
+    def instantiate(self, model, target, shared=None):
+        """Clones the content of the given model into the target NodePath"""
+        if shared is None:
+            shared = self.instancing
+
+        root_transform = model.get_transform()
+        for child in model.get_children():
+            if shared:
+                clone = child.instance_to(target)
+            else:
+                clone = child.copy_to(target)
+            if not root_transform.is_identity():
+                clone.set_transform(root_transform.compose(clone.get_transform()))
+
+        root_state = model.node().get_state()
+        if not root_state.is_empty():
+            target.node().set_state(
+                root_state.compose(target.node().get_state()))
+
+    def estimate_size(self, model):
+        """Returns the approximate memory footprint of the given model in
+        bytes, counting vertex and index data as well as textures"""
+        size = 0
+        for geom_np in model.find_all_matches("**/+GeomNode"):
+            for geom in geom_np.node().get_geoms():
+                vdata = geom.get_vertex_data()
+                for i in range(vdata.get_num_arrays()):
+                    size += vdata.get_array(i).get_data_size_bytes()
+                for i in range(geom.get_num_primitives()):
+                    size += geom.get_primitive(i).get_data_size_bytes()
+        for texture in model.find_all_textures():
+            size += texture.estimate_texture_memory()
+        return size
+
+    def get_stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def __evict(self):
+        # the most recently added model is never evicted
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key = next(iter(self.entries))
+            entry = self.entries.pop(key)
+            self.total_bytes -= entry.size
+            self.evictions += 1
+            logging.debug(f"evicted model {key} from the model cache")
+
+    def __get_timestamp(self, os_path):
+        if os_path == "":
+            return None
+        try:
+            return os.path.getmtime(os_path)
+        except OSError:
+            return None
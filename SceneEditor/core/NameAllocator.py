@@ -0,0 +1,34 @@
+class NameAllocator:
+    """Creates unique names of the form prefix_N for new scene objects.
+
+    A counter per prefix remembers where the last search stopped and the
+    scene object registry answers whether a name is taken, so allocating a
+    name doesn't need to search the scene graph. Names of removed objects
+    stay reserved as long as the object can be restored through undo."""
+
+    def __init__(self, scene_objects):
+        self.scene_objects = scene_objects
+
+        # prefix -> next number to try
+        self.counters = {}
+
+        # names handed out which may not have been registered yet
+        self.allocated = set()
+
+    def allocate(self, prefix):
+        i = self.counters.get(prefix, 1)
+        name = f"{prefix}_{i}"
+        while self.is_in_use(name):
+            i += 1
+            name = f"{prefix}_{i}"
+        self.counters[prefix] = i + 1
+        self.allocated.add(name)
+        return name
+
+    def is_in_use(self, name):
+        return name in self.allocated \
+            or self.scene_objects.is_name_indexed(name)
+
+    def reset(self):
+        self.counters = {}
+        self.allocated = set()
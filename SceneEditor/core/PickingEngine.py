@@ -0,0 +1,428 @@
+import logging
+
+from panda3d.core import LVecBase4f
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# returned as bounds of objects that may be hit by any ray
+INFINITE_BOUNDS = "infinite"
+
+# corner selection of a box, 1 takes the maximum, 0 the minimum
+BOX_CORNERS = [(x, y, z) for x in (0, 1) for y in (0, 1) for z in (0, 1)]
+
+
+class PickingBVHNode:
+    def __init__(self, bounds_min, bounds_max, obj=None):
+        self.bounds_min = bounds_min
+        self.bounds_max = bounds_max
+        # only set for leaf nodes
+        self.obj = obj
+        self.left = None
+        self.right = None
+        self.parent = None
+
+    def is_leaf(self):
+        return self.obj is not None
+
+
+class PickingEngine:
+    """Bounding volume hierarchy of axis aligned world space bounds of all
+    scene objects, used to narrow down the objects a pick ray may hit.
+
+    Objects which have been added or removed are inserted into or taken out
+    of the hierarchy, it is only rebuilt completely if a large part of the
+    scene has changed. Objects which have been moved are only marked dirty,
+    their bounds are updated and the hierarchy refitted right before the next
+    query. Objects without geometry, like collision solids, use the bounds of
+    their node."""
+
+    def __init__(self, scene_objects, scene_model_parent):
+        self.scene_objects = scene_objects
+        self.scene_model_parent = scene_model_parent
+
+        self.root = None
+        # scene object -> leaf node
+        self.leaves = {}
+        # objects with empty bounds, only their origin is known
+        self.point_objects = {}
+        # objects with infinite bounds, e.g. collision planes, which may be
+        # hit by any ray
+        self.unbounded_objects = {}
+        # (objects, minima, maxima) of the leaves for batched queries
+        self.bounds_arrays = None
+        # objects whose bounds need to be recalculated
+        self.dirty_objects = set()
+        self.registry_version = None
+        # incremented on every change that may affect what is shown
+        self.change_count = 0
+
+        # statistics of the last query
+        self.num_tested_nodes = 0
+        self.num_candidates = 0
+
+    #
+    # MAINTENANCE
+    #
+    def mark_dirty(self, obj):
+        """Notify about an object that has been moved, rotated, scaled,
+        reparented or whose geometry has changed"""
+        self.dirty_objects.add(obj)
+        self.change_count += 1
+
+    def invalidate(self):
+        """Forces a complete rebuild on the next query"""
+        self.registry_version = None
+        self.change_count += 1
+
+    def update(self):
+        if self.registry_version is None:
+            self.rebuild()
+            return
+        if self.registry_version != self.scene_objects.version:
+            self.__sync_objects()
+
+        if len(self.dirty_objects) == 0:
+            return
+        dirty = set()
+        for obj in self.dirty_objects:
+            if obj.is_empty():
+                continue
+            dirty.add(obj)
+            # sub objects have been moved together with their parent
+            for child in obj.find_all_matches("**/=scene_object_id;+s"):
+                dirty.add(child)
+        self.dirty_objects = set()
+
+        for obj in dirty:
+            if not self.__is_known(obj):
+                continue
+            bounds = self.__get_bounds(obj)
+            leaf = self.leaves.get(obj)
+            if leaf is not None and bounds not in [None, INFINITE_BOUNDS]:
+                leaf.bounds_min, leaf.bounds_max = bounds
+                self.__refit(leaf.parent)
+            else:
+                # the object may have gained or lost its geometry
+                self.__remove_object(obj)
+                self.__add_object(obj, bounds)
+        self.bounds_arrays = None
+
+    def rebuild(self):
+        self.registry_version = self.scene_objects.version
+        self.dirty_objects = set()
+        self.leaves = {}
+        self.point_objects = {}
+        self.unbounded_objects = {}
+        self.bounds_arrays = None
+
+        leaves = []
+        for obj in self.scene_objects:
+            bounds = self.__get_bounds(obj)
+            if bounds is None:
+                self.point_objects[obj] = None
+            elif bounds is INFINITE_BOUNDS:
+                self.unbounded_objects[obj] = None
+            else:
+                leaf = PickingBVHNode(bounds[0], bounds[1], obj)
+                self.leaves[obj] = leaf
+                leaves.append(leaf)
+
+        self.root = self.__build(leaves)
+        if self.root is not None:
+            self.root.parent = None
+        logging.debug(f"rebuilt picking hierarchy with {len(leaves)} objects")
+
+    def __sync_objects(self):
+        """Inserts the objects which have been added to the registry and
+        removes the ones which have been removed from it"""
+        self.registry_version = self.scene_objects.version
+        known = list(self.leaves) + list(self.point_objects) + list(self.unbounded_objects)
+        removed = [obj for obj in known if obj not in self.scene_objects]
+        added = [obj for obj in self.scene_objects if not self.__is_known(obj)]
+        if len(removed) + len(added) > len(known) // 2:
+            # inserting one by one would result in a worse hierarchy
+            self.rebuild()
+            return
+        for obj in removed:
+            self.__remove_object(obj)
+            self.dirty_objects.discard(obj)
+        for obj in added:
+            self.__add_object(obj, self.__get_bounds(obj))
+            self.dirty_objects.discard(obj)
+        self.bounds_arrays = None
+
+    def __is_known(self, obj):
+        return obj in self.leaves \
+            or obj in self.point_objects \
+            or obj in self.unbounded_objects
+
+    def __add_object(self, obj, bounds):
+        if bounds is None:
+            self.point_objects[obj] = None
+        elif bounds is INFINITE_BOUNDS:
+            self.unbounded_objects[obj] = None
+        else:
+            leaf = PickingBVHNode(bounds[0], bounds[1], obj)
+            self.leaves[obj] = leaf
+            self.__insert_leaf(leaf)
+
+    def __remove_object(self, obj):
+        leaf = self.leaves.pop(obj, None)
+        if leaf is not None:
+            self.__remove_leaf(leaf)
+        self.point_objects.pop(obj, None)
+        self.unbounded_objects.pop(obj, None)
+
+    def __get_bounds(self, obj):
+        """Returns the (min, max) tuples of the objects bounds relative to
+        the scene model parent, None if they are empty or INFINITE_BOUNDS"""
+        bounds = obj.get_tight_bounds(self.scene_model_parent)
+        if bounds is None:
+            # nodes without geometry, like collision solids, still have the
+            # bounds of their node
+            volume = obj.get_bounds()
+            if volume.is_empty():
+                return None
+            if volume.is_infinite():
+                return INFINITE_BOUNDS
+            volume.xform(obj.get_mat(self.scene_model_parent))
+            bounds = volume.get_min(), volume.get_max()
+        bounds_min, bounds_max = bounds
+        return (
+            (bounds_min.x, bounds_min.y, bounds_min.z),
+            (bounds_max.x, bounds_max.y, bounds_max.z))
+
+    def __insert_leaf(self, leaf):
+        if self.root is None:
+            self.root = leaf
+            return
+        # descend into the child whose bounds grow the least
+        node = self.root
+        while not node.is_leaf():
+            node = min(
+                (node.left, node.right),
+                key=lambda child: self.__get_growth(child, leaf))
+
+        parent = node.parent
+        branch = PickingBVHNode(*self.__union([node, leaf]))
+        branch.left = node
+        branch.right = leaf
+        branch.parent = parent
+        node.parent = branch
+        leaf.parent = branch
+        if parent is None:
+            self.root = branch
+            return
+        if parent.left is node:
+            parent.left = branch
+        else:
+            parent.right = branch
+        self.__refit(parent)
+
+    def __remove_leaf(self, leaf):
+        parent = leaf.parent
+        if parent is None:
+            self.root = None
+            return
+        sibling = parent.left if parent.right is leaf else parent.right
+        grandparent = parent.parent
+        sibling.parent = grandparent
+        if grandparent is None:
+            self.root = sibling
+            return
+        if grandparent.left is parent:
+            grandparent.left = sibling
+        else:
+            grandparent.right = sibling
+        self.__refit(grandparent)
+
+    def __get_growth(self, node, leaf):
+        """Returns how much the surface of the nodes bounds grows if the leaf
+        is added to it"""
+        return self.__get_area(self.__union([node, leaf])) \
+            - self.__get_area((node.bounds_min, node.bounds_max))
+
+    def __get_area(self, bounds):
+        x, y, z = [bounds[1][i] - bounds[0][i] for i in range(3)]
+        return x * y + y * z + z * x
+
+    def __build(self, leaves):
+        if len(leaves) == 0:
+            return None
+        if len(leaves) == 1:
+            return leaves[0]
+
+        node = PickingBVHNode(*self.__union([leaf for leaf in leaves]))
+
+        # split at the median of the centers along the longest axis
+        extent = [node.bounds_max[i] - node.bounds_min[i] for i in range(3)]
+        axis = extent.index(max(extent))
+        leaves.sort(key=lambda leaf: leaf.bounds_min[axis] + leaf.bounds_max[axis])
+        middle = len(leaves) // 2
+
+        node.left = self.__build(leaves[:middle])
+        node.right = self.__build(leaves[middle:])
+        node.left.parent = node
+        node.right.parent = node
+        return node
+
+    def __union(self, nodes):
+        return (
+            tuple(min(n.bounds_min[i] for n in nodes) for i in range(3)),
+            tuple(max(n.bounds_max[i] for n in nodes) for i in range(3)))
+
+    def __refit(self, node):
+        while node is not None:
+            node.bounds_min, node.bounds_max = self.__union([node.left, node.right])
+            node = node.parent
+
+    #
+    # QUERIES
+    #
+    def get_object_bounds(self, obj):
+        """Returns the (min, max) tuples of the objects bounds relative to
+        the scene model parent or None if the object has no geometry or
+        isn't part of the hierarchy"""
+        if self.registry_version != self.scene_objects.version:
+            # leave the rebuild to the next query
+            return None
+        self.update()
+        leaf = self.leaves.get(obj)
+        if leaf is None:
+            return None
+        return (leaf.bounds_min, leaf.bounds_max)
+
+    def query_ray(self, origin, direction):
+        """Returns a list of (distance, object) of all objects whose bounds
+        are hit by the ray, nearest first. Origin and direction are given
+        relative to the scene model parent, the direction must be
+        normalized"""
+        self.update()
+        self.num_tested_nodes = 0
+
+        inverse = [1.0 / d if d != 0 else float("inf") for d in direction]
+
+        hits = []
+        stack = [self.root] if self.root is not None else []
+        while len(stack) > 0:
+            node = stack.pop()
+            self.num_tested_nodes += 1
+            distance = self.__intersect(node, origin, inverse)
+            if distance is None:
+                continue
+            if node.is_leaf():
+                hits.append((distance, node.obj))
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+
+        hits.sort(key=lambda hit: hit[0])
+        # their distance is unknown, so they come last
+        for obj in self.unbounded_objects:
+            hits.append((float("inf"), obj))
+        self.num_candidates = len(hits)
+        return hits
+
+    def __intersect(self, node, origin, inverse):
+        """Slab test of the ray against the nodes bounds. Returns the entry
+        distance along the ray or None if the bounds are missed"""
+        t_min = 0.0
+        t_max = float("inf")
+        for i in range(3):
+            if inverse[i] == float("inf"):
+                # the ray is parallel to this slab
+                if origin[i] < node.bounds_min[i] or origin[i] > node.bounds_max[i]:
+                    return None
+                continue
+            t1 = (node.bounds_min[i] - origin[i]) * inverse[i]
+            t2 = (node.bounds_max[i] - origin[i]) * inverse[i]
+            if t1 > t2:
+                t1, t2 = t2, t1
+            t_min = max(t_min, t1)
+            t_max = min(t_max, t2)
+            if t_min > t_max:
+                return None
+        return t_min
+
+    def query_rect(self, view_mat, left, bottom, right, top):
+        """Returns all objects whose projected bounds lie inside the given
+        rectangle in normalized device coordinates. The view matrix has to
+        transform from the scene model parent space into clip space. Objects
+        which are partially behind the camera are not included, objects
+        without geometry are tested by their origin."""
+        self.update()
+        rect = (left, bottom, right, top)
+
+        if numpy is not None:
+            found = self.__query_rect_numpy(view_mat, rect)
+        else:
+            found = []
+            for obj, leaf in self.leaves.items():
+                corners = [
+                    [(leaf.bounds_min, leaf.bounds_max)[c[i]][i] for i in range(3)]
+                    for c in BOX_CORNERS]
+                if self.__is_inside(view_mat, corners, rect):
+                    found.append(obj)
+
+        for obj in list(self.point_objects) + list(self.unbounded_objects):
+            if obj.is_empty():
+                continue
+            pos = obj.get_pos(self.scene_model_parent)
+            if self.__is_inside(view_mat, [pos], rect):
+                found.append(obj)
+        return found
+
+    def __query_rect_numpy(self, view_mat, rect):
+        if self.bounds_arrays is None:
+            objects = list(self.leaves.keys())
+            self.bounds_arrays = (
+                objects,
+                numpy.array([self.leaves[obj].bounds_min for obj in objects], dtype=float).reshape(-1, 3),
+                numpy.array([self.leaves[obj].bounds_max for obj in objects], dtype=float).reshape(-1, 3))
+        objects, minima, maxima = self.bounds_arrays
+        if len(objects) == 0:
+            return []
+
+        # all eight corners of every box in homogeneous coordinates
+        select_max = numpy.array(BOX_CORNERS, dtype=bool)
+        corners = numpy.where(select_max[None, :, :], maxima[:, None, :], minima[:, None, :])
+        corners = numpy.concatenate([corners, numpy.ones(corners.shape[:2] + (1,))], axis=2)
+
+        # panda3d matrices transform row vectors
+        mat = numpy.array([[view_mat.get_cell(r, c) for c in range(4)] for r in range(4)])
+        clip = corners @ mat
+
+        w = clip[:, :, 3]
+        in_front = numpy.all(w > 1e-6, axis=1)
+        w = numpy.where(w > 1e-6, w, 1.0)
+        x = clip[:, :, 0] / w
+        y = clip[:, :, 1] / w
+
+        left, bottom, right, top = rect
+        inside = in_front \
+            & (x.min(axis=1) >= left) & (x.max(axis=1) <= right) \
+            & (y.min(axis=1) >= bottom) & (y.max(axis=1) <= top)
+        return [objects[i] for i in numpy.nonzero(inside)[0]]
+
+    def __is_inside(self, view_mat, points, rect):
+        xs = []
+        ys = []
+        for point in points:
+            clip = view_mat.xform(LVecBase4f(point[0], point[1], point[2], 1))
+            if clip[3] <= 1e-6:
+                return False
+            xs.append(clip[0] / clip[3])
+            ys.append(clip[1] / clip[3])
+        left, bottom, right, top = rect
+        return min(xs) >= left and max(xs) <= right \
+            and min(ys) >= bottom and max(ys) <= top
+
+    def get_stats(self):
+        return {
+            "objects": len(self.leaves),
+            "tested_nodes": self.num_tested_nodes,
+            "candidates": self.num_candidates,
+        }
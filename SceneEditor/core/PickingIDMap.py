@@ -0,0 +1,261 @@
+import math
+import logging
+
+from panda3d.core import (
+    NodePath,
+    Camera,
+    Texture,
+    GraphicsOutput,
+    GraphicsPipe,
+    FrameBufferProperties,
+    WindowProperties,
+    TransparencyAttrib,
+    ConfigVariableBool,
+    ConfigVariableDouble)
+
+# the tag that is used to give each object its own flat color in the map
+PICK_TAG = "scene_object_id"
+
+
+class PickingIDMap:
+    """Low resolution offscreen rendering of the scene in which every scene
+    object is drawn with a flat color that encodes its index.
+
+    The map is rendered along with a regular frame once the camera, the lens
+    and the scene stopped changing and read back the frame after, a pick is a
+    single lookup in the maps ram image. As long as the map doesn't show the
+    current view, picks have to be done with the ray. Works with any graphics
+    pipe that supports offscreen buffers, including tinydisplay."""
+
+    def __init__(self, scene_objects, scene_model_parent, picking_engine):
+        self.scene_objects = scene_objects
+        self.scene_model_parent = scene_model_parent
+        self.picking_engine = picking_engine
+
+        self.enabled = ConfigVariableBool("scene-editor-pick-id-map", True).getValue()
+        # size of the map relative to the size of the display region
+        self.scale = ConfigVariableDouble("scene-editor-pick-id-map-scale", 0.5).getValue()
+
+        self.buffer = None
+        self.texture = None
+        self.camera_np = None
+
+        # object id -> color index and reverse, index 0 is the background
+        self.indices = {}
+        self.object_ids = [None]
+
+        self.image = None
+        self.width = 0
+        self.height = 0
+        # state of the view and scene the image has been rendered for
+        self.rendered_key = None
+        self.registry_version = None
+        # state the buffer has been triggered to render for
+        self.requested_key = None
+        # state of the previous frame, the map is only rendered once the view
+        # stays the same for a frame
+        self.last_key = None
+
+        self.num_renders = 0
+        self.num_lookups = 0
+
+        if self.is_available():
+            # runs after the camera has been moved and before the frame is
+            # rendered by the igLoop task
+            base.taskMgr.add(self.__update_task, "SceneEditor_pick_id_map_update", sort=45)
+
+    def is_available(self):
+        return self.enabled and base.cam is not None
+
+    def is_current(self):
+        """Returns True if the map shows the current view and scene"""
+        return (self.is_available()
+            and self.image is not None
+            and self.requested_key is None
+            and self.rendered_key == self.__get_key())
+
+    def invalidate(self):
+        """Forces the map to be rendered again"""
+        self.rendered_key = None
+
+    def destroy(self):
+        base.taskMgr.remove("SceneEditor_pick_id_map_update")
+        self.__destroy_buffer()
+
+    def __destroy_buffer(self):
+        if self.buffer is not None:
+            base.graphicsEngine.remove_window(self.buffer)
+        if self.camera_np is not None:
+            self.camera_np.remove_node()
+        self.buffer = None
+        self.camera_np = None
+        self.image = None
+        self.rendered_key = None
+        self.requested_key = None
+
+    def pick(self, x, y):
+        """Returns the scene object shown at the given position of the
+        camera's display region, given in the range of -1 to 1 like the
+        mouse position. Returns None if the position shows no object or the
+        map isn't current."""
+        if not self.is_current():
+            return None
+        self.num_lookups += 1
+
+        px = min(int((x + 1) * 0.5 * self.width), self.width - 1)
+        py = min(int((y + 1) * 0.5 * self.height), self.height - 1)
+        if px < 0 or py < 0:
+            return None
+        offset = (py * self.width + px) * 4
+        index = self.image[offset] | self.image[offset + 1] << 8 | self.image[offset + 2] << 16
+        if index == 0 or index >= len(self.object_ids):
+            return None
+        return self.scene_objects.get_by_id(self.object_ids[index])
+
+    def get_stats(self):
+        return {
+            "renders": self.num_renders,
+            "lookups": self.num_lookups,
+            "size": (self.width, self.height),
+        }
+
+    #
+    # RENDERING
+    #
+    def __get_key(self):
+        return (
+            base.cam.get_mat(self.scene_model_parent),
+            base.camLens.get_projection_mat(),
+            self.scene_objects.version,
+            self.picking_engine.change_count)
+
+    def __update_task(self, task):
+        """Reads back the map once it has been rendered and triggers a new
+        render of the offscreen buffer only, if the view has settled on a
+        state the map doesn't show yet"""
+        if not self.enabled:
+            return task.done
+
+        if self.requested_key is not None:
+            if self.buffer.is_active():
+                # not rendered yet
+                return task.cont
+            if not self.__read_image():
+                return task.done
+
+        dr = base.cam.node().get_display_region(0)
+        width = max(1, int(dr.get_pixel_width() * self.scale))
+        height = max(1, int(dr.get_pixel_height() * self.scale))
+
+        if self.buffer is None or (width, height) != (self.width, self.height):
+            self.__destroy_buffer()
+            if not self.__create_buffer(width, height):
+                self.enabled = False
+                return task.done
+
+        if self.registry_version != self.scene_objects.version:
+            self.__assign_indices()
+
+        key = self.__get_key()
+        if key != self.rendered_key and key == self.last_key:
+            # renders with the next frame and deactivates itself afterwards
+            self.buffer.set_active(True)
+            self.buffer.set_one_shot(True)
+            self.requested_key = key
+        self.last_key = key
+        return task.cont
+
+    def __read_image(self):
+        key = self.requested_key
+        self.requested_key = None
+        if not self.texture.has_ram_image():
+            logging.warning("Picking id map could not be rendered, falling back to ray picking")
+            self.enabled = False
+            return False
+        self.image = memoryview(self.texture.get_ram_image_as("RGBA"))
+        self.rendered_key = key
+        self.num_renders += 1
+        return True
+
+    def __create_buffer(self, width, height):
+        fb_props = FrameBufferProperties()
+        fb_props.set_rgba_bits(8, 8, 8, 8)
+        fb_props.set_depth_bits(24)
+        fb_props.set_multisamples(0)
+        fb_props.set_srgb_color(False)
+        win_props = WindowProperties.size(width, height)
+
+        gsg = None
+        host = None
+        if base.win is not None:
+            gsg = base.win.get_gsg()
+            host = base.win
+        self.buffer = base.graphicsEngine.make_output(
+            base.pipe, "scene_editor_pick_id_map", -100,
+            fb_props, win_props,
+            GraphicsPipe.BF_refuse_window,
+            gsg, host)
+        if self.buffer is None:
+            logging.warning("Can't create the picking id map buffer, falling back to ray picking")
+            return False
+
+        self.texture = Texture("scene_editor_pick_id_map")
+        self.buffer.add_render_texture(self.texture, GraphicsOutput.RTM_copy_ram)
+        self.buffer.set_clear_color_active(True)
+        self.buffer.set_clear_color((0, 0, 0, 0))
+        self.buffer.set_active(False)
+
+        camera = Camera("scene_editor_pick_id_camera", base.camLens)
+        camera.set_scene(self.scene_model_parent)
+        camera.set_tag_state_key(PICK_TAG)
+        camera.set_initial_state(self.__make_state(0))
+        self.camera_np = base.cam.attach_new_node(camera)
+        self.buffer.make_display_region().set_camera(self.camera_np)
+
+        self.width = width
+        self.height = height
+        # the tag states have to be set on the new camera
+        self.registry_version = None
+        self.image = None
+        return True
+
+    def __assign_indices(self):
+        camera = self.camera_np.node()
+        camera.clear_tag_states()
+        self.indices = {}
+        self.object_ids = [None]
+        for obj in self.scene_objects:
+            object_id = obj.get_tag(PICK_TAG)
+            index = len(self.object_ids)
+            if index >= 1 << 24:
+                logging.warning("Too many objects for the picking id map")
+                break
+            self.indices[object_id] = index
+            self.object_ids.append(object_id)
+            camera.set_tag_state(object_id, self.__make_state(index))
+        self.registry_version = self.scene_objects.version
+
+    def __make_state(self, index):
+        """Returns the render state that draws everything flat in the color
+        encoding the given index"""
+        np = NodePath("pick_id_state")
+        np.set_color(
+            self.__to_channel(index & 0xff),
+            self.__to_channel(index >> 8 & 0xff),
+            self.__to_channel(index >> 16 & 0xff),
+            1, 1000)
+        np.set_color_scale_off(1000)
+        np.set_texture_off(1000)
+        np.set_light_off(1000)
+        np.set_material_off(1000)
+        np.set_shader_off(1000)
+        np.set_fog_off(1000)
+        np.set_transparency(TransparencyAttrib.M_none, 1000)
+        return np.get_state()
+
+    def __to_channel(self, value):
+        """Returns the color channel that is written as the given byte.
+        Colors are quantized to steps of 1/1024, so the step just above
+        value / 255 is used, which is read back as the same byte by
+        pipelines that round as well as by ones that truncate."""
+        return math.ceil(value * 1024 / 255.0) / 1024.0
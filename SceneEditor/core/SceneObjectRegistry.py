@@ -0,0 +1,197 @@
+import logging
+
+
+class SceneObjectRegistry:
+    """Ordered collection of all scene objects with lookups by
+    scene_object_id, name and object type.
+
+    It can be used like the plain list of scene objects it replaces. Iterating
+    keeps the insertion order, slicing returns a list copy and membership tests
+    take constant time instead of a linear scan.
+
+    The name index is only kept in sync through update_name, objects that are
+    renamed after they have been added have to be passed to it."""
+
+    def __init__(self, objects=None):
+        # scene_object_id -> NodePath, keeps the insertion order
+        self.by_id = {}
+        # NodePath -> scene_object_id, for membership tests and removal
+        self.ids = {}
+        # name -> dict of scene_object_ids (used as an ordered set)
+        self.by_name = {}
+        # object_type -> dict of scene_object_ids (used as an ordered set)
+        self.by_type = {}
+        # scene_object_id -> name the object has been indexed with
+        self.indexed_names = {}
+        # incremented whenever objects are added or removed
+        self.version = 0
+        # list of the objects in insertion order, None if it needs to be
+        # created again
+        self.ordered = None
+
+        if objects is not None:
+            for obj in objects:
+                self.append(obj)
+
+    #
+    # LIST INTERFACE
+    #
+    def __iter__(self):
+        return iter(self.__get_ordered())
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __contains__(self, obj):
+        return obj in self.ids
+
+    def __getitem__(self, index):
+        try:
+            return self.__get_ordered()[index]
+        except IndexError:
+            raise IndexError("scene object index out of range")
+
+    def __bool__(self):
+        return len(self.by_id) > 0
+
+    def __get_ordered(self):
+        """Returns the objects in insertion order. The list is created once
+        per change and replaced instead of modified, so running iterations
+        aren't affected by objects being added or removed"""
+        if self.ordered is None:
+            self.ordered = list(self.by_id.values())
+        return self.ordered
+
+    def append(self, obj):
+        object_id = obj.get_tag("scene_object_id")
+        if object_id == "":
+            logging.warning(f"Can't register scene object without id {obj}")
+            return
+        if obj in self.ids:
+            return
+        if object_id in self.by_id:
+            # the id has been reused, e.g. by a copied object, drop the
+            # outdated entry first
+            self.remove(self.by_id[object_id])
+
+        self.by_id[object_id] = obj
+        self.ids[obj] = object_id
+        self.version += 1
+        self.ordered = None
+
+        name = obj.get_name()
+        self.by_name.setdefault(name, {})[object_id] = None
+        self.indexed_names[object_id] = name
+
+        object_type = obj.get_tag("object_type")
+        self.by_type.setdefault(object_type, {})[object_id] = None
+
+    def remove(self, obj):
+        if obj not in self.ids:
+            raise ValueError(f"{obj} is not a registered scene object")
+        object_id = self.ids.pop(obj)
+        del self.by_id[object_id]
+        self.version += 1
+        self.ordered = None
+
+        name = self.indexed_names.pop(object_id)
+        self.__discard(self.by_name, name, object_id)
+
+        object_type = obj.get_tag("object_type")
+        self.__discard(self.by_type, object_type, object_id)
+
+    def clear(self):
+        self.by_id = {}
+        self.ids = {}
+        self.by_name = {}
+        self.by_type = {}
+        self.indexed_names = {}
+        self.version += 1
+        self.ordered = None
+
+    def __discard(self, index, key, object_id):
+        if key not in index:
+            return
+        index[key].pop(object_id, None)
+        if len(index[key]) == 0:
+            del index[key]
+
+    #
+    # LOOKUPS
+    #
+    def get_id(self, obj):
+        """Returns the scene_object_id the object has been registered with"""
+        return self.ids.get(obj)
+
+    def get_by_id(self, object_id):
+        """Returns the scene object with the given id or None"""
+        return self.by_id.get(object_id)
+
+    def get_ids_by_name(self, name):
+        """Returns the ids of all scene objects with the given name in the
+        order they have been added"""
+        return list(self.by_name.get(name, {}).keys())
+
+    def get_by_name(self, name):
+        """Returns all scene objects with the given name in the order they
+        have been added"""
+        return [self.by_id[object_id] for object_id in self.get_ids_by_name(name)]
+
+    def get_last_by_name(self, name):
+        """Returns the most recently added scene object with the given name or
+        None"""
+        object_ids = self.get_ids_by_name(name)
+        if len(object_ids) == 0:
+            return None
+        return self.by_id[object_ids[-1]]
+
+    def get_ids_by_type(self, object_type):
+        return list(self.by_type.get(object_type, {}).keys())
+
+    def get_by_type(self, object_type):
+        return [self.by_id[object_id] for object_id in self.get_ids_by_type(object_type)]
+
+    def has_name(self, name):
+        return len(self.get_ids_by_name(name)) > 0
+
+    def is_name_indexed(self, name):
+        return name in self.by_name
+
+    #
+    # INDEX MAINTENANCE
+    #
+    def update_name(self, obj, new_name=None):
+        """Updates the name index for an object that has been renamed. If
+        new_name is not given, the current name of the object is used"""
+        object_id = self.ids.get(obj)
+        if object_id is None:
+            return
+        old_name = self.indexed_names[object_id]
+        if new_name is None:
+            new_name = obj.get_name()
+        if old_name == new_name:
+            return
+        self.__discard(self.by_name, old_name, object_id)
+        self.by_name.setdefault(new_name, {})[object_id] = None
+        self.indexed_names[object_id] = new_name
+
+    def update_id(self, obj, object_id):
+        """Changes the scene_object_id of a registered object, e.g. to
+        restore the id it had when the project was saved. Returns False if
+        the id is already used by another object"""
+        old_id = self.ids.get(obj)
+        if old_id is None or old_id == object_id:
+            return old_id is not None
+        if object_id in self.by_id:
+            return False
+        self.remove(obj)
+        obj.set_tag("scene_object_id", object_id)
+        self.append(obj)
+        return True
+
+    def reindex_names(self):
+        self.by_name = {}
+        for object_id, obj in self.by_id.items():
+            name = obj.get_name()
+            self.by_name.setdefault(name, {})[object_id] = None
+            self.indexed_names[object_id] = name
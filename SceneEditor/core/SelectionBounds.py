@@ -0,0 +1,165 @@
+from panda3d.core import Point3
+
+from SceneEditor.core.PickingEngine import BOX_CORNERS
+
+
+class SelectionBounds:
+    """Axis aligned bounds of the selected objects relative to a reference
+    node, calculated from the objects geometry.
+
+    The bounds of every object are cached. Adding objects only extends the
+    combined bounds. The combined bounds are only calculated again if an
+    object at their border is removed or changed, otherwise they're
+    updated in place. Objects without geometry are represented by their
+    origin.
+
+    If a picking engine is given, the bounds it keeps of every scene object
+    are used instead of calculating them again."""
+
+    def __init__(self, reference, picking_engine=None):
+        self.reference = reference
+        self.picking_engine = picking_engine
+
+        # object -> (min, max) tuples
+        self.object_bounds = {}
+        # objects whose bounds need to be recalculated
+        self.dirty_objects = set()
+        # combined (min, max) of all objects, None if it needs to be
+        # recalculated
+        self.bounds = None
+        # sum of the centers of all objects
+        self.center_sum = [0.0, 0.0, 0.0]
+
+    def __len__(self):
+        return len(self.object_bounds)
+
+    def __contains__(self, obj):
+        return obj in self.object_bounds
+
+    #
+    # MAINTENANCE
+    #
+    def add(self, obj):
+        if obj in self.object_bounds: return
+        self.__set_object_bounds(obj, self.__calculate_bounds(obj))
+
+    def remove(self, obj):
+        if obj not in self.object_bounds: return
+        self.dirty_objects.discard(obj)
+        self.__remove_object_bounds(obj)
+
+    def clear(self):
+        self.object_bounds = {}
+        self.dirty_objects = set()
+        self.bounds = None
+        self.center_sum = [0.0, 0.0, 0.0]
+
+    def mark_dirty(self, obj):
+        """Notify about an object that has been moved, rotated, scaled or
+        whose geometry has changed. Selected objects below it are marked as
+        well."""
+        if len(self.object_bounds) == 0: return
+        if obj in self.object_bounds:
+            self.dirty_objects.add(obj)
+        if obj.is_empty(): return
+        for child in obj.find_all_matches("**/=scene_object_id;+s"):
+            if child in self.object_bounds:
+                self.dirty_objects.add(child)
+
+    def __calculate_bounds(self, obj):
+        if self.picking_engine is not None:
+            bounds = self.picking_engine.get_object_bounds(obj)
+            if bounds is not None:
+                return self.__to_reference(bounds)
+        bounds = obj.get_tight_bounds(self.reference)
+        if bounds is None:
+            pos = obj.get_pos(self.reference)
+            return ((pos.x, pos.y, pos.z), (pos.x, pos.y, pos.z))
+        bounds_min, bounds_max = bounds
+        return (
+            (bounds_min.x, bounds_min.y, bounds_min.z),
+            (bounds_max.x, bounds_max.y, bounds_max.z))
+
+    def __to_reference(self, bounds):
+        """Transforms bounds relative to the picking engines scene model
+        parent to the reference node"""
+        mat = self.picking_engine.scene_model_parent.get_mat(self.reference)
+        if mat.is_identity():
+            return bounds
+        corners = [
+            mat.xform_point(Point3(*[bounds[c[i]][i] for i in range(3)]))
+            for c in BOX_CORNERS]
+        return (
+            tuple(min(corner[i] for corner in corners) for i in range(3)),
+            tuple(max(corner[i] for corner in corners) for i in range(3)))
+
+    def __set_object_bounds(self, obj, bounds):
+        self.object_bounds[obj] = bounds
+        for i in range(3):
+            self.center_sum[i] += (bounds[0][i] + bounds[1][i]) / 2
+        if self.bounds is not None:
+            self.bounds = (
+                tuple(min(self.bounds[0][i], bounds[0][i]) for i in range(3)),
+                tuple(max(self.bounds[1][i], bounds[1][i]) for i in range(3)))
+        elif len(self.object_bounds) == 1:
+            self.bounds = bounds
+
+    def __remove_object_bounds(self, obj):
+        bounds = self.object_bounds.pop(obj)
+        for i in range(3):
+            self.center_sum[i] -= (bounds[0][i] + bounds[1][i]) / 2
+        if self.bounds is None: return
+        for i in range(3):
+            if bounds[0][i] <= self.bounds[0][i] or bounds[1][i] >= self.bounds[1][i]:
+                # the object was at the border, the bounds may shrink
+                self.bounds = None
+                return
+
+    def __update(self):
+        if len(self.dirty_objects) > 0:
+            for obj in self.dirty_objects:
+                if obj.is_empty():
+                    self.__remove_object_bounds(obj)
+                    continue
+                new_bounds = self.__calculate_bounds(obj)
+                if new_bounds == self.object_bounds[obj]:
+                    continue
+                self.__remove_object_bounds(obj)
+                self.__set_object_bounds(obj, new_bounds)
+            self.dirty_objects = set()
+
+        if self.bounds is None and len(self.object_bounds) > 0:
+            all_bounds = self.object_bounds.values()
+            self.bounds = (
+                tuple(min(b[0][i] for b in all_bounds) for i in range(3)),
+                tuple(max(b[1][i] for b in all_bounds) for i in range(3)))
+
+    #
+    # QUERIES
+    #
+    def get_object_bounds(self, obj):
+        """Returns the (min, max) tuples of a selected object"""
+        self.__update()
+        return self.object_bounds[obj]
+
+    def get_bounds(self):
+        """Returns the minimum and maximum point of the selection or None if
+        nothing is selected"""
+        self.__update()
+        if len(self.object_bounds) == 0:
+            return None
+        return Point3(*self.bounds[0]), Point3(*self.bounds[1])
+
+    def get_middle_point(self):
+        """Returns the center of the selections bounds"""
+        bounds = self.get_bounds()
+        if bounds is None:
+            return Point3(0, 0, 0)
+        return (bounds[0] + bounds[1]) / 2
+
+    def get_centroid(self):
+        """Returns the average of the centers of all selected objects"""
+        self.__update()
+        if len(self.object_bounds) == 0:
+            return Point3(0, 0, 0)
+        return Point3(*self.center_sum) / len(self.object_bounds)
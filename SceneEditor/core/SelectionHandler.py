@@ -1,18 +1,33 @@
+from direct.directtools.DirectGeometry import LineNodePath
+
 from panda3d.core import (
     MouseWatcher,
+    MouseButton,
     CollisionTraverser,
     CollisionHandlerQueue,
     CollisionRay,
     CollisionNode,
     GeomNode,
+    Point2,
     Point3,
-    BitMask32)
+    VBase4,
+    BitMask32,
+    ConfigVariableString)
+
+from SceneEditor.core.PickingEngine import PickingEngine
+from SceneEditor.core.PickingIDMap import PickingIDMap
+from SceneEditor.core.SelectionBounds import SelectionBounds
+
+# minimum size of the dragged rectangle before it selects anything
+BOX_SELECTION_MIN_SIZE = 0.01
 
 class SelectionHandler:
     def __init__(self):
         # new mouse watcher to handle display region changes correct
         self.selction_mouse_watcher = MouseWatcher()
-        base.mouseWatcher.getParent().attachNewNode(self.selction_mouse_watcher)
+        # without a window, e.g. when exporting headless, there is no mouse
+        if base.mouseWatcher is not None:
+            base.mouseWatcher.getParent().attachNewNode(self.selction_mouse_watcher)
 
         self.pick_traverser = CollisionTraverser()
 
@@ -23,10 +38,21 @@ class SelectionHandler:
         self.picker_node.setFromCollideMask(BitMask32.all_on()) #GeomNode.getDefaultCollideMask())
         self.picker_node.addSolid(self.picker_ray)
 
-        self.picker_np = base.cam.attachNewNode(self.picker_node)
+        # nothing is picked without a window
+        picker_parent = base.cam if base.cam is not None else render
+        self.picker_np = picker_parent.attachNewNode(self.picker_node)
 
         self.pick_traverser.addCollider(self.picker_np, self.pick_handler)
 
+        # narrows down the objects that need to be tested against the ray
+        self.picking_engine = PickingEngine(self.scene_objects, self.scene_model_parent)
+        # "geometry" tests the candidates exact, "bounds" picks the nearest
+        # bounding box that is hit by the ray
+        self.pick_mode = ConfigVariableString("scene-editor-pick-mode", "geometry").getValue()
+        # answers repeated picks in an unchanged view without any traversal
+        self.picking_id_map = PickingIDMap(
+            self.scene_objects, self.scene_model_parent, self.picking_engine)
+
         self.selection_highlight_marker = loader.load_model('models/misc/sphere')
         self.selection_highlight_marker.node().setName('selection_highlight_marker')
         self.selection_highlight_marker.reparentTo(self.scene_root)
@@ -36,6 +62,15 @@ class SelectionHandler:
         self.selection_highlight_marker.set_bin("fixed",0)
         self.selection_highlight_marker.setScale(0.3)
         self.selection_highlight_marker.hide()
+        # bounds of the selected objects relative to the marker
+        self.selection_bounds = SelectionBounds(self.scene_root, self.picking_engine)
+
+        self.box_selection_np = base.render2d.attachNewNode('box_selection_np')
+        self.box_selection_line = LineNodePath(self.box_selection_np)
+        self.box_selection_line.lineNode.setName('box_selection_line')
+        self.box_selection_line.setThickness(1)
+        self.box_selection_line.set_color(VBase4(1, 0.8, 0.3, 1))
+        self.box_selection_np.stash()
 
     def has_objects_selected(self):
         return len(self.selected_objects) > 0
@@ -47,21 +82,154 @@ class SelectionHandler:
     def handle_pick(self, multiselect):
         if self.selction_mouse_watcher.hasMouse():
             mpos = self.selction_mouse_watcher.getMouse()
-            self.picker_ray.setFromLens(base.camNode, mpos.x, mpos.y)
-            self.pick_traverser.traverse(self.scene_model_parent)
-
-            if self.pick_handler.getNumEntries() > 0:
-                self.pick_handler.sortEntries()
-                picked_obj = self.pick_handler.getEntry(0).getIntoNodePath()
-                picked_obj = picked_obj.findNetTag("scene_object_id")
-                if not picked_obj.is_empty() and not picked_obj.is_hidden():
-                    base.messenger.send("pickObject", [picked_obj, multiselect])
+            picked_obj = None
+            # the map can only be used once it shows the current view
+            if self.pick_mode == "geometry" and self.picking_id_map.is_current():
+                picked_obj = self.picking_id_map.pick(mpos.x, mpos.y)
+            else:
+                self.picker_ray.setFromLens(base.camNode, mpos.x, mpos.y)
+                picked_obj = self.pick_object()
+            if picked_obj is not None:
+                base.messenger.send("pickObject", [picked_obj, multiselect])
+            self.start_box_selection(mpos, multiselect)
+
+    def pick_object(self):
+        """Returns the scene object hit by the pick ray or None"""
+        origin = self.scene_model_parent.get_relative_point(
+            self.picker_np, self.picker_ray.get_origin())
+        direction = self.scene_model_parent.get_relative_vector(
+            self.picker_np, self.picker_ray.get_direction())
+        direction.normalize()
+
+        candidates = self.picking_engine.query_ray(origin, direction)
+
+        if self.pick_mode == "bounds":
+            for distance, obj in candidates:
+                if self.__is_pickable(obj):
+                    return obj
+            return None
+
+        picked_obj = None
+        picked_distance = float("inf")
+        for distance, obj in candidates:
+            if distance > picked_distance:
+                # all following bounds are farther away than the hit
+                break
+            if not self.__is_pickable(obj):
+                continue
+            self.pick_traverser.traverse(obj)
+            for i in range(self.pick_handler.get_num_entries()):
+                entry = self.pick_handler.get_entry(i)
+                hit_distance = (entry.get_surface_point(self.scene_model_parent) - origin).length()
+                if hit_distance >= picked_distance:
+                    continue
+                hit_obj = entry.get_into_node_path().find_net_tag("scene_object_id")
+                if hit_obj.is_empty() or hit_obj.is_hidden():
+                    continue
+                picked_obj = hit_obj
+                picked_distance = hit_distance
+        return picked_obj
+
+    #
+    # BOX SELECTION
+    #
+    def start_box_selection(self, mpos, multiselect):
+        taskMgr.remove("box_selection_task")
+        t = taskMgr.add(self.box_selection_task, "box_selection_task")
+        t.start_mouse_pos = Point2(mpos)
+        t.mouse_pos = Point2(mpos)
+        t.multiselect = multiselect
+
+    def box_selection_task(self, t):
+        if not base.mouseWatcherNode.is_button_down(MouseButton.one()):
+            # the release hasn't been handled, e.g. while a dialog was open
+            self.cancel_box_selection()
+            return t.done
+        if self.selction_mouse_watcher.hasMouse():
+            t.mouse_pos = Point2(self.selction_mouse_watcher.getMouse())
+        if (t.mouse_pos - t.start_mouse_pos).length() >= BOX_SELECTION_MIN_SIZE:
+            self.draw_box_selection(t.start_mouse_pos, t.mouse_pos)
+        return t.cont
+
+    def stop_box_selection(self):
+        tasks = taskMgr.getTasksNamed("box_selection_task")
+        if len(tasks) == 0: return
+        t = tasks[0]
+        taskMgr.remove("box_selection_task")
+        self.clear_box_selection()
+
+        if (t.mouse_pos - t.start_mouse_pos).length() < BOX_SELECTION_MIN_SIZE:
+            # a simple click, the pick already handled it
+            return
+        self.select_objects(
+            self.get_objects_in_rect(t.start_mouse_pos, t.mouse_pos),
+            t.multiselect)
+
+    def cancel_box_selection(self):
+        taskMgr.remove("box_selection_task")
+        self.clear_box_selection()
+
+    def draw_box_selection(self, corner_a, corner_b):
+        # the mouse positions are relative to the 3D display region
+        left, right, bottom, top = base.cam.node().get_display_region(0).get_dimensions()
+        corners = []
+        for x, y in [
+                (corner_a.x, corner_a.y),
+                (corner_b.x, corner_a.y),
+                (corner_b.x, corner_b.y),
+                (corner_a.x, corner_b.y),
+                (corner_a.x, corner_a.y)]:
+            corners.append(Point3(
+                (left + (x + 1) / 2 * (right - left)) * 2 - 1,
+                0,
+                (bottom + (y + 1) / 2 * (top - bottom)) * 2 - 1))
+
+        self.box_selection_np.unstash()
+        self.box_selection_line.reset()
+        self.box_selection_line.moveTo(corners[0])
+        for corner in corners[1:]:
+            self.box_selection_line.drawTo(corner)
+        self.box_selection_line.create()
+
+    def clear_box_selection(self):
+        self.box_selection_line.reset()
+        self.box_selection_np.stash()
+
+    def get_objects_in_rect(self, corner_a, corner_b):
+        """Returns all visible objects which are completely inside the
+        rectangle spanned by the two mouse positions"""
+        view_mat = self.scene_model_parent.get_mat(base.cam) \
+            * base.cam.node().get_lens().get_projection_mat()
+        objs = self.picking_engine.query_rect(
+            view_mat,
+            min(corner_a.x, corner_b.x),
+            min(corner_a.y, corner_b.y),
+            max(corner_a.x, corner_b.x),
+            max(corner_a.y, corner_b.y))
+        return [obj for obj in objs if self.__is_pickable(obj)]
+
+    def __is_pickable(self, obj):
+        if obj.is_hidden():
+            return False
+        np = obj
+        while not np.is_empty() and np != self.scene_model_parent:
+            if np.is_stashed():
+                return False
+            np = np.get_parent()
+        return True
 
     def update_selection_highlight_marker(self):
         self.selection_highlight_marker.setPos(self.get_selection_middle_point())
 
+    def mark_object_dirty(self, obj):
+        """Notify about an object whose transformation or geometry has
+        changed"""
+        self.picking_engine.mark_dirty(obj)
+        self.selection_bounds.mark_dirty(obj)
+        self.project_journal.mark_changed(obj)
+
     def select(self, obj, multiselect=False):
-        if obj in self.selected_objects and multiselect:
+        if obj in self.selection_bounds and multiselect:
             # deselect an already selected model
             self.deselect(obj)
 
@@ -71,6 +239,7 @@ class SelectionHandler:
             self.deselect_all()
 
         self.selected_objects += [obj]
+        self.selection_bounds.add(obj)
 
         self.selected_objects[-1].setColorScale(1, 0.8, 0.3, 1)
         for obj in self.selected_objects[:-1]:
@@ -81,17 +250,44 @@ class SelectionHandler:
         self.selection_highlight_marker.setPos(self.get_selection_middle_point())
         self.selection_highlight_marker.show()
 
-        base.messenger.send("update_structure")
+        base.messenger.send("update_structure_selection")
+        base.messenger.send("update_properties")
+
+    def select_objects(self, objs, multiselect=False):
+        """Selects all given objects at once, the panels will only be
+        updated one time"""
+        if not multiselect:
+            for obj in self.selected_objects:
+                obj.clearColorScale()
+            self.selected_objects = []
+            self.selection_bounds.clear()
+
+        for obj in objs:
+            if obj not in self.selection_bounds:
+                self.selection_bounds.add(obj)
+                self.selected_objects.append(obj)
+
+        if len(self.selected_objects) > 0:
+            for obj in self.selected_objects[:-1]:
+                obj.setColorScale(1, 1, 0.4, 1)
+            self.selected_objects[-1].setColorScale(1, 0.8, 0.3, 1)
+            self.selection_highlight_marker.setPos(self.get_selection_middle_point())
+            self.selection_highlight_marker.show()
+        else:
+            self.selection_highlight_marker.hide()
+
+        base.messenger.send("update_structure_selection")
         base.messenger.send("update_properties")
 
     def deselect(self, obj):
-        if obj not in self.selected_objects: return
+        if obj not in self.selection_bounds: return
         obj.clearColorScale()
         self.selected_objects.remove(obj)
+        self.selection_bounds.remove(obj)
         if len(self.selected_objects) == 0:
             self.selection_highlight_marker.hide()
 
-        base.messenger.send("update_structure")
+        base.messenger.send("update_structure_selection")
         base.messenger.send("update_properties")
         base.messenger.send("reregisterKeyboardAndMouseEvents")
 
@@ -101,8 +297,9 @@ class SelectionHandler:
         self.selection_highlight_marker.hide()
 
         self.selected_objects = []
+        self.selection_bounds.clear()
 
-        base.messenger.send("update_structure")
+        base.messenger.send("update_structure_selection")
         base.messenger.send("update_properties")
         base.messenger.send("reregisterKeyboardAndMouseEvents")
 
@@ -110,16 +307,17 @@ class SelectionHandler:
         if objs is None:
             objs = self.selected_objects[:]
 
-        for obj in objs:
-            self.deselect(obj)
+        with self.transaction("remove"):
+            for obj in objs:
+                self.deselect(obj)
 
-            if obj.get_tag("object_type") == "light":
-                self.scene_model_parent.clear_light(obj.find("+Light"))
+                if obj.get_tag("object_type") == "light":
+                    self.scene_model_parent.clear_light(obj.find("+Light"))
 
-            obj.stash()
-            if includeWithKillCycle:
-                base.messenger.send("addToKillRing",
-                    [obj, "kill", "element", None, None])
+                obj.stash()
+                if includeWithKillCycle:
+                    base.messenger.send("addToKillRing",
+                        [obj, "kill", "element", None, None])
 
         base.messenger.send("setDirtyFlag")
         base.messenger.send("update_structure")
@@ -142,31 +340,11 @@ class SelectionHandler:
             else:
                 obj.hide()
                 #self.deselect(obj)
+        self.picking_id_map.invalidate()
 
-        base.messenger.send("update_structure")
+        base.messenger.send("update_structure_rows", [objs])
 
     def get_selection_middle_point(self):
-        max_x = None
-        max_y = None
-        max_z = None
-        min_x = None
-        min_y = None
-        min_z = None
-        for obj in self.selected_objects:
-            if max_x is None:
-                max_x = obj.get_x()
-                max_y = obj.get_y()
-                max_z = obj.get_z()
-                min_x = obj.get_x()
-                min_y = obj.get_y()
-                min_z = obj.get_z()
-            else:
-                max_x = max(max_x, obj.get_x())
-                max_y = max(max_y, obj.get_y())
-                max_z = max(max_z, obj.get_z())
-                min_x = min(min_x, obj.get_x())
-                min_y = min(min_y, obj.get_y())
-                min_z = min(min_z, obj.get_z())
-
-        return Point3((min_x + max_x)/2, (min_y + max_y)/2, (min_z + max_z)/2)
-
+        """Returns the center of the bounds of all selected objects relative
+        to the scene root"""
+        return self.selection_bounds.get_middle_point()
@@ -0,0 +1,256 @@
+from panda3d.core import LVecBase3f, LVecBase4f, LRotation, Point3
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TransformEngine:
+    """Moves, rotates and scales a set of objects together.
+
+    Everything that doesn't change while dragging, like the transformations
+    between the objects parents, the camera and the lens, is calculated only
+    once. The new positions of all objects are calculated in one batch per
+    frame, using NumPy if it is available, and written back to the objects
+    afterwards.
+
+    When moving, objects which are below another one of the given objects
+    can be left out with skip_children, as they already follow their moved
+    parent. Rotating and scaling keep them, so every object is transformed
+    around its own origin. If the selection bounds
+    are given, the middle point of the moved objects can be calculated
+    without touching the objects again."""
+
+    def __init__(self, objects, selection_bounds=None, skip_children=False):
+        if skip_children:
+            selected = set(objects)
+            objects = [obj for obj in objects if not self.__has_selected_ancestor(obj, selected)]
+        self.objects = list(objects)
+
+        self.start_pos = [obj.get_pos() for obj in self.objects]
+        self.start_hpr = [obj.get_hpr() for obj in self.objects]
+        self.start_scale = [obj.get_scale() for obj in self.objects]
+
+        self.positions = [(p.x, p.y, p.z) for p in self.start_pos]
+        if numpy is not None:
+            self.positions = numpy.array(self.positions, dtype=float).reshape(-1, 3)
+        self.start_positions = self.positions
+
+        self.start_bounds = None
+        if selection_bounds is not None:
+            self.__init_bounds(selection_bounds)
+
+        self.camera_mat = None
+        self.projection_mat = None
+        self.to_clip = None
+        self.from_clip = None
+        # camera forward vector in the space of each objects parent
+        self.view_axes = None
+
+    def __has_selected_ancestor(self, obj, selected):
+        parent = obj.get_parent()
+        while not parent.is_empty():
+            if parent in selected:
+                return True
+            parent = parent.get_parent()
+        return False
+
+    def __init_bounds(self, selection_bounds):
+        """Stores the bounds of the objects at the start and the rotation
+        and scale from their parents to the bounds reference node, which
+        are needed to move the bounds along with the objects"""
+        reference = selection_bounds.reference
+        parent_mats = {}
+        mats = []
+        bounds_min = []
+        bounds_max = []
+        for obj in self.objects:
+            parent = obj.get_parent()
+            if parent not in parent_mats:
+                parent_mats[parent] = parent.get_mat(reference).get_upper_3()
+            mats.append(parent_mats[parent])
+            if obj in selection_bounds:
+                bounds = selection_bounds.get_object_bounds(obj)
+            else:
+                pos = obj.get_pos(reference)
+                bounds = ((pos.x, pos.y, pos.z), (pos.x, pos.y, pos.z))
+            bounds_min.append(bounds[0])
+            bounds_max.append(bounds[1])
+
+        if numpy is not None:
+            self.to_reference = numpy.array([self.__to_list(mat, 3) for mat in mats]).reshape(-1, 3, 3)
+            self.start_bounds = (
+                numpy.array(bounds_min, dtype=float).reshape(-1, 3),
+                numpy.array(bounds_max, dtype=float).reshape(-1, 3))
+        else:
+            self.to_reference = mats
+            self.start_bounds = (bounds_min, bounds_max)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __update_matrices(self):
+        """Calculates the transformations from the parent of each object to
+        the cameras clip space and back. These only need to be updated if the
+        camera has been moved."""
+        camera_mat = base.cam.get_mat(render)
+        lens = base.cam.node().get_lens()
+        projection_mat = lens.get_projection_mat()
+        if self.camera_mat is not None \
+                and camera_mat == self.camera_mat \
+                and projection_mat == self.projection_mat:
+            return
+        self.camera_mat = camera_mat
+        self.projection_mat = projection_mat
+        projection_mat_inv = lens.get_projection_mat_inv()
+
+        # many objects usually share the same parent
+        parent_mats = {}
+        to_clip = []
+        from_clip = []
+        view_axes = []
+        for obj in self.objects:
+            parent = obj.get_parent()
+            if parent not in parent_mats:
+                parent_mats[parent] = (
+                    parent.get_mat(base.cam) * projection_mat,
+                    projection_mat_inv * base.cam.get_mat(parent),
+                    parent.get_relative_vector(base.cam, (0, 1, 0)))
+            mats = parent_mats[parent]
+            to_clip.append(mats[0])
+            from_clip.append(mats[1])
+            view_axes.append(mats[2])
+        self.view_axes = view_axes
+
+        if numpy is not None:
+            self.to_clip = numpy.array([self.__to_list(mat, 4) for mat in to_clip]).reshape(-1, 4, 4)
+            self.from_clip = numpy.array([self.__to_list(mat, 4) for mat in from_clip]).reshape(-1, 4, 4)
+        else:
+            self.to_clip = to_clip
+            self.from_clip = from_clip
+
+    def __to_list(self, mat, size):
+        return [[mat.get_cell(row, col) for col in range(size)] for row in range(size)]
+
+    #
+    # MOVING
+    #
+    def move(self, mouse_delta, limit_axis=None):
+        """Moves all objects so their position on screen follows the mouse
+        movement. If an axis index is given, only that coordinate of the
+        objects is changed. Returns True if any object has moved."""
+        self.__update_matrices()
+        if numpy is not None:
+            new_positions = self.__move_numpy(mouse_delta, limit_axis)
+            if numpy.array_equal(new_positions, self.positions):
+                return False
+            self.positions = new_positions
+            positions = new_positions.tolist()
+        else:
+            positions = self.__move_python(mouse_delta, limit_axis)
+            if positions == self.positions:
+                return False
+            self.positions = positions
+
+        for obj, pos in zip(self.objects, positions):
+            obj.set_pos(pos[0], pos[1], pos[2])
+        return True
+
+    def __move_numpy(self, mouse_delta, limit_axis):
+        points = numpy.concatenate([self.positions, numpy.ones((len(self.objects), 1))], axis=1)
+        clip = numpy.einsum("ni,nij->nj", points, self.to_clip)
+        film = clip / clip[:, 3:4]
+        film[:, 0] += mouse_delta[0]
+        film[:, 1] += mouse_delta[1]
+        moved = numpy.einsum("ni,nij->nj", film, self.from_clip)
+        new_positions = moved[:, :3] / moved[:, 3:4]
+        if limit_axis is not None:
+            keep = [axis for axis in range(3) if axis != limit_axis]
+            new_positions[:, keep] = self.positions[:, keep]
+        return new_positions
+
+    def __move_python(self, mouse_delta, limit_axis):
+        new_positions = []
+        for i, pos in enumerate(self.positions):
+            clip = self.to_clip[i].xform(LVecBase4f(pos[0], pos[1], pos[2], 1))
+            film = clip / clip[3]
+            film[0] += mouse_delta[0]
+            film[1] += mouse_delta[1]
+            moved = self.from_clip[i].xform(film)
+            new_pos = [moved[axis] / moved[3] for axis in range(3)]
+            if limit_axis is not None:
+                for axis in range(3):
+                    if axis != limit_axis:
+                        new_pos[axis] = pos[axis]
+            new_positions.append(tuple(new_pos))
+        return new_positions
+
+    def get_middle_point(self):
+        """Returns the center of the bounds of the moved objects relative to
+        the selection bounds reference node"""
+        if self.start_bounds is None or len(self.objects) == 0:
+            return None
+        if numpy is not None:
+            offsets = numpy.einsum(
+                "ni,nij->nj", self.positions - self.start_positions, self.to_reference)
+            bounds_min = (self.start_bounds[0] + offsets).min(axis=0)
+            bounds_max = (self.start_bounds[1] + offsets).max(axis=0)
+            return Point3(*((bounds_min + bounds_max) / 2).tolist())
+
+        bounds_min = [float("inf")] * 3
+        bounds_max = [float("-inf")] * 3
+        for i, pos in enumerate(self.positions):
+            start = self.start_positions[i]
+            offset = self.to_reference[i].xform(LVecBase3f(
+                pos[0] - start[0], pos[1] - start[1], pos[2] - start[2]))
+            for axis in range(3):
+                bounds_min[axis] = min(bounds_min[axis], self.start_bounds[0][i][axis] + offset[axis])
+                bounds_max[axis] = max(bounds_max[axis], self.start_bounds[1][i][axis] + offset[axis])
+        return Point3(*[(bounds_min[axis] + bounds_max[axis]) / 2 for axis in range(3)])
+
+    def restore_pos(self):
+        for obj, pos in zip(self.objects, self.start_pos):
+            obj.set_pos(pos)
+        self.positions = self.start_positions
+
+    #
+    # ROTATING
+    #
+    def rotate(self, angles, limit_axis=None):
+        """Rotates each object by its angle in degrees around the view axis
+        of the camera, or if an axis index is given, around that axis"""
+        self.__update_matrices()
+        for i, obj in enumerate(self.objects):
+            if limit_axis is None:
+                obj.set_quat(LRotation(self.view_axes[i], angles[i]))
+            elif limit_axis == 0:
+                obj.set_p(angles[i])
+            elif limit_axis == 1:
+                obj.set_r(angles[i])
+            else:
+                obj.set_h(angles[i])
+
+    def restore_hpr(self):
+        for obj, hpr in zip(self.objects, self.start_hpr):
+            obj.set_hpr(hpr)
+
+    #
+    # SCALING
+    #
+    def scale(self, scale_diff, limit_axis=None):
+        """Adds the difference to the start scale of all objects, only to
+        the given axis if one is given"""
+        for obj, scale in zip(self.objects, self.start_scale):
+            if limit_axis is None:
+                obj.set_scale(scale.x + scale_diff, scale.y + scale_diff, scale.z + scale_diff)
+            elif limit_axis == 0:
+                obj.set_sx(scale.x + scale_diff)
+            elif limit_axis == 1:
+                obj.set_sy(scale.y + scale_diff)
+            else:
+                obj.set_sz(scale.z + scale_diff)
+
+    def restore_scale(self):
+        for obj, scale in zip(self.objects, self.start_scale):
+            obj.set_scale(scale)
@@ -5,9 +5,10 @@ from direct.directtools.DirectGeometry import LineNodePath
 from panda3d.core import (
     Point3,
     Point2,
-    LRotation,
     VBase4)
 
+from SceneEditor.core.TransformEngine import TransformEngine
+
 class TransformationHandler:
     def __init__(self):
         self.limiting_x = False
@@ -106,20 +107,28 @@ class TransformationHandler:
         self.center_line.reset()
         self.center_line_np.stash()
 
+    def get_limit_axis(self):
+        """Returns the index of the axis transformations are limited to or
+        None if they aren't limited"""
+        if self.limiting_x:
+            return 0
+        elif self.limiting_y:
+            return 1
+        elif self.limiting_z:
+            return 2
+        return None
+
     #
     # MOVING
     #
     def start_move_objects(self, objects):
         taskMgr.remove("move_objects_task")
         mpos = base.mouseWatcherNode.getMouse()
-        object_infos = {}
-        for obj in objects:
-            object_infos[obj] = obj.get_pos()
         t = taskMgr.add(self.move_objects_task, "move_objects_task")
-        t.object_infos = object_infos
+        t.engine = TransformEngine(objects, self.selection_bounds, skip_children=True)
         t.start_mouse_pos = Point2(mpos)
         t.has_moved = False
-        t.last_mouse_pos = mpos
+        t.last_mouse_pos = Point2(mpos)
 
     def move_objects_task(self, t):
         mwn = base.mouseWatcherNode
@@ -127,48 +136,18 @@ class TransformationHandler:
 
             mpos = base.mouseWatcherNode.getMouse()
 
-            for obj in t.object_infos.keys():
-
-                # check if the mouse has moved far enough from it's initial position
-                mouseMove = (t.start_mouse_pos - mpos)
-                if mouseMove.length() < 0.001:
-                    # we don't want the model to move yet
-                    return t.cont
-
-                # store the old position
-                oldPos = obj.get_pos()
-
-                # get the mouse movement for this frame
-                mouse_delta = t.last_mouse_pos - mpos
-                # get the model position in camera space
-                camspace_point = obj.get_pos(base.cam)
-                screenspace_point = Point3()
-                # get the position as it is seen on screen
-                base.cam.node().get_lens().project(camspace_point, screenspace_point)
-                # update the position according to the mouse movement
-                screenspace_point.xy -= mouse_delta
-                camspace_point = Point3()
-                # convert the screen position back to the 3D scene coordinates as seen by the camera
-                base.cam.node().get_lens().extrude_depth(screenspace_point, camspace_point)
-                # update the models position relative to the camera
-                pre_pos = obj.get_pos()
-                obj.set_pos(base.cam, camspace_point)
-                if self.limiting_x:
-                    obj.set_y(pre_pos.y)
-                    obj.set_z(pre_pos.z)
-                if self.limiting_y:
-                    obj.set_x(pre_pos.x)
-                    obj.set_z(pre_pos.z)
-                if self.limiting_z:
-                    obj.set_x(pre_pos.x)
-                    obj.set_y(pre_pos.y)
-
-                self.selection_highlight_marker.setPos(self.get_selection_middle_point())
-
-                # check if the item has actually moved
-                if oldPos != obj.get_pos():
-                    # model has moved, notice everyone interested about it
-                    t.has_moved = True
+            # check if the mouse has moved far enough from it's initial position
+            mouseMove = (t.start_mouse_pos - mpos)
+            if mouseMove.length() < 0.001:
+                # we don't want the model to move yet
+                return t.cont
+
+            # move all models by the mouse movement of this frame
+            mouse_delta = mpos - t.last_mouse_pos
+            if t.engine.move(mouse_delta, self.get_limit_axis()):
+                # model has moved, notice everyone interested about it
+                t.has_moved = True
+                self.selection_highlight_marker.setPos(t.engine.get_middle_point())
 
             # store the mouse position for the next frame
             t.last_mouse_pos = Point2(mpos)
@@ -181,10 +160,12 @@ class TransformationHandler:
             if not self.dirty:
                 self.dirty = True
                 base.messenger.send("setDirtyFlag")
-            for obj in t.object_infos.keys():
-                self.set_edited_tag(obj, "pos")
-                base.messenger.send("addToKillRing",
-                    [obj, "set", "pos", t.object_infos[obj], obj.get_pos()])
+            # all objects are moved back and forth in one undo step
+            with self.transaction("move"):
+                for obj, start_pos in zip(t.engine.objects, t.engine.start_pos):
+                    self.set_edited_tag(obj, "pos")
+                    base.messenger.send("addToKillRing",
+                        [obj, "set", "pos", start_pos, obj.get_pos()])
             base.messenger.send("update_properties")
 
         self.clear_limit()
@@ -194,8 +175,7 @@ class TransformationHandler:
     def cancel_move_objects(self):
         t = taskMgr.getTasksNamed("move_objects_task")[0]
 
-        for obj in t.object_infos.keys():
-            obj.set_pos(t.object_infos[obj])
+        t.engine.restore_pos()
 
         self.selection_highlight_marker.setPos(self.get_selection_middle_point())
 
@@ -210,27 +190,28 @@ class TransformationHandler:
     def start_rotate_objects(self, objects):
         taskMgr.remove("rotate_objects_task")
         mpos = base.mouseWatcherNode.getMouse()
-        object_infos = {}
+        engine = TransformEngine(objects)
+        start_degs = []
+        start_angles = []
 
         max_x = None
         max_y = None
         min_x = None
         min_y = None
 
-        for obj in objects:
+        lens = base.cam.node().get_lens()
+        dr = base.cam.node().get_display_region(0)
+        for obj in engine.objects:
 
             # get the model position in camera space
             camspace_point = obj.get_pos(base.cam)
             screenspace_point = Point3()
             # get the position as it is seen on screen
-            base.cam.node().get_lens().project(camspace_point, screenspace_point)
+            lens.project(camspace_point, screenspace_point)
 
-            dr = base.cam.node().get_display_region(0)
             x = (screenspace_point.x - mpos.x) + dr.dimensions[0]
             y = (screenspace_point.y - mpos.y) - (1 - dr.dimensions[3])
 
-            #print(f"DR: {(1 - dr.dimensions[3])}")
-
             rad = -math.atan2(y, x)
             deg = rad * (180 / math.pi)
 
@@ -245,84 +226,64 @@ class TransformationHandler:
                 min_x = min(min_x, screenspace_point.x)
                 min_y = min(min_y, screenspace_point.y)
 
-            object_infos[obj] = [
-                deg,
-                obj.get_quat().getAngle(),
-                obj.get_hpr()
-                ]
+            start_degs.append(deg)
+            start_angles.append(obj.get_quat().getAngle())
         t = taskMgr.add(self.rotate_objects_task, "rotate_objects_task")
-        t.object_infos = object_infos
+        t.engine = engine
+        t.start_degs = start_degs
+        t.start_angles = start_angles
         t.has_rotated = False
         t.start_mouse_pos = Point2(mpos)
-        t.last_mouse_pos = mpos
+        t.last_mouse_pos = Point2(mpos)
         t.middle = Point2((min_x + max_x)/2, (min_y + max_y)/2)
 
     def rotate_objects_task(self, t):
         mwn = base.mouseWatcherNode
-        if mwn.hasMouse():
+        if mwn.hasMouse() and len(t.engine) > 0:
 
             mpos = base.mouseWatcherNode.getMouse()
 
-            for obj in t.object_infos.keys():
-
-                # check if the mouse has moved far enough from it's initial position
-                mouseMove = (t.start_mouse_pos - mpos)
-                if mouseMove.length() < 0.001:
-                    # we don't want the model to move yet
-                    return t.cont
-
-                # store the old position
-                old_hpr = obj.get_hpr()
-
-                dr = base.cam.node().get_display_region(0)
-                # rotate mouse around the middle point of all models
-                x = (t.middle.x - mpos.x) + dr.dimensions[0]
-                y = (t.middle.y - mpos.y) - (1 - dr.dimensions[3])
-                rad = -math.atan2(y, x)
-                deg = rad * (180 / math.pi)
+            # check if the mouse has moved far enough from it's initial position
+            mouseMove = (t.start_mouse_pos - mpos)
+            if mouseMove.length() < 0.001:
+                # we don't want the model to move yet
+                return t.cont
 
-                # subtract the start hpr so we always start at 0 where the mouse is at first
-                deg -= t.object_infos[obj][0]
-                # get the models start hpr so it won't be reset to a hpr of 0
-                hpr = t.object_infos[obj][1]
-
-                if not (self.limiting_x or self.limiting_y or self.limiting_z):
-                    obj.set_quat(LRotation(obj.parent.get_relative_vector(base.cam, (0,1,0)), deg-hpr))
-                elif self.limiting_x:
-                    obj.set_p(deg-hpr)
-                elif self.limiting_y:
-                    obj.set_r(deg-hpr)
-                elif self.limiting_z:
-                    obj.set_h(deg+hpr)
-
-
-
-
-
-                # get the model position in camera space
-                camspace_point = obj.get_pos(base.cam)
-                screenspace_point = Point3()
-                # get the position as it is seen on screen
-                base.cam.node().get_lens().project(camspace_point, screenspace_point)
-
-                x = screenspace_point.x - t.middle.x
-                y = screenspace_point.y - t.middle.y
-                point_a = Point3(x, screenspace_point.z, y)
-                #*base.win.get_size()[0]/2
-
-                x = screenspace_point.x - mpos.x
-                y = screenspace_point.y - mpos.y
+            dr = base.cam.node().get_display_region(0)
+            # rotate mouse around the middle point of all models
+            x = (t.middle.x - mpos.x) + dr.dimensions[0]
+            y = (t.middle.y - mpos.y) - (1 - dr.dimensions[3])
+            rad = -math.atan2(y, x)
+            deg = rad * (180 / math.pi)
 
-                point_b = Point3(x, screenspace_point.z, y)
-                print(point_b)
+            limit_axis = self.get_limit_axis()
+            angles = []
+            for start_deg, start_angle in zip(t.start_degs, t.start_angles):
+                # subtract the start hpr so we always start at 0 where the
+                # mouse is at first and add the models start rotation so it
+                # won't be reset to a hpr of 0
+                if limit_axis == 2:
+                    angles.append(deg - start_deg + start_angle)
+                else:
+                    angles.append(deg - start_deg - start_angle)
+            t.engine.rotate(angles, limit_axis)
+            t.has_rotated = True
+
+            # get the last model position in camera space
+            camspace_point = t.engine.objects[-1].get_pos(base.cam)
+            screenspace_point = Point3()
+            # get the position as it is seen on screen
+            base.cam.node().get_lens().project(camspace_point, screenspace_point)
 
-                self.draw_center_line(point_a, point_b)
+            x = screenspace_point.x - t.middle.x
+            y = screenspace_point.y - t.middle.y
+            point_a = Point3(x, screenspace_point.z, y)
 
+            x = screenspace_point.x - mpos.x
+            y = screenspace_point.y - mpos.y
+            point_b = Point3(x, screenspace_point.z, y)
 
-                # check if the item has actually moved
-                if old_hpr != obj.get_hpr():
-                    # model has moved, notice everyone interested about it
-                    t.has_rotated = True
+            self.draw_center_line(point_a, point_b)
 
             # store the mouse position for the next frame
             t.last_mouse_pos = Point2(mpos)
@@ -335,10 +296,11 @@ class TransformationHandler:
             if not self.dirty:
                 self.dirty = True
                 base.messenger.send("setDirtyFlag")
-            for obj in t.object_infos.keys():
-                self.set_edited_tag(obj, "hpr")
-                base.messenger.send("addToKillRing",
-                    [obj, "set", "hpr", t.object_infos[obj][2], obj.get_hpr()])
+            with self.transaction("rotate"):
+                for obj, start_hpr in zip(t.engine.objects, t.engine.start_hpr):
+                    self.set_edited_tag(obj, "hpr")
+                    base.messenger.send("addToKillRing",
+                        [obj, "set", "hpr", start_hpr, obj.get_hpr()])
             base.messenger.send("update_properties")
 
         self.clear_limit()
@@ -348,8 +310,7 @@ class TransformationHandler:
     def cancel_rotate_objects(self):
         t = taskMgr.getTasksNamed("rotate_objects_task")[0]
 
-        for obj in t.object_infos.keys():
-            obj.set_hpr(t.object_infos[obj][2])
+        t.engine.restore_hpr()
 
         self.clear_limit()
 
@@ -362,22 +323,22 @@ class TransformationHandler:
     def start_scale_objects(self, objects):
         taskMgr.remove("scale_objects_task")
         mpos = base.mouseWatcherNode.getMouse()
-        object_infos = {}
+        engine = TransformEngine(objects)
 
         max_x = None
         max_y = None
         min_x = None
         min_y = None
 
-        for obj in objects:
+        lens = base.cam.node().get_lens()
+        dr = base.cam.node().get_display_region(0)
+        for obj in engine.objects:
 
             # get the model position in camera space
             camspace_point = obj.get_pos(base.cam)
             screenspace_point = Point3()
             # get the position as it is seen on screen
-            base.cam.node().get_lens().project(camspace_point, screenspace_point)
-
-            dr = base.cam.node().get_display_region(0)
+            lens.project(camspace_point, screenspace_point)
 
             if max_x is None:
                 max_x = screenspace_point.x + dr.dimensions[0]
@@ -390,14 +351,14 @@ class TransformationHandler:
                 min_x = min(min_x, screenspace_point.x + dr.dimensions[0])
                 min_y = min(min_y, screenspace_point.y - (1 - dr.dimensions[3]))
 
-            object_infos[obj] = [
-                obj.get_scale()
-                ]
         t = taskMgr.add(self.scale_objects_task, "scale_objects_task")
-        t.object_infos = object_infos
+        t.engine = engine
         t.has_scaled = False
         t.start_mouse_pos = Point2(mpos)
-        t.middle = Point2((min_x + max_x)/2, (min_y + max_y)/2)
+        if max_x is None:
+            t.middle = Point2(mpos)
+        else:
+            t.middle = Point2((min_x + max_x)/2, (min_y + max_y)/2)
         t.start_distance = (t.middle - mpos).length()
 
     def scale_objects_task(self, t):
@@ -406,41 +367,17 @@ class TransformationHandler:
 
             mpos = base.mouseWatcherNode.getMouse()
 
+            # check if the mouse has moved far enough from it's initial position
+            mouseMove = (t.start_mouse_pos - mpos)
+            if mouseMove.length() < 0.001:
+                # we don't want the model to move yet
+                return t.cont
+
             scale_diff = (t.middle - mpos).length() - t.start_distance
             scale_diff *= 1.2
 
-            for obj in t.object_infos.keys():
-
-                # check if the mouse has moved far enough from it's initial position
-                mouseMove = (t.start_mouse_pos - mpos)
-                if mouseMove.length() < 0.001:
-                    # we don't want the model to move yet
-                    return t.cont
-
-                # store the old position
-                old_scale = obj.get_scale()
-
-                # get the models start scale
-                scale = t.object_infos[obj][0]
-
-                new_x_scale = scale.x + scale_diff
-                new_y_scale = scale.y + scale_diff
-                new_z_scale = scale.z + scale_diff
-
-                if not (self.limiting_x or self.limiting_y or self.limiting_z):
-                    obj.set_scale(new_x_scale,new_y_scale,new_z_scale)
-                elif self.limiting_x:
-                    obj.set_sx(new_x_scale)
-                elif self.limiting_y:
-                    obj.set_sy(new_y_scale)
-                elif self.limiting_z:
-                    obj.set_sz(new_z_scale)
-
-
-                # check if the item has actually moved
-                if old_scale != obj.get_scale():
-                    # model has moved, notice everyone interested about it
-                    t.has_scaled = True
+            t.engine.scale(scale_diff, self.get_limit_axis())
+            t.has_scaled = True
 
         return t.cont
 
@@ -451,10 +388,11 @@ class TransformationHandler:
             if not self.dirty:
                 self.dirty = True
                 base.messenger.send("setDirtyFlag")
-            for obj in t.object_infos.keys():
-                self.set_edited_tag(obj, "scale")
-                base.messenger.send("addToKillRing",
-                    [obj, "set", "scale", t.object_infos[obj][0], obj.get_scale()])
+            with self.transaction("scale"):
+                for obj, start_scale in zip(t.engine.objects, t.engine.start_scale):
+                    self.set_edited_tag(obj, "scale")
+                    base.messenger.send("addToKillRing",
+                        [obj, "set", "scale", start_scale, obj.get_scale()])
             base.messenger.send("update_properties")
 
         self.clear_limit()
@@ -464,10 +402,8 @@ class TransformationHandler:
     def cancel_scale_objects(self):
         t = taskMgr.getTasksNamed("scale_objects_task")[0]
 
-        for obj in t.object_infos.keys():
-            obj.set_scale(t.object_infos[obj][0])
+        t.engine.restore_scale()
 
         self.clear_limit()
 
         taskMgr.remove("scale_objects_task")
-
@@ -0,0 +1,236 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = "Fireclaw the Fox"
+__license__ = """
+Simplified BSD (BSD 2-Clause) License.
+See License.txt or http://opensource.org/licenses/BSD-2-Clause for more info
+"""
+
+import logging
+
+from panda3d.core import (
+    ConfigVariableBool,
+    ConfigVariableInt,
+    NodePath,
+    Camera)
+
+from SceneEditor.export.BamSceneOptimizer import BamSceneOptimizer
+
+# objects which carry editor only helper geometry, only their light or
+# camera node and the scene objects below them are exported
+HELPER_OBJECT_TYPES = ["empty", "light", "camera"]
+
+
+class BamExportPipeline:
+    """Builds the scene graph which is written to a bam file from the editor
+    scene.
+
+    Only nodes which have to differ from the editor scene, the scene objects
+    and the nodes above them, are created for the export. Everything else,
+    like the geometry of models, is shared with the editor scene. Shared
+    nodes are attached to the export graph only while the file is being
+    written, so the editor scene is never seen with nodes that have two
+    parents.
+
+    The graph is built one scene object at a time, when streaming is
+    enabled a few objects per frame with progress being reported through
+    the loading_progress event."""
+
+    def __init__(self, scene_root, scene_objects):
+        self.scene_root = scene_root
+        self.scene_objects = scene_objects
+
+        self.streaming = ConfigVariableBool("scene-editor-streaming-bam-export", True).getValue()
+        self.objects_per_frame = max(1, ConfigVariableInt(
+            "scene-editor-bam-export-objects-per-frame", 200).getValue())
+        # merge static objects before writing, see BamSceneOptimizer
+        self.optimize = ConfigVariableBool("scene-editor-bam-export-optimize", False).getValue()
+
+        self.export_root = None
+        # copy of the scene root in the export graph
+        self.root_copy = None
+        # export node path -> editor nodes exported unchanged below it
+        self.shared = {}
+        # scene object -> node path in the export graph
+        self.exported = {}
+        # editor light node path -> exported light node path
+        self.lights = {}
+        # scene objects to be exported and nodes which have scene objects
+        # below them, these can't be shared with the editor scene
+        self.objects = set()
+        self.object_ancestors = set()
+
+        self.steps = None
+        self.done = 0
+        self.total = 0
+        self.finished = False
+
+    #
+    # BUILDING
+    #
+    def build_steps(self):
+        """Generator building the export graph, yields the number of exported
+        and total scene objects after each object"""
+        self.export_root = NodePath("export_root")
+        self.shared = {}
+        self.exported = {}
+        self.lights = {}
+        self.done = 0
+        self.finished = False
+
+        # stashed objects aren't exported, but the nodes above them still
+        # can't be shared as the stashed nodes would be written with them
+        self.objects = set(
+            obj for obj in self.scene_root.find_all_matches("**/=scene_object_id")
+            if obj in self.scene_objects)
+        self.object_ancestors = set()
+        for obj in self.scene_root.find_all_matches("**/=scene_object_id;+s"):
+            if obj not in self.scene_objects:
+                continue
+            parent = obj.get_parent()
+            while not parent.is_empty() and parent not in self.object_ancestors:
+                self.object_ancestors.add(parent)
+                if parent == self.scene_root:
+                    break
+                parent = parent.get_parent()
+        self.total = len(self.objects)
+
+        self.root_copy = self.export_root.attach_new_node(self.scene_root.node().make_copy())
+        for child in self.scene_root.get_children():
+            yield from self.__export_node(child, self.root_copy)
+        self.__remap_lights(self.root_copy)
+        self.finished = True
+
+    def build(self):
+        """Builds the complete export graph at once"""
+        for _ in self.build_steps():
+            pass
+        return self.export_root
+
+    def __export_node(self, np, export_parent):
+        if np not in self.objects and np not in self.object_ancestors:
+            # nothing to change below this node
+            self.shared.setdefault(export_parent, []).append(np.node())
+            return
+
+        object_type = np.get_tag("object_type") if np in self.objects else ""
+        if object_type == "empty":
+            # replace the visible axis with an empty NodePath
+            export_np = export_parent.attach_new_node(np.get_name())
+            export_np.set_transform(np.get_transform())
+
+        elif object_type == "camera":
+            # create a camera in place of the dummy camera in the scene
+            cam = np.find("+Camera")
+            lens = cam.node().get_lens().make_copy()
+            export_np = export_parent.attach_new_node(Camera(np.get_name(), lens))
+            export_np.set_transform(np.get_transform())
+
+        else:
+            export_np = export_parent.attach_new_node(np.node().make_copy())
+            if object_type == "collision":
+                export_np.hide()
+
+        for child in np.get_children():
+            if object_type in HELPER_OBJECT_TYPES \
+            and child not in self.objects \
+            and child not in self.object_ancestors:
+                if object_type == "light" and child.node().as_light() is not None:
+                    # keep the light but drop its lens visualization
+                    self.lights[child] = export_np.attach_new_node(child.node().make_copy())
+                continue
+            yield from self.__export_node(child, export_np)
+
+        if np in self.objects:
+            self.exported[np] = export_np
+            self.done += 1
+            yield self.done, self.total
+
+    def __remap_lights(self, root_copy):
+        """The copied root still lights the scene with the editors light
+        nodes, switch them to the exported ones"""
+        root_copy.clear_light()
+        for light_np, export_light_np in self.lights.items():
+            if self.scene_root.has_light(light_np):
+                root_copy.set_light(export_light_np)
+
+    def unshare(self, export_np):
+        """Replaces the editor nodes shared below the given export node with
+        copies, so they can be changed without touching the editor scene"""
+        for child in self.shared.pop(export_np, []):
+            export_np.node().add_child(child.copy_subgraph())
+
+    #
+    # WRITING
+    #
+    def write(self, path):
+        """Writes the export graph to the given bam file, building it first if
+        that hasn't been done yet. Returns True on success."""
+        if not self.finished:
+            self.build()
+
+        if self.optimize:
+            optimizer = BamSceneOptimizer(self)
+            optimizer.optimize()
+            optimizer.write_report(path)
+
+        for parent, children in self.shared.items():
+            for child in children:
+                parent.node().add_child(child)
+        try:
+            success = self.export_root.write_bam_file(path)
+        finally:
+            for parent, children in self.shared.items():
+                for child in children:
+                    parent.node().remove_child(child)
+
+        if not success:
+            logging.error(f"Couldn't write bam file {path}")
+        return success
+
+    def export(self, path, callback=None):
+        """Builds the export graph and writes it to the given path, over the
+        next frames if streaming is enabled. The optional callback is called
+        with the path and whether writing succeeded once done."""
+        if not self.streaming:
+            success = self.write(path)
+            self.destroy()
+            if callback is not None:
+                callback(path, success)
+            return
+
+        self.steps = self.build_steps()
+        base.taskMgr.add(
+            self.__export_task,
+            "SceneEditor_bam_export",
+            extraArgs=[path, callback],
+            appendTask=True)
+
+    def __export_task(self, path, callback, task):
+        for _ in range(self.objects_per_frame):
+            try:
+                next(self.steps)
+            except StopIteration:
+                break
+        if not self.finished:
+            base.messenger.send("loading_progress", [self.done, self.total, "Exporting scene"])
+            return task.cont
+
+        success = self.write(path)
+        base.messenger.send("loading_progress", [1, 1, ""])
+        self.destroy()
+        if callback is not None:
+            callback(path, success)
+        return task.done
+
+    def destroy(self):
+        self.steps = None
+        self.shared = {}
+        self.exported = {}
+        self.lights = {}
+        self.objects = set()
+        self.object_ancestors = set()
+        if self.export_root is not None:
+            self.export_root.remove_node()
+            self.export_root = None
+            self.root_copy = None
@@ -0,0 +1,149 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = "Fireclaw the Fox"
+__license__ = """
+Simplified BSD (BSD 2-Clause) License.
+See License.txt or http://opensource.org/licenses/BSD-2-Clause for more info
+"""
+
+import os
+import math
+import time
+import logging
+
+from panda3d.core import (
+    ConfigVariableBool,
+    ConfigVariableDouble)
+
+from SceneEditor.tools.PropertyCodec import is_tag_enabled
+
+# objects with this tag set, or placed below one with it, are left as they
+# are, e.g. props which will be moved by the game
+KEEP_DYNAMIC_TAG = "keep_dynamic"
+
+# tags which are only used by the editor itself
+EDITOR_TAGS = ["scene_object_id", "edited_properties", "model_loading", KEEP_DYNAMIC_TAG]
+
+# objects below these will be moved at runtime
+DYNAMIC_PARENT_TYPES = ["physics", "camera"]
+
+
+class BamSceneOptimizer:
+    """Reduces the nodes and geoms of an export graph built by the
+    BamExportPipeline to lower the draw calls of the exported scene.
+
+    Static models are grouped into cells of a regular grid by their position.
+    Their transforms and states are moved onto the models, which are then
+    flattened per cell, so models sharing the same state end up in as few
+    geoms as possible. The geometry of merged models is copied from the
+    editor scene first. All other objects only lose their editor tags."""
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.cell_size = ConfigVariableDouble("scene-editor-bam-export-cell-size", 50).getValue()
+        self.write_reports = ConfigVariableBool("scene-editor-bam-export-optimization-report", True).getValue()
+
+        # (nodes, geoms) of the export graph
+        self.before = (0, 0)
+        self.after = (0, 0)
+        self.num_static = 0
+        self.num_dynamic = 0
+        self.num_cells = 0
+        self.time = 0
+
+    def is_static(self, obj):
+        """Returns True if the object can be merged with others"""
+        if obj.get_tag("object_type") != "model" \
+        or obj in self.pipeline.object_ancestors \
+        or obj.is_hidden():
+            return False
+        if is_tag_enabled(obj.get_net_tag(KEEP_DYNAMIC_TAG)):
+            return False
+        if not obj.find("**/+Character").is_empty():
+            # animated models can't be flattened
+            return False
+        parent = obj.get_parent()
+        while not parent.is_empty() and parent != self.pipeline.scene_root:
+            if parent.get_tag("object_type") in DYNAMIC_PARENT_TYPES:
+                return False
+            parent = parent.get_parent()
+        return True
+
+    def optimize(self):
+        start = time.perf_counter()
+        self.before = self.count_graph()
+        root = self.pipeline.root_copy
+
+        # cell index -> export node paths of the static objects in it
+        cells = {}
+        for obj, export_np in self.pipeline.exported.items():
+            if self.is_static(obj):
+                pos = export_np.get_pos(root)
+                cell = tuple(int(math.floor(value / self.cell_size)) for value in pos)
+                cells.setdefault(cell, []).append(export_np)
+            else:
+                self.num_dynamic += 1
+                for tag in EDITOR_TAGS:
+                    export_np.clear_tag(tag)
+
+        for cell, nps in cells.items():
+            cell_np = root.attach_new_node("static_cell_{}_{}_{}".format(*cell))
+            for np in nps:
+                transform = np.get_transform(root)
+                state = np.get_state(root)
+                self.pipeline.unshare(np)
+                np.reparent_to(cell_np)
+                np.set_transform(transform)
+                np.set_state(state)
+                # tags keep nodes from being flattened
+                for tag in np.get_tag_keys():
+                    np.clear_tag(tag)
+            # flattening stops at model roots, each model would keep its
+            # own geoms
+            cell_np.clear_model_nodes()
+            cell_np.flatten_strong()
+            self.num_static += len(nps)
+        self.num_cells = len(cells)
+
+        self.after = self.count_graph()
+        self.time = time.perf_counter() - start
+        logging.info(
+            f"Optimized export scene, nodes: {self.before[0]} -> {self.after[0]}, "
+            f"geoms: {self.before[1]} -> {self.after[1]}")
+
+    def count_graph(self):
+        """Returns the number of nodes and geoms which will be written,
+        including the nodes shared with the editor scene"""
+        nodes = 0
+        geoms = 0
+        stack = [self.pipeline.export_root.node()]
+        export_nps = [self.pipeline.export_root]
+        while export_nps:
+            np = export_nps.pop()
+            export_nps.extend(np.get_children())
+            stack.extend(self.pipeline.shared.get(np, []))
+        while stack:
+            node = stack.pop()
+            nodes += 1
+            if node.is_geom_node():
+                geoms += node.get_num_geoms()
+            stack.extend(node.get_children())
+        return nodes, geoms
+
+    def write_report(self, path):
+        if not self.write_reports: return
+        report_path = os.path.splitext(path)[0] + "_optimization.txt"
+        lines = [
+            f"Scene optimization report for {path}",
+            f"nodes: {self.before[0]} -> {self.after[0]}",
+            f"geoms: {self.before[1]} -> {self.after[1]}",
+            f"static objects merged: {self.num_static} in {self.num_cells} cells of size {self.cell_size}",
+            f"objects kept: {self.num_dynamic}",
+            f"time: {self.time:0.3f}s",
+        ]
+        try:
+            with open(report_path, "w") as outfile:
+                outfile.write("\n".join(lines) + "\n")
+        except OSError as e:
+            logging.error(f"Couldn't write optimization report {report_path}")
+            logging.exception(e)
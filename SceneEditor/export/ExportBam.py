@@ -15,21 +15,21 @@ from direct.gui.DirectDialog import YesNoDialog
 from panda3d.core import LVecBase2f, LVecBase3f, LVecBase4f, LPoint2f, LPoint3f, LPoint4f, LVector3f
 from panda3d.core import LVecBase2, LVecBase3, LVecBase4, LPoint2, LPoint3, LPoint4
 from panda3d.core import LPlane
-from panda3d.core import NodePath
-from panda3d.core import Camera, OrthographicLens, PerspectiveLens
 
 from DirectFolderBrowser.DirectFolderBrowser import DirectFolderBrowser
 
-class ExporterBam:
-    def __init__(self, save_path, save_file, scene_root, scene_objects, tooltip):
-        # create a new NP which will be written out to the bam file
-        self.export_scene_np = NodePath("export_root")
+from SceneEditor.export.BamExportPipeline import BamExportPipeline
 
-        # copy the existing scene to our new NP
-        scene_root.copy_to(self.export_scene_np)
+class ExporterBam:
+    def __init__(self, save_path, save_file, scene_root, scene_objects, tooltip, direct_save=False):
+        # the scene is only processed once a path has been chosen
+        self.pipeline = BamExportPipeline(scene_root, scene_objects)
 
-        # clean up the copied scene from parts it shouldn't export
-        self.cleanup_np(self.export_scene_np)
+        if direct_save:
+            # no need to ask for the path, e.g. when exporting headless
+            self.pipeline.streaming = False
+            self.pipeline.export(os.path.join(save_path, save_file))
+            return
 
         self.browser = DirectFolderBrowser(
             self.save,
@@ -40,47 +40,6 @@ class ExporterBam:
             tooltip)
         self.browser.show()
 
-    def cleanup_np(self, root_np):
-        if root_np.get_tag("object_type") == "empty":
-            # replace the visible axis with an empty NodePath
-            name = root_np.get_name()
-            pos = root_np.get_pos()
-            hpr = root_np.get_hpr()
-            parent = root_np.get_parent()
-
-            empty = NodePath(name)
-            empty.set_pos(pos)
-            empty.set_hpr(hpr)
-            empty.reparent_to(parent)
-
-            for child in list(root_np.get_children())[1:]:
-                child.reparent_to(empty)
-
-            root_np.remove_node()
-            root_np = empty
-
-        elif root_np.get_tag("object_type") == "collision":
-            root_np.hide()
-
-        elif root_np.get_tag("object_type") == "light":
-            # remove the light representation model
-            root_np.get_children()[0].remove_node()
-
-        elif root_np.get_tag("object_type") == "camera":
-            # create a camera and remove the dummy camera in the scene
-            lens = None
-            if root_np.get_tag("camera_type") == "PerspectiveLens":
-                lens = PerspectiveLens()
-            else:
-                lens = OrthographicLens()
-            cam = Camera(root_np.get_name(), lens)
-            cam_np = root_np.get_parent().attach_new_node(cam)
-            root_np.remove_node()
-            root_np = cam_np
-
-        for child in root_np.get_children():
-            self.cleanup_np(child)
-
     def save(self, doSave):
         if doSave:
             self.dlgOverwrite = None
@@ -119,4 +78,4 @@ class ExporterBam:
         if self.dlgOverwrite is not None: self.dlgOverwrite.destroy()
         if self.dlgOverwriteShadow is not None: self.dlgOverwriteShadow.destroy()
         if not overwrite: return
-        self.export_scene_np.writeBamFile(path)
+        self.pipeline.export(path)
@@ -7,23 +7,28 @@ See License.txt or http://opensource.org/licenses/BSD-2-Clause for more info
 """
 
 import os
-import json
 import logging
-import tempfile
+from uuid import uuid4
 
 from direct.gui import DirectGuiGlobals as DGG
 from direct.gui.DirectFrame import DirectFrame
 from direct.gui.DirectDialog import YesNoDialog
 
 from SceneEditor.tools.JSONTools import JSONTools
+from SceneEditor.tools.ProjectFiles import project_to_bytes, write_atomic
+from SceneEditor.tools.AutosaveService import get_autosave_path, get_exception_save_path
+
+from panda3d.core import ConfigVariableBool
 
 from DirectFolderBrowser.DirectFolderBrowser import DirectFolderBrowser
 
 class ExporterProject:
-    def __init__(self, save_path, save_file, scene_root, scene_objects, exceptionSave=False, autosave=False, tooltip=None):
+    def __init__(self, save_path, save_file, scene_root, scene_objects, exceptionSave=False, autosave=False, tooltip=None, journal=None, direct_save=False):
         self.objects = scene_objects
         self.scene_root = scene_root
         self.isAutosave = False
+        # only regular saves are journaled
+        self.journal = None if exceptionSave or autosave else journal
 
         if exceptionSave:
             self.excSave()
@@ -34,6 +39,13 @@ class ExporterProject:
             self.autoSave(os.path.join(save_path, save_file))
             return
 
+        if direct_save:
+            # save to the given path right away, e.g. from the headless editor
+            self.dlgOverwrite = None
+            self.dlgOverwriteShadow = None
+            self.__executeSave(True, os.path.join(save_path, save_file))
+            return
+
 
         self.browser = DirectFolderBrowser(
             self.save,
@@ -47,7 +59,7 @@ class ExporterProject:
         self.dlgOverwrite = None
         self.dlgOverwriteShadow = None
 
-        tmpPath = os.path.join(tempfile.gettempdir(), "SEExceptionSave.scene")
+        tmpPath = get_exception_save_path()
         self.__executeSave(True, tmpPath)
         logging.info("Wrote crash session file to {}".format(tmpPath))
 
@@ -55,7 +67,7 @@ class ExporterProject:
         self.dlgOverwrite = None
         self.dlgOverwriteShadow = None
         if fileName == "":
-            fileName = os.path.join(tempfile.gettempdir(), "SEAutosave.scene")
+            fileName = get_autosave_path()
         self.__executeSave(True, fileName)
         logging.info("Wrote autosave file to {}".format(fileName))
 
@@ -98,10 +110,28 @@ class ExporterProject:
         if self.dlgOverwriteShadow is not None: self.dlgOverwriteShadow.destroy()
         if not overwrite: return
 
+        if self.journal is not None and self.journal.can_commit(path):
+            # only the changes since the last save need to be written
+            self.journal.commit()
+            logging.info(f"Committed changes to journal {self.journal.get_path()}")
+            base.messenger.send("clearDirtyFlag")
+            return
+
+        snapshot_id = None
+        if self.journal is not None:
+            snapshot_id = uuid4().hex
+
         jsonTools = JSONTools()
-        jsonElements = jsonTools.getProjectJSON(self.objects, self.scene_root)
-        with open(path, 'w') as outfile:
-            json.dump(jsonElements, outfile, indent=2)
+        jsonElements = jsonTools.getProjectJSON(self.objects, self.scene_root, snapshot_id)
+        # the old file stays intact if writing fails
+        write_atomic(path, project_to_bytes(
+            jsonElements,
+            path,
+            ConfigVariableBool("scene-editor-project-compression", True).getValue()))
+
+        if self.journal is not None:
+            # changes will be journaled relative to the new file
+            self.journal.start(path, snapshot_id)
 
         if not self.isAutosave:
             base.messenger.send("clearDirtyFlag")
@@ -7,6 +7,7 @@ See License.txt or http://opensource.org/licenses/BSD-2-Clause for more info
 """
 
 import os
+import struct
 import logging
 from panda3d.core import ConfigVariableBool
 from direct.gui import DirectGuiGlobals as DGG
@@ -18,13 +19,84 @@ from panda3d.core import LPlane, LPlanef
 
 from DirectFolderBrowser.DirectFolderBrowser import DirectFolderBrowser
 
+from SceneEditor.tools.PropertyCodec import parse_literal
+
+EXPORTED_OBJECT_TYPES = ["model", "empty", "collision", "physics", "light", "camera"]
+
 class ExporterPy:
-    def __init__(self, save_path, save_file, scene_root, scene_objects, tooltip):
+    """Writes the scene as a python module containing a Scene class.
+
+    The code is collected as a list of lines and joined once. Objects which
+    are created the same way, like models and empty nodes, are written as
+    data tables the Scene class walks through when it's created. Each model
+    file is loaded only once and copied for every object using it."""
+
+    def __init__(self, save_path, save_file, scene_root, scene_objects, tooltip, direct_save=False):
         self.objects = scene_objects
+        self.lines = []
+        self.used_names = set()
 
-        self.content = "#!/usr/bin/python\n"
-        self.content += "# -*- coding: utf-8 -*-\n"
-        self.content += "# This file was created using the Scene Editor\n\n"
+        self.write_header()
+        self.write_scene(scene_root)
+        self.content = "\n".join(self.lines) + "\n"
+
+        if direct_save:
+            # no need to ask for the path, e.g. when exporting headless
+            self.write(os.path.join(save_path, save_file))
+            return
+
+        self.browser = DirectFolderBrowser(
+            self.save,
+            True,
+            save_path,
+            save_file,
+            [".py"],
+            tooltip)
+        self.browser.show()
+
+        #self.dlgPathSelect = PathSelect(
+        #    self.save, "Save Python File", "Save file path", "Save", saveFile, tooltip)
+
+    #
+    # CODE EMITTING
+    #
+    def emit(self, line="", indent=0):
+        self.lines.append(" "*4*indent + line if line else "")
+
+    def emit_table(self, name, rows, indent=1):
+        """Writes a tuple class attribute with one row per line"""
+        if len(rows) == 0:
+            self.emit(f"{name} = ()", indent)
+            return
+        self.emit(f"{name} = (", indent)
+        for row in rows:
+            self.emit(f"{row},", indent + 1)
+        self.emit(")", indent)
+
+    def format_number(self, value):
+        """Returns the shortest text that reads back as the same 32 bit
+        float, as stored in the scene graph"""
+        value = float(value)
+        packed = struct.pack("f", value)
+        for precision in range(6, 10):
+            text = f"{value:.{precision}g}"
+            if struct.pack("f", float(text)) == packed:
+                break
+        if "e" not in text and "." not in text and "n" not in text:
+            text += ".0"
+        return text
+
+    def format_vec(self, vec):
+        return "(" + ", ".join(self.format_number(value) for value in vec) + ")"
+
+    #
+    # SCENE WRITING
+    #
+    def write_header(self):
+        self.emit("#!/usr/bin/python")
+        self.emit("# -*- coding: utf-8 -*-")
+        self.emit("# This file was created using the Scene Editor")
+        self.emit()
 
         includes = [
             "LPoint3f",
@@ -52,158 +124,201 @@ class ExporterPy:
             "Camera",
             "PerspectiveLens"]
 
-        self.content += "from panda3d.core import (\n"
+        self.emit("from panda3d.core import (")
         for inc in includes:
-            self.content += f"    {inc},\n"
-        self.content += ")\n"
-        self.content += "from panda3d.physics import ActorNode\n"
-        self.content += "\n"
-
-        self.content += "class Scene:\n"
-        self.content += "    def __init__(self, rootParent=None):\n"
-        self.content += " "*8 + "if rootParent is None:\n"
-        self.content += " "*12 + "rootParent = base.render\n"
-        self.content += "\n"
-
-        self.write_scene_element(scene_root, "rootParent")
-
-        if hasattr(scene_root, "get_children") \
-        and len(scene_root.get_children()) > 0:
-            # Create helper functions for scene_root
-            self.content += "\n"
-            self.content += " "*4 + "def show(self):\n"
-            for obj in scene_root.get_children():
-                if obj in self.objects \
-                and not obj.is_stashed() \
-                and obj.get_tag("object_type") == "model":
-                    obj_name = self.get_save_object_name(obj.get_name())
-                    self.content += " "*8 + f"self.{obj_name}.show()\n"
-
-            self.content += "\n"
-            self.content += " "*4 + "def hide(self):\n"
-            for obj in scene_root.get_children():
-                if obj in self.objects \
-                and not obj.is_stashed() \
-                and obj.get_tag("object_type") == "model":
-                    obj_name = self.get_save_object_name(obj.get_name())
-                    self.content += " "*8 + f"self.{obj_name}.hide()\n"
-
-            self.content += "\n"
-            self.content += " "*4 + "def remove_node(self):\n"
-            for obj in scene_root.get_children():
-                if obj in self.objects \
-                and not obj.is_stashed() \
-                and obj.get_tag("object_type") == "model":
-                    obj_name = self.get_save_object_name(obj.get_name())
-                    self.content += " "*8 + f"self.{obj_name}.remove_node()\n"
+            self.emit(f"{inc},", 1)
+        self.emit(")")
+        self.emit("from panda3d.physics import ActorNode")
+        self.emit()
 
-        self.browser = DirectFolderBrowser(
-            self.save,
-            True,
-            save_path,
-            save_file,
-            [".py"],
-            tooltip)
-        self.browser.show()
+    def collect_scene_elements(self, scene_root):
+        """Returns (object, attribute name, parent attribute name) tuples for
+        all visible scene objects below the root in depth first order. The
+        parent name is None for objects placed directly below the root."""
+        elements = []
+        # object -> name of the attribute its node path is stored in
+        names = {}
+        for obj in scene_root.find_all_matches("**/=scene_object_id"):
+            if obj not in self.objects \
+            or obj.get_tag("object_type") not in EXPORTED_OBJECT_TYPES:
+                continue
+            parent_name = None
+            parent = obj.get_parent()
+            while not parent.is_empty() and parent != scene_root:
+                if parent in names:
+                    parent_name = names[parent]
+                    break
+                parent = parent.get_parent()
 
-        #self.dlgPathSelect = PathSelect(
-        #    self.save, "Save Python File", "Save file path", "Save", saveFile, tooltip)
+            name = self.get_unique_object_name(obj.get_name())
+            if obj.get_tag("object_type") == "camera":
+                # the camera node is stored under the objects name
+                names[obj] = name + "_np"
+            else:
+                names[obj] = name
+            elements.append((obj, name, parent_name))
+        return elements
+
+    def write_scene(self, scene_root):
+        elements = self.collect_scene_elements(scene_root)
+
+        # unique model path -> index in the model_paths table
+        model_paths = {}
+        models = []
+        empties = []
+        nodes = []
+        root_models = []
+        for obj, name, parent_name in elements:
+            object_type = obj.get_tag("object_type")
+            if object_type == "model":
+                path = obj.get_tag("filepath")
+                if path not in model_paths:
+                    model_paths[path] = len(model_paths)
+                models.append(f"({name!r}, {model_paths[path]})")
+                if parent_name is None:
+                    root_models.append(repr(name))
+            elif object_type == "empty":
+                empties.append(repr(name))
+            np_name = name + "_np" if object_type == "camera" else name
+            nodes.append(
+                f"({np_name!r}, {parent_name!r}, "
+                f"{self.format_vec(obj.get_pos())}, "
+                f"{self.format_vec(obj.get_hpr())}, "
+                f"{self.format_vec(obj.get_scale())})")
+
+        self.emit("class Scene:")
+        self.emit("# paths of all models used in the scene", 1)
+        self.emit_table("model_paths", [repr(path) for path in model_paths])
+        self.emit()
+        self.emit("# attribute name, index of the models path", 1)
+        self.emit_table("models", models)
+        self.emit()
+        self.emit("# attribute names of empty nodes", 1)
+        self.emit_table("empties", empties)
+        self.emit()
+        self.emit("# attribute name, attribute name of the parent or None for the", 1)
+        self.emit("# root parent, position, rotation and scale", 1)
+        self.emit_table("nodes", nodes)
+        self.emit()
+        self.emit("# models placed directly below the root parent", 1)
+        self.emit_table("root_models", root_models)
+        self.emit()
+
+        self.emit("def __init__(self, rootParent=None):", 1)
+        self.emit("if rootParent is None:", 2)
+        self.emit("rootParent = base.render", 3)
+        self.emit()
+        self.emit("# load each model once and copy it for every object using it", 2)
+        self.emit("model_templates = [loader.load_model(path) for path in self.model_paths]", 2)
+        self.emit("for name, path_index in self.models:", 2)
+        self.emit("model = model_templates[path_index].node().copy_subgraph()", 3)
+        self.emit("setattr(self, name, NodePath(model))", 3)
+        self.emit("for name in self.empties:", 2)
+        self.emit("setattr(self, name, NodePath(name))", 3)
+        self.emit()
+
+        lights = []
+        for obj, name, parent_name in elements:
+            object_type = obj.get_tag("object_type")
+            if object_type == "collision":
+                self.write_collision(obj, name)
+            elif object_type == "physics":
+                self.write_physics(obj, name)
+            elif object_type == "light":
+                self.write_light(obj, name)
+                lights.append((name, parent_name))
+            elif object_type == "camera":
+                self.write_camera(obj, name)
 
-    def write_scene_element(self, root, root_name):
-        if hasattr(root, "get_children"):
-            for obj in root.get_children():
-                if obj in self.objects and not obj.is_stashed():
-                    obj_name = self.get_save_object_name(obj.get_name())
-                    if obj.get_tag("object_type") == "model":
-                        model_path = f"'{obj.get_tag('filepath')}'"
-                        self.content += " "*8 + f"self.{obj_name} = loader.load_model({model_path})\n"
-                        self.content += " "*8 + f"self.{obj_name}.set_pos({obj.get_pos()})\n"
-                        self.content += " "*8 + f"self.{obj_name}.set_hpr({obj.get_hpr()})\n"
-                        self.content += " "*8 + f"self.{obj_name}.set_scale({obj.get_scale()})\n"
-                        self.content += " "*8 + f"self.{obj_name}.reparent_to({root_name})\n"
-                        self.content += "\n"
-
-                    if obj.get_tag("object_type") == "empty":
-                        self.content += " "*8 + f"self.{obj_name} = NodePath('{obj_name}')\n"
-                        self.content += " "*8 + f"self.{obj_name}.set_pos({obj.get_pos()})\n"
-                        self.content += " "*8 + f"self.{obj_name}.set_hpr({obj.get_hpr()})\n"
-                        self.content += " "*8 + f"self.{obj_name}.set_scale({obj.get_scale()})\n"
-                        self.content += " "*8 + f"self.{obj_name}.reparent_to({root_name})\n"
-                        self.content += "\n"
-
-                    elif obj.get_tag("object_type") == "collision":
-                        self.content += " "*8 + f"col = {obj.get_tag('collision_solid_type')}(\n"
-                        for key, value in eval(obj.get_tag('collision_solid_info')).items():
-                            if key == "plane":
-                                # BUG https://github.com/panda3d/panda3d/issues/1248
-                                valueStr = repr(value)#.replace(" ", ", ")
-                                self.content += " "*12 + f"{valueStr},\n"
-                            else:
-                                self.content += " "*12 + f"{value},\n"
-                        self.content += " "*8 + f")\n"
-                        self.content += " "*8 + f"cn = CollisionNode('{obj.get_name()}')\n"
-                        self.content += " "*8 + f"cn.addSolid(col)\n"
-                        self.content += " "*8 + f"self.{obj_name} = {root_name}.attachNewNode(cn)\n"
-                        self.content += " "*8 + f"self.{obj_name}.set_pos({obj.get_pos()})\n"
-                        self.content += " "*8 + f"self.{obj_name}.set_hpr({obj.get_hpr()})\n"
-                        self.content += " "*8 + f"self.{obj_name}.set_scale({obj.get_scale()})\n"
-                        self.content += "\n"
-
-                    elif obj.get_tag("object_type") == "physics":
-                        self.content += " "*8 + f"actor_node = ActorNode('{obj.get_name()}')\n"
-                        self.content += " "*8 + f"base.physicsMgr.attach_physical_node(actor_node)\n"
-                        self.content += " "*8 + f"self.{obj_name} = {root_name}.attachNewNode(actor_node)\n"
-                        self.content += "\n"
-
-                    elif obj.get_tag("object_type") == "light":
-                        self.content += " "*8 + f"light = {obj.get_tag('light_type')}('{obj.get_name()}')\n"
-                        if obj.get_tag('light_type') == "Spotlight":
-                            self.content += " "*8 + f"lens = PerspectiveLens()\n"
-                            self.content += " "*8 + f"light.setLens(lens)\n"
-                        self.content += " "*8 + f"self.{obj_name} = {root_name}.attachNewNode(light)\n"
-                        self.content += " "*8 + f"self.{obj_name}.set_pos({obj.get_pos()})\n"
-                        self.content += " "*8 + f"self.{obj_name}.set_hpr({obj.get_hpr()})\n"
-                        self.content += " "*8 + f"self.{obj_name}.set_scale({obj.get_scale()})\n"
-                        self.content += " "*8 + f"{root_name}.setLight(self.{obj_name})\n"
-                        self.content += "\n"
-
-                    elif obj.get_tag("object_type") == "camera":
-                        # CAM LENS
-                        lens = obj.get_child(1).node().get_lens()
-
-                        obj_lens_name = obj_name + "_lens"
-                        self.content += " "*8 + f"self.{obj_lens_name} = {obj.get_tag('camera_type')}()\n"
-                        self.content += " "*8 + f"self.{obj_lens_name}.aspect_ratio = {lens.aspect_ratio}\n"
-                        self.content += " "*8 + f"self.{obj_lens_name}.fov = {lens.fov}\n"
-                        self.content += " "*8 + f"self.{obj_lens_name}.film_size = {lens.film_size}\n"
-                        self.content += " "*8 + f"self.{obj_lens_name}.film_offset = {lens.film_offset}\n"
-                        self.content += " "*8 + f"self.{obj_lens_name}.near = {lens.near}\n"
-                        self.content += " "*8 + f"self.{obj_lens_name}.far = {lens.far}\n"
-                        self.content += " "*8 + f"self.{obj_lens_name}.focal_length = {lens.focal_length}\n"
-                        self.content += " "*8 + f"self.{obj_lens_name}.min_fov = {lens.min_fov}\n"
-                        self.content += " "*8 + f"self.{obj_lens_name}.view_hpr = {lens.view_hpr}\n"
-                        print(lens.change_event)
-                        if lens.change_event:
-                            self.content += " "*8 + f"self.{obj_lens_name}.change_event = {lens.change_event}\n"
-                        self.content += " "*8 + f"self.{obj_lens_name}.keystone = {lens.keystone}\n"
-
-                        if obj.get_tag("camera_type") == "PerspectiveLens":
-                            self.content += " "*8 + f"self.{obj_lens_name}.convergence_distance = {lens.convergence_distance}\n"
-                            self.content += " "*8 + f"self.{obj_lens_name}.interocular_distance = {lens.interocular_distance}\n"
-
-                        # CAM NODE
-                        self.content += " "*8 + f"self.{obj_name} = Camera('{obj.get_name()}', self.{obj_lens_name})\n"
-
-                        # CAM NODEPATH
-                        obj_np_name = obj_name + "_np"
-                        self.content += " "*8 + f"self.{obj_np_name} = {root_name}.attachNewNode(self.{obj_name})\n"
-                        self.content += " "*8 + f"self.{obj_np_name}.set_pos({obj.get_pos()})\n"
-                        self.content += " "*8 + f"self.{obj_np_name}.set_hpr({obj.get_hpr()})\n"
-                        self.content += " "*8 + f"self.{obj_np_name}.set_scale({obj.get_scale()})\n"
-
-                        self.content += "\n"
-
-                self.write_scene_element(obj, f"self.{obj.get_name()}")
+        self.emit("# build the hierarchy and place all objects", 2)
+        self.emit("for name, parent, pos, hpr, scale in self.nodes:", 2)
+        self.emit("np = getattr(self, name)", 3)
+        self.emit("np.reparent_to(rootParent if parent is None else getattr(self, parent))", 3)
+        self.emit("np.set_pos_hpr_scale(pos, hpr, scale)", 3)
+        for name, parent_name in lights:
+            parent_expression = "rootParent" if parent_name is None else f"self.{parent_name}"
+            self.emit(f"{parent_expression}.setLight(self.{name})", 2)
+
+        # Create helper functions for scene_root
+        for method in ["show", "hide", "remove_node"]:
+            self.emit()
+            self.emit(f"def {method}(self):", 1)
+            self.emit("for name in self.root_models:", 2)
+            self.emit(f"getattr(self, name).{method}()", 3)
+
+    def write_collision(self, obj, obj_name):
+        self.emit(f"col = {obj.get_tag('collision_solid_type')}(", 2)
+        for key, value in parse_literal(obj.get_tag('collision_solid_info')).items():
+            if key == "plane":
+                # BUG https://github.com/panda3d/panda3d/issues/1248
+                self.emit(f"{value!r},", 3)
+            else:
+                self.emit(f"{value},", 3)
+        self.emit(")", 2)
+        self.emit(f"cn = CollisionNode({obj.get_name()!r})", 2)
+        self.emit("cn.addSolid(col)", 2)
+        self.emit(f"self.{obj_name} = NodePath(cn)", 2)
+        self.emit()
+
+    def write_physics(self, obj, obj_name):
+        self.emit(f"actor_node = ActorNode({obj.get_name()!r})", 2)
+        self.emit("base.physicsMgr.attach_physical_node(actor_node)", 2)
+        self.emit(f"self.{obj_name} = NodePath(actor_node)", 2)
+        self.emit()
+
+    def write_light(self, obj, obj_name):
+        self.emit(f"light = {obj.get_tag('light_type')}({obj.get_name()!r})", 2)
+        if obj.get_tag('light_type') == "Spotlight":
+            self.emit("lens = PerspectiveLens()", 2)
+            self.emit("light.setLens(lens)", 2)
+        self.emit(f"self.{obj_name} = NodePath(light)", 2)
+        self.emit()
+
+    def write_camera(self, obj, obj_name):
+        # CAM LENS
+        lens = obj.get_child(1).node().get_lens()
+
+        obj_lens_name = obj_name + "_lens"
+        self.emit(f"self.{obj_lens_name} = {obj.get_tag('camera_type')}()", 2)
+        self.emit(f"self.{obj_lens_name}.aspect_ratio = {lens.aspect_ratio}", 2)
+        self.emit(f"self.{obj_lens_name}.fov = {lens.fov}", 2)
+        self.emit(f"self.{obj_lens_name}.film_size = {lens.film_size}", 2)
+        self.emit(f"self.{obj_lens_name}.film_offset = {lens.film_offset}", 2)
+        self.emit(f"self.{obj_lens_name}.near = {lens.near}", 2)
+        self.emit(f"self.{obj_lens_name}.far = {lens.far}", 2)
+        self.emit(f"self.{obj_lens_name}.focal_length = {lens.focal_length}", 2)
+        self.emit(f"self.{obj_lens_name}.min_fov = {lens.min_fov}", 2)
+        self.emit(f"self.{obj_lens_name}.view_hpr = {lens.view_hpr}", 2)
+        if lens.change_event:
+            self.emit(f"self.{obj_lens_name}.change_event = {lens.change_event!r}", 2)
+        self.emit(f"self.{obj_lens_name}.keystone = {lens.keystone}", 2)
+
+        if obj.get_tag("camera_type") == "PerspectiveLens":
+            self.emit(f"self.{obj_lens_name}.convergence_distance = {lens.convergence_distance}", 2)
+            self.emit(f"self.{obj_lens_name}.interocular_distance = {lens.interocular_distance}", 2)
+
+        # CAM NODE
+        self.emit(f"self.{obj_name} = Camera({obj.get_name()!r}, self.{obj_lens_name})", 2)
+
+        # CAM NODEPATH
+        self.emit(f"self.{obj_name}_np = NodePath(self.{obj_name})", 2)
+        self.emit()
+
+    def get_unique_object_name(self, name):
+        """Returns a name usable as attribute which no other object of the
+        scene uses"""
+        name = self.get_save_object_name(name.replace(" ", "_"))
+        if not name.isidentifier():
+            name = "_" + name
+        unique_name = name
+        index = 1
+        # cameras store their node path and lens in additional attributes
+        while any(unique_name + suffix in self.used_names for suffix in ["", "_np", "_lens"]):
+            unique_name = f"{name}_{index}"
+            index += 1
+        for suffix in ["", "_np", "_lens"]:
+            self.used_names.add(unique_name + suffix)
+        return unique_name
 
     def get_save_object_name(self, name):
         unsave_characters = [
@@ -252,5 +367,8 @@ class ExporterPy:
         if self.dlgOverwrite is not None: self.dlgOverwrite.destroy()
         if self.dlgOverwriteShadow is not None: self.dlgOverwriteShadow.destroy()
         if not overwrite: return
+        self.write(path)
+
+    def write(self, path):
         with open(path, 'w') as outfile:
             outfile.write(self.content)
@@ -7,24 +7,24 @@ See License.txt or http://opensource.org/licenses/BSD-2-Clause for more info
 """
 
 import os
-import json
 import logging
-import tempfile
 
 from direct.showbase.DirectObject import DirectObject
 from direct.gui import DirectGuiGlobals as DGG
 
-from panda3d.core import TextNode
-from panda3d.core import LVecBase2f, LVecBase3f, LVecBase4f, LPoint2f, LPoint3f, LPoint4f, LVector3f
-from panda3d.core import LVecBase2i
-from panda3d.core import LVecBase2, LVecBase3, LVecBase4, LPoint2, LPoint3, LPoint4
-from panda3d.core import LVector2f
-from panda3d.core import LPlane, LPlanef
+from panda3d.core import ConfigVariableBool, ConfigVariableInt
 
 from DirectFolderBrowser.DirectFolderBrowser import DirectFolderBrowser
 
-from SceneEditor.GUI.panels.ObjectPropertiesDefinition import DEFINITIONS, PropertyEditTypes
+from SceneEditor.GUI.panels.ObjectPropertiesDefinition import DEFINITIONS
 from SceneEditor.GUI.panels.PropertiesPanel import PropertyHelper
+from SceneEditor.tools.ProjectReader import ProjectReader
+from SceneEditor.tools.PropertyCodec import PropertyCodec
+from SceneEditor.tools.AutosaveService import get_newest_snapshot_path
+
+# project versions this loader can read. Version 0 stores values as their
+# python representation
+SUPPORTED_PROJECT_VERSIONS = ["0", "1"]
 
 
 class ProjectLoader(DirectObject):
@@ -49,7 +49,11 @@ class ProjectLoader(DirectObject):
             self.browser.show()
 
     def excLoad(self):
-        tmpPath = os.path.join(tempfile.gettempdir(), "SEExceptionSave.scene")
+        # recover from the exception save or an autosave, whichever is newer
+        tmpPath = get_newest_snapshot_path()
+        if tmpPath is None:
+            logging.warning("No exception save or autosave file found")
+            return
         self.__executeLoad(tmpPath)
 
     def get(self):
@@ -74,33 +78,118 @@ class ProjectLoader(DirectObject):
         del self.browser
 
     def __executeLoad(self, path):
-        fileContent = None
-        with open(path, 'r') as infile:
-            try:
-                fileContent = json.load(infile)
-            except Exception as e:
-                logging.error("Couldn't load project file {}".format(infile))
-                logging.exception(e)
-                base.messenger.send("showWarning", ["Error while loading Project!\nPlease check output logs for more information."])
-                return
-        if fileContent is None:
-            logging.error("Problems reading Project file: {}".format(infile))
+        self.ignore("clearDirtyFlag")
+        self.path = path
+        try:
+            self.reader = ProjectReader(path)
+        except Exception as e:
+            logging.error("Couldn't load project file {}".format(path))
+            logging.exception(e)
+            self.hasErrors = True
+            base.messenger.send("showWarning", ["Error while loading Project!\nPlease check output logs for more information."])
             return
 
-        if fileContent["ProjectVersion"] != "0":
+        if self.reader.header.get("ProjectVersion") not in SUPPORTED_PROJECT_VERSIONS:
             logging.warning("Unsupported Project Version")
+            self.hasErrors = True
             base.messenger.send("showWarning", ["Unsupported Project Version"])
             return
 
-        for name, info in fileContent["Scene"].items():
-            self.__createElement(name.split("|")[1], info)
+        self.entries = self.reader.entries()
+
+        # file scene_object_id -> created element
+        self.objects_by_id = {}
+        # name -> latest created element, for projects without parent ids
+        self.objects_by_name = {}
+        # (element, parent id or parent element) to reparent after loading
+        self.parent_links = []
+
+        # kill ring entries of the created elements, the whole project can
+        # be undone in one step once it is loaded
+        self.load_entries = []
+        # the structure will be refreshed once all elements are created
+        base.messenger.send("suspend_ui_refreshes")
+
+        if ConfigVariableBool("scene-editor-streaming-project-load", True).getValue():
+            self.elements_per_frame = max(1, ConfigVariableInt(
+                "scene-editor-project-load-elements-per-frame", 100).getValue())
+            self.accept("cancel_project_loading", self.cancel)
+            # editing is blocked until the project is loaded
+            base.messenger.send("project_loading", [True])
+            base.taskMgr.add(self.__load_task, "SceneEditor_load_project")
+        else:
+            self.__record(self.__load_elements, None)
+            self.__finishLoad()
+
+    def cancel(self):
+        """Stops loading the project and clears the partially loaded scene"""
+        if base.taskMgr.remove("SceneEditor_load_project") == 0:
+            return
+        logging.info(f"Canceled loading project {self.path}")
+        self.__finishLoad(canceled=True)
+
+    def __record(self, function, *args):
+        """Runs the function and collects the kill ring entries it adds. The
+        transaction is closed again right away, so it is never kept open
+        between frames."""
+        self.core.begin_transaction("load project")
+        try:
+            return function(*args)
+        finally:
+            self.load_entries += self.core.detach_transaction()
+
+    def __load_task(self, task):
+        if self.__record(self.__load_elements, self.elements_per_frame):
+            self.__finishLoad()
+            return task.done
+        done, total = self.reader.get_progress()
+        base.messenger.send("loading_progress", [done, total, "Loading project"])
+        return task.cont
+
+    def __load_elements(self, count):
+        """Creates up to count elements, all if count is None. Returns True
+        once all elements have been created"""
+        created = 0
+        while count is None or created < count:
+            try:
+                key, info = next(self.entries)
+            except StopIteration:
+                return True
+            except Exception as e:
+                logging.error("Couldn't read project file {}".format(self.path))
+                logging.exception(e)
+                self.hasErrors = True
+                return True
+            self.__createElement(key.split("|")[1], info)
+            created += 1
+        return False
+
+    def __finishLoad(self, canceled=False):
+        self.ignoreAll()
+        if not canceled:
+            self.__record(self.__resolve_parents)
+            self.core.push_entries(self.load_entries, "load project")
+            self.__resume_journal()
+        self.load_entries = []
+        self.entries = None
+        self.reader = None
+
+        if canceled:
+            self.core.new_project()
+
+        base.messenger.send("resume_ui_refreshes")
+        base.messenger.send("project_loading", [False])
+        base.messenger.send("loading_progress", [1, 1, ""])
+        base.messenger.send("update_structure")
+
+        if canceled:
+            return
 
         if self.hasErrors:
             base.messenger.send("showWarning", ["Errors occured while loading the project!\nProject may not be fully loaded\nSee output log for more information."])
             return
 
-        base.messenger.send("setLastPath", [path])
-        base.messenger.send("update_structure")
+        base.messenger.send("setLastPath", [self.path])
 
     def __createElement(self, name, info):
         object_type = info["object_type"]
@@ -110,9 +199,12 @@ class ProjectLoader(DirectObject):
         if object_type == "model":
             # create the element
             model = self.core.load_model(info["filepath"])
-            if "transparency" in info:
-                model.set_transparency(eval(info["transparency"]))
             definitions = DEFINITIONS[object_type]
+            if "transparency" in info:
+                for definition in definitions:
+                    if definition.internalName == "transparency":
+                        model.set_transparency(
+                            PropertyCodec.decode(definition, info["transparency"]))
         elif object_type == "empty":
             # create the element
             model = self.core.add_empty()
@@ -121,7 +213,7 @@ class ProjectLoader(DirectObject):
             # create the element
             model = self.core.add_collision_solid(
                 info["collision_solid_type"],
-                eval(info["collision_solid_info"]))
+                PropertyCodec.decode_value(info["collision_solid_info"]))
             definitions = DEFINITIONS[info["collision_solid_type"]]
         elif object_type == "physics":
             model = self.core.add_physics_node()
@@ -142,6 +234,7 @@ class ProjectLoader(DirectObject):
 
     def set_nodepath_values(self, model, name, info, definitions):
         model.set_name(name)
+        self.core.scene_objects.update_name(model)
 
         edit_list = []
         for definition in definitions:
@@ -150,21 +243,56 @@ class ProjectLoader(DirectObject):
 
             edit_list.append(definition.internalName)
 
-            if definition.editType != PropertyEditTypes.text:
-                #TODO: We probably shouldn't use eval here
-                value = eval(info[definition.internalName])
-                PropertyHelper.setValue(definition, model, value)
-            else:
-                value = info[definition.internalName]
-                PropertyHelper.setValue(definition, model, value)
+            value = PropertyCodec.decode(definition, info[definition.internalName])
+            PropertyHelper.setValue(definition, model, value)
 
         model.set_tag("edited_properties", ",".join(edit_list))
 
-        parent_name = info["parent"]
-        if parent_name != "scene_model_parent":
-            parents = self.core.scene_objects[:]
-            for obj in reversed(parents):
-                if obj.get_name() == parent_name:
-                    model.reparent_to(obj)
-                    break
+        # restore the id the object had when it was saved
+        object_id = info.get("scene_object_id", "")
+        if object_id != "":
+            if not self.core.scene_objects.update_id(model, object_id):
+                logging.warning(f"Duplicate scene object id {object_id} in project")
+            self.objects_by_id[object_id] = model
+
+        # parents will be resolved once all elements have been created
+        if "parent_id" in info:
+            if info["parent_id"] != "":
+                self.parent_links.append((model, info["parent_id"]))
+        elif info["parent"] != "scene_model_parent":
+            # older projects only store the parent name, it refers to the
+            # latest element with that name created before this one
+            parent = self.objects_by_name.get(info["parent"])
+            if parent is not None:
+                self.parent_links.append((model, parent))
+        self.objects_by_name[name] = model
+
+    def __resume_journal(self):
+        """Further changes will be recorded in the projects journal"""
+        snapshot_id = self.reader.header.get("SnapshotId")
+        if snapshot_id is None:
+            # the next save will write the complete project
+            return
+        if self.reader.journal is None:
+            self.core.project_journal.start(self.path, snapshot_id)
+            return
+        committed_size, valid_size, num_records, uncommitted = self.reader.journal
+        self.core.project_journal.resume(
+            self.path, snapshot_id, committed_size, valid_size, num_records)
+        if uncommitted:
+            logging.warning(f"Recovered changes of {self.path} which haven't been saved")
+            base.messenger.send("setDirtyFlag")
+
+    def __resolve_parents(self):
+        for model, parent in self.parent_links:
+            if isinstance(parent, str):
+                parent_id = parent
+                parent = self.objects_by_id.get(parent_id)
+                if parent is None:
+                    logging.warning(f"Parent {parent_id} of {model.get_name()} not found")
+                    continue
+            model.reparent_to(parent)
+        self.parent_links = []
+        # bounds of the reparented objects have changed
+        self.core.picking_engine.invalidate()
 
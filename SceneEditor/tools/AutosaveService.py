@@ -0,0 +1,177 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = "Fireclaw the Fox"
+__license__ = """
+Simplified BSD (BSD 2-Clause) License.
+See License.txt or http://opensource.org/licenses/BSD-2-Clause for more info
+"""
+
+import os
+import time
+import logging
+import tempfile
+import threading
+
+from direct.showbase.DirectObject import DirectObject
+
+from panda3d.core import (
+    ConfigVariableBool,
+    ConfigVariableDouble,
+    ConfigVariableInt,
+    ConfigVariableString)
+
+from SceneEditor.tools.JSONTools import JSONTools
+from SceneEditor.tools.ProjectFiles import (
+    project_to_bytes,
+    write_atomic,
+    rotate_backups,
+    get_backup_path)
+
+AUTOSAVE_FILE_NAME = "SEAutosave.scene"
+EXCEPTION_SAVE_FILE_NAME = "SEExceptionSave.scene"
+
+
+def get_autosave_path():
+    return os.path.join(
+        os.path.expanduser(ConfigVariableString(
+            "scene-editor-autosave-dir", tempfile.gettempdir()).getValue()),
+        AUTOSAVE_FILE_NAME)
+
+
+def get_exception_save_path():
+    return os.path.join(tempfile.gettempdir(), EXCEPTION_SAVE_FILE_NAME)
+
+
+def get_newest_snapshot_path():
+    """Returns the most recently written exception save, autosave or
+    autosave backup or None if there is none"""
+    autosave_path = get_autosave_path()
+    candidates = [get_exception_save_path(), autosave_path]
+    backups = ConfigVariableInt("scene-editor-autosave-backups", 3).getValue()
+    for index in range(1, backups + 1):
+        candidates.append(get_backup_path(autosave_path, index))
+
+    newest = None
+    newest_time = None
+    for path in candidates:
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        if newest_time is None or mtime > newest_time:
+            newest = path
+            newest_time = mtime
+    return newest
+
+
+class AutosaveService(DirectObject):
+    """Periodically saves the scene while it has unsaved changes.
+
+    The values of the scene objects are copied on the main thread, as the
+    scene graph may only be read there. Encoding them, serializing and
+    writing the file is done by a worker thread. Earlier autosaves are kept
+    as numbered backups, they are only rotated once the new file has been
+    written completely."""
+
+    def __init__(self, core):
+        DirectObject.__init__(self)
+        self.core = core
+
+        self.enabled = ConfigVariableBool("scene-editor-autosave", True).getValue()
+        # seconds between two autosaves
+        self.interval = ConfigVariableDouble("scene-editor-autosave-interval", 300).getValue()
+        self.backups = ConfigVariableInt("scene-editor-autosave-backups", 3).getValue()
+        self.compress = ConfigVariableBool("scene-editor-project-compression", True).getValue()
+        self.path = get_autosave_path()
+
+        # counts the changes to the scene, the autosave is skipped if nothing
+        # changed since the last one
+        self.change_count = 0
+        self.saved_change_count = 0
+
+        self.worker = None
+
+        # statistics
+        self.num_saves = 0
+        self.num_skipped = 0
+        self.last_snapshot_time = 0
+        self.last_write_time = 0
+
+    def start(self):
+        if not self.enabled or self.interval <= 0:
+            return
+        self.accept("addToKillRing", self.__count_change)
+        self.accept("setDirtyFlag", self.__count_change)
+        base.taskMgr.do_method_later(
+            self.interval, self.__autosave_task, "SceneEditor_autosave")
+
+    def stop(self):
+        """Stops saving and waits for a running write to finish"""
+        self.ignoreAll()
+        base.taskMgr.remove("SceneEditor_autosave")
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
+
+    def __count_change(self, *args):
+        self.change_count += 1
+
+    def __autosave_task(self, task):
+        self.save()
+        return task.again
+
+    def save(self):
+        """Starts an autosave if the scene has changes which haven't been
+        saved yet. Returns True if a save has been started."""
+        if not self.core.dirty or self.change_count == self.saved_change_count:
+            return False
+        if self.core.transaction_depth > 0:
+            # the scene is in the middle of a change, e.g. a project load
+            self.num_skipped += 1
+            return False
+        if self.worker is not None and self.worker.is_alive():
+            # the previous autosave is still being written
+            self.num_skipped += 1
+            return False
+
+        start = time.perf_counter()
+        snapshot = JSONTools().captureScene(
+            self.core.scene_objects,
+            self.core.scene_model_parent)
+        self.last_snapshot_time = time.perf_counter() - start
+        self.saved_change_count = self.change_count
+
+        self.worker = threading.Thread(
+            target=self.__write,
+            args=(snapshot, self.path),
+            name="SceneEditor_autosave",
+            daemon=True)
+        self.worker.start()
+        return True
+
+    def __write(self, snapshot, path):
+        # runs in the worker thread, the snapshot isn't used anywhere else
+        start = time.perf_counter()
+        new_path = path + ".new"
+        try:
+            project = JSONTools().buildProjectJSON(snapshot)
+            data = project_to_bytes(project, path, self.compress)
+            # the previous autosave stays in place if writing fails
+            write_atomic(new_path, data)
+            rotate_backups(path, self.backups)
+            os.replace(new_path, path)
+        except Exception as e:
+            logging.error(f"Couldn't write autosave file {path}")
+            logging.exception(e)
+            return
+        self.last_write_time = time.perf_counter() - start
+        self.num_saves += 1
+        logging.info(f"Wrote autosave file to {path}")
+
+    def get_stats(self):
+        return {
+            "saves": self.num_saves,
+            "skipped": self.num_skipped,
+            "last_snapshot_time": self.last_snapshot_time,
+            "last_write_time": self.last_write_time,
+        }
@@ -0,0 +1,375 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = "Fireclaw the Fox"
+__license__ = """
+Simplified BSD (BSD 2-Clause) License.
+See License.txt or http://opensource.org/licenses/BSD-2-Clause for more info
+"""
+
+import re
+import json
+import zlib
+import struct
+import logging
+
+import panda3d.core
+
+# file extension of binary project files, json projects use .scene
+BINARY_PROJECT_EXTENSION = ".sceneb"
+
+MAGIC = b"SEBP"
+FORMAT_VERSION = 2
+
+FLAG_COMPRESSED = 0x1
+
+# value record tags
+TAG_NONE = 0
+TAG_TRUE = 1
+TAG_FALSE = 2
+TAG_INT = 3
+TAG_FLOAT = 4
+TAG_STR = 5
+TAG_LIST = 6
+TAG_DICT = 7
+TAG_FLOAT_ARRAY = 8
+# floats which have been shortened from single precision, like positions or
+# colors, packed as float32 with the number of significant digits to restore
+TAG_FLOAT32_ARRAY = 9
+# literals are values which have been stored as their python representation
+# string in the json format, like "True" or "LPoint3f(1, 2, 3)"
+TAG_LIT_NONE = 16
+TAG_LIT_BOOL = 17
+TAG_LIT_INT = 18
+TAG_LIT_FLOAT = 19
+TAG_LIT_VEC = 20
+
+HEADER = struct.Struct("<4sHH")
+U8 = struct.Struct("<B")
+U32 = struct.Struct("<I")
+I64 = struct.Struct("<q")
+F64 = struct.Struct("<d")
+# packed arrays by their element format and length
+ARRAYS = {}
+
+# the panda3d vector types that may be stored as literal
+VEC_TYPE_RE = re.compile(r"L(?:Point|VecBase|Vector)[234][fdi]?|LPlane[fd]?")
+VEC_LITERAL_RE = re.compile(r"^(" + VEC_TYPE_RE.pattern + r")\(([^()]*)\)$")
+INT_LITERAL_RE = re.compile(r"^-?[0-9]+$")
+
+
+class ProjectLiteral(str):
+    """A string value read from a binary project which holds the python
+    representation of a value. The parsed value is available as value, so it
+    doesn't have to be evaluated again."""
+    def __new__(cls, text, value):
+        obj = str.__new__(cls, text)
+        obj.value = value
+        return obj
+
+
+def get_array_struct(element_format, length):
+    key = (element_format, length)
+    if key not in ARRAYS:
+        ARRAYS[key] = struct.Struct(f"<{length}{element_format}")
+    return ARRAYS[key]
+
+
+def format_literal_number(number):
+    if number.is_integer() and abs(number) < 1e16:
+        return str(int(number))
+    return repr(number)
+
+
+class BinaryProjectTools:
+    """Reads and writes projects in a compact binary format.
+
+    The binary file stores the same data as the json project file. All
+    strings are stored once in a string table and referenced by index, the
+    elements of the scene are stored as records of typed fixed width values.
+    Converting between both formats doesn't lose any information."""
+
+    @staticmethod
+    def is_binary_file(path):
+        try:
+            with open(path, "rb") as infile:
+                return infile.read(len(MAGIC)) == MAGIC
+        except OSError:
+            return False
+
+    #
+    # WRITING
+    #
+    def write(self, project, path, compress=True):
+        with open(path, "wb") as outfile:
+            outfile.write(self.to_bytes(project, compress))
+
+    def to_bytes(self, project, compress=True):
+        self.strings = []
+        self.string_indices = {}
+        body = bytearray()
+
+        # everything besides the scene elements, e.g. the project version
+        meta = {key: value for key, value in project.items() if key != "Scene"}
+        self.__write_value(body, meta)
+
+        scene = project.get("Scene", {})
+        body += U32.pack(len(scene))
+        for key, info in scene.items():
+            body += U32.pack(self.__string_index(key))
+            self.__write_value(body, info)
+
+        payload = bytearray()
+        payload += U32.pack(len(self.strings))
+        for string in self.strings:
+            encoded = string.encode("utf-8")
+            payload += U32.pack(len(encoded))
+            payload += encoded
+        payload += body
+
+        flags = 0
+        if compress:
+            flags |= FLAG_COMPRESSED
+            payload = zlib.compress(bytes(payload))
+
+        return HEADER.pack(MAGIC, FORMAT_VERSION, flags) + bytes(payload)
+
+    def __string_index(self, string):
+        if string not in self.string_indices:
+            self.string_indices[string] = len(self.strings)
+            self.strings.append(string)
+        return self.string_indices[string]
+
+    def __write_value(self, out, value):
+        if value is None:
+            out += U8.pack(TAG_NONE)
+        elif value is True:
+            out += U8.pack(TAG_TRUE)
+        elif value is False:
+            out += U8.pack(TAG_FALSE)
+        elif isinstance(value, int):
+            out += U8.pack(TAG_INT)
+            out += I64.pack(value)
+        elif isinstance(value, float):
+            out += U8.pack(TAG_FLOAT)
+            out += F64.pack(value)
+        elif isinstance(value, str):
+            self.__write_string(out, value)
+        elif isinstance(value, (list, tuple)):
+            if 0 < len(value) < 256 and all(type(v) is float for v in value):
+                self.__write_float_array(out, value)
+            else:
+                out += U8.pack(TAG_LIST)
+                out += U32.pack(len(value))
+                for v in value:
+                    self.__write_value(out, v)
+        elif isinstance(value, dict):
+            out += U8.pack(TAG_DICT)
+            out += U32.pack(len(value))
+            for key, v in value.items():
+                out += U32.pack(self.__string_index(str(key)))
+                self.__write_value(out, v)
+        else:
+            raise TypeError(f"Can't write value of type {type(value)} to binary project")
+
+    def __write_float_array(self, out, values):
+        """Writes the floats as float32 if they can be restored exactly by
+        rounding them to a number of significant digits, otherwise as
+        float64"""
+        single_struct = get_array_struct("f", len(values))
+        try:
+            singles = single_struct.unpack(single_struct.pack(*values))
+        except (OverflowError, struct.error):
+            singles = None
+        if singles is not None:
+            digits = self.__get_restoring_digits(singles, values)
+            if digits is not None:
+                out += U8.pack(TAG_FLOAT32_ARRAY)
+                out += U8.pack(len(values))
+                out += U8.pack(digits)
+                out += single_struct.pack(*singles)
+                return
+        out += U8.pack(TAG_FLOAT_ARRAY)
+        out += U8.pack(len(values))
+        out += get_array_struct("d", len(values)).pack(*values)
+
+    def __get_restoring_digits(self, singles, values):
+        """Returns the number of significant digits the singles have to be
+        rounded to to get the values back, 0 if they are equal already and
+        None if there is no such number"""
+        if list(singles) == list(values):
+            return 0
+        for digits in range(1, 10):
+            if all(float(f"{single:.{digits}g}") == value
+                    for single, value in zip(singles, values)):
+                return digits
+        return None
+
+    def __write_string(self, out, text):
+        """Writes a string, storing python representations of values as
+        typed literal records if they can be restored to the exact same
+        text"""
+        if text == "None":
+            out += U8.pack(TAG_LIT_NONE)
+            return
+        if text in ["True", "False"]:
+            out += U8.pack(TAG_LIT_BOOL)
+            out += U8.pack(text == "True")
+            return
+        if INT_LITERAL_RE.match(text):
+            number = int(text)
+            if str(number) == text and -2**63 <= number < 2**63:
+                out += U8.pack(TAG_LIT_INT)
+                out += I64.pack(number)
+                return
+        numbers = self.__parse_numbers(text)
+        if numbers is not None and len(numbers) == 1:
+            out += U8.pack(TAG_LIT_FLOAT)
+            out += F64.pack(numbers[0])
+            return
+        match = VEC_LITERAL_RE.match(text)
+        if match is not None:
+            numbers = self.__parse_numbers(match.group(2), ", ")
+            if numbers is not None and len(numbers) < 256:
+                out += U8.pack(TAG_LIT_VEC)
+                out += U32.pack(self.__string_index(match.group(1)))
+                out += U8.pack(len(numbers))
+                for number in numbers:
+                    out += F64.pack(number)
+                return
+
+        out += U8.pack(TAG_STR)
+        out += U32.pack(self.__string_index(text))
+
+    def __parse_numbers(self, text, separator=None):
+        """Returns the numbers of the text if formatting them again results
+        in the same text, otherwise None"""
+        parts = [text] if separator is None else text.split(separator)
+        numbers = []
+        for part in parts:
+            try:
+                number = float(part)
+            except ValueError:
+                return None
+            if format_literal_number(number) != part:
+                return None
+            numbers.append(number)
+        return numbers
+
+    #
+    # READING
+    #
+    def read(self, path):
+        with open(path, "rb") as infile:
+            return self.from_bytes(infile.read())
+
+    def from_bytes(self, data):
+        project, num_elements, elements = self.iter_bytes(data)
+        project["Scene"] = dict(elements)
+        return project
+
+    def iter_bytes(self, data):
+        """Reads the header of a binary project. Returns the project data
+        without the scene, the number of scene elements and a generator
+        which reads the (key, info) pairs of the elements one by one"""
+        magic, version, flags = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a binary project file")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"Unsupported binary project format version {version}")
+
+        payload = data[HEADER.size:]
+        if flags & FLAG_COMPRESSED:
+            payload = zlib.decompress(payload)
+        self.data = memoryview(payload)
+        self.offset = 0
+
+        self.strings = []
+        for i in range(self.__read(U32)):
+            length = self.__read(U32)
+            self.strings.append(
+                bytes(self.data[self.offset:self.offset + length]).decode("utf-8"))
+            self.offset += length
+
+        project = self.__read_value()
+        num_elements = self.__read(U32)
+        return project, num_elements, self.__iter_elements(num_elements)
+
+    def __iter_elements(self, num_elements):
+        for i in range(num_elements):
+            key = self.strings[self.__read(U32)]
+            yield key, self.__read_value()
+        self.data = None
+
+    def __read(self, record, single=True):
+        values = record.unpack_from(self.data, self.offset)
+        self.offset += record.size
+        return values[0] if single else values
+
+    def __read_value(self):
+        tag = self.__read(U8)
+        if tag == TAG_NONE:
+            return None
+        elif tag == TAG_TRUE:
+            return True
+        elif tag == TAG_FALSE:
+            return False
+        elif tag == TAG_INT:
+            return self.__read(I64)
+        elif tag == TAG_FLOAT:
+            return self.__read(F64)
+        elif tag == TAG_STR:
+            return self.strings[self.__read(U32)]
+        elif tag == TAG_LIST:
+            return [self.__read_value() for i in range(self.__read(U32))]
+        elif tag == TAG_FLOAT_ARRAY:
+            return list(self.__read(get_array_struct("d", self.__read(U8)), False))
+        elif tag == TAG_FLOAT32_ARRAY:
+            length = self.__read(U8)
+            digits = self.__read(U8)
+            singles = self.__read(get_array_struct("f", length), False)
+            if digits == 0:
+                return list(singles)
+            return [float(f"{single:.{digits}g}") for single in singles]
+        elif tag == TAG_DICT:
+            value = {}
+            for i in range(self.__read(U32)):
+                key = self.strings[self.__read(U32)]
+                value[key] = self.__read_value()
+            return value
+        elif tag == TAG_LIT_NONE:
+            return ProjectLiteral("None", None)
+        elif tag == TAG_LIT_BOOL:
+            value = self.__read(U8) == 1
+            return ProjectLiteral(str(value), value)
+        elif tag == TAG_LIT_INT:
+            value = self.__read(I64)
+            return ProjectLiteral(str(value), value)
+        elif tag == TAG_LIT_FLOAT:
+            value = self.__read(F64)
+            return ProjectLiteral(format_literal_number(value), value)
+        elif tag == TAG_LIT_VEC:
+            type_name = self.strings[self.__read(U32)]
+            numbers = [self.__read(F64) for i in range(self.__read(U8))]
+            text = "{}({})".format(
+                type_name,
+                ", ".join(format_literal_number(n) for n in numbers))
+            value = None
+            if VEC_TYPE_RE.fullmatch(type_name) and hasattr(panda3d.core, type_name):
+                value = getattr(panda3d.core, type_name)(*numbers)
+            else:
+                logging.warning(f"Unknown vector type {type_name} in binary project")
+            return ProjectLiteral(text, value)
+        raise ValueError(f"Invalid record tag {tag} in binary project")
+
+    #
+    # CONVERSION
+    #
+    def json_to_binary(self, json_path, binary_path, compress=True):
+        with open(json_path, "r") as infile:
+            project = json.load(infile)
+        self.write(project, binary_path, compress)
+
+    def binary_to_json(self, binary_path, json_path):
+        project = self.read(binary_path)
+        with open(json_path, "w") as outfile:
+            json.dump(project, outfile, indent=2)
@@ -0,0 +1,169 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = "Fireclaw the Fox"
+__license__ = """
+Simplified BSD (BSD 2-Clause) License.
+See License.txt or http://opensource.org/licenses/BSD-2-Clause for more info
+"""
+
+import os
+import json
+import logging
+import inspect
+import importlib.util
+
+from panda3d.core import ConfigVariableString
+
+from SceneEditor.tools.ProjectFiles import write_atomic
+
+# version of the manifest layout, manifests of other versions are rebuilt
+MANIFEST_VERSION = 1
+
+
+def get_custom_export_path():
+    return ConfigVariableString(
+        "scene-editor-custom-export-path",
+        os.path.join(".","SceneEditor", "custom_export")).getValue()
+
+
+def get_manifest_path():
+    return os.path.expanduser(ConfigVariableString(
+        "scene-editor-custom-export-manifest",
+        os.path.join("~", ".SceneEditor", "custom_exporters.json")).getValue())
+
+
+def import_custom_exporter(filepath):
+    """Imports the exporter module at the given path. Every exporter gets a
+    module of its own, even though they all share the same module name."""
+    logging.debug(f"importing custom exporter {filepath}")
+    spec = importlib.util.spec_from_file_location("exporter", filepath)
+    exporter = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(exporter)
+    return exporter
+
+
+def get_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+#
+# MANIFEST
+#
+def build_manifest(custom_export_path):
+    """Walks the custom export path and imports every exporter.py found to
+    collect what the editor needs to know before an exporter is used"""
+    manifest = {
+        "version": MANIFEST_VERSION,
+        # modification times of all searched folders, adding or removing an
+        # exporter changes the one of its parent folder
+        "directories": {},
+        "exporters": [],
+    }
+    for root, dirs, files in os.walk(custom_export_path):
+        # ignore these
+        dirs[:] = [mod_dir for mod_dir in dirs if mod_dir not in ["__pycache__"]]
+        manifest["directories"][root] = get_mtime(root)
+        for mod_dir in dirs:
+            filepath = os.path.join(root, mod_dir, 'exporter.py')
+
+            # check if the required python file exists
+            if not os.path.exists(filepath):
+                continue
+
+            try:
+                exporter = import_custom_exporter(filepath)
+                manifest["exporters"].append({
+                    "file": filepath,
+                    "mtime": get_mtime(filepath),
+                    "id": exporter.get_id() if hasattr(exporter, "get_id") else exporter.get_name(),
+                    "name": exporter.get_name(),
+                    "direct_save": supports_direct_save(exporter),
+                })
+            except Exception as e:
+                logging.error(f"Couldn't import custom exporter {filepath}")
+                logging.exception(e)
+    return manifest
+
+
+def is_manifest_valid(manifest):
+    if manifest.get("version") != MANIFEST_VERSION:
+        return False
+    for path, mtime in manifest["directories"].items():
+        if get_mtime(path) != mtime:
+            return False
+    for entry in manifest["exporters"]:
+        if get_mtime(entry["file"]) != entry["mtime"]:
+            return False
+    return True
+
+
+def read_manifest(custom_export_path=None):
+    """Returns the manifest entries of all custom exporters. They are read
+    from the manifest file as long as none of the exporters or their folders
+    changed, otherwise the custom export path is searched again."""
+    if custom_export_path is None:
+        custom_export_path = get_custom_export_path()
+    # check if the path is good
+    if not os.path.exists(custom_export_path):
+        return []
+
+    # the manifest file stores the manifests of all custom export paths
+    key = os.path.abspath(custom_export_path)
+    manifest_path = get_manifest_path()
+    manifests = {}
+    try:
+        with open(manifest_path, "r") as infile:
+            manifests = json.load(infile)
+    except (OSError, ValueError):
+        pass
+
+    manifest = manifests.get(key)
+    if manifest is not None and is_manifest_valid(manifest):
+        return manifest["exporters"]
+
+    logging.info(f"Updating custom exporter manifest of {custom_export_path}")
+    manifest = build_manifest(custom_export_path)
+    manifests[key] = manifest
+    try:
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        write_atomic(manifest_path, json.dumps(manifests, indent=2).encode("utf-8"))
+    except OSError as e:
+        logging.error(f"Couldn't write custom exporter manifest {manifest_path}")
+        logging.exception(e)
+    return manifest["exporters"]
+
+
+#
+# LOADING
+#
+def load_custom_exporters(custom_export_path=None):
+    """Imports the exporter.py module of every folder in the custom export
+    path and returns them by their exporter name"""
+    exporters = {}
+    for entry in read_manifest(custom_export_path):
+        exporters[entry["name"]] = import_custom_exporter(entry["file"])
+    return exporters
+
+
+def supports_direct_save(exporter):
+    """Returns True if the exporter module can write a file without asking
+    for the path first, which is needed for headless exports"""
+    try:
+        return "direct_save" in inspect.signature(exporter.Exporter).parameters
+    except (AttributeError, TypeError, ValueError):
+        return False
+
+
+def load_headless_exporters(custom_export_path=None):
+    """Returns the custom exporters which can write files without asking for
+    the path by their exporter id"""
+    exporters = {}
+    for entry in read_manifest(custom_export_path):
+        if not entry["direct_save"]:
+            logging.info(f"Custom exporter {entry['id']} can't be used headless")
+            continue
+        exporters[entry["id"]] = import_custom_exporter(entry["file"])
+    return exporters
@@ -0,0 +1,343 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = "Fireclaw the Fox"
+__license__ = """
+Simplified BSD (BSD 2-Clause) License.
+See License.txt or http://opensource.org/licenses/BSD-2-Clause for more info
+"""
+
+import os
+import json
+import logging
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from SceneEditor.tools.BinaryProjectTools import BINARY_PROJECT_EXTENSION
+from SceneEditor.tools.ProjectFiles import write_atomic
+from SceneEditor.tools.ProjectJournal import get_journal_path
+from SceneEditor.tools.CustomExporters import (
+    get_custom_export_path,
+    load_headless_exporters)
+
+PROJECT_EXTENSIONS = [".scene", BINARY_PROJECT_EXTENSION]
+
+# targets written from the project file alone, without loading the scene.
+# They are only exported if asked for explicitly, as they could be mistaken
+# for projects next to the sources.
+PROJECT_TARGETS = {
+    "scene": ".scene",
+    "sceneb": BINARY_PROJECT_EXTENSION,
+}
+
+# targets which need the scene to be loaded
+SCENE_TARGETS = {
+    "py": ".py",
+    "bam": ".bam",
+}
+
+# file next to the exported files which stores the content hashes they have
+# been written from
+EXPORT_CACHE_FILE_NAME = ".scene_export_cache.json"
+
+
+def get_exported_files(directory):
+    """Returns the names of the files in the directory which have been
+    written by the export runner"""
+    try:
+        with open(os.path.join(directory, EXPORT_CACHE_FILE_NAME), "r") as infile:
+            return set(json.load(infile).keys())
+    except (OSError, ValueError, AttributeError):
+        return set()
+
+
+def find_projects(paths):
+    """Returns the project files given directly or found in the given
+    directories. Found files which have been written by the export runner
+    are left out, so converted projects are never exported again."""
+    projects = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                exported = get_exported_files(root)
+                for file_name in sorted(files):
+                    if file_name in exported:
+                        continue
+                    if os.path.splitext(file_name)[1].lower() in PROJECT_EXTENSIONS:
+                        projects.append(os.path.join(root, file_name))
+        else:
+            projects.append(path)
+
+    # every project only once
+    unique_projects = []
+    found = set()
+    for project in projects:
+        if os.path.abspath(project) not in found:
+            found.add(os.path.abspath(project))
+            unique_projects.append(project)
+    return unique_projects
+
+
+def get_common_dir(paths):
+    """Returns the deepest directory containing all the given files"""
+    try:
+        return os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    except ValueError:
+        # e.g. files on different drives
+        return None
+
+
+def get_content_hash(project_path, target):
+    """Hash of everything the exported file of a project depends on that can
+    be checked without loading it"""
+    content_hash = hashlib.sha256(target.encode("utf-8"))
+    for path in [project_path, get_journal_path(project_path)]:
+        if os.path.exists(path):
+            with open(path, "rb") as infile:
+                content_hash.update(infile.read())
+    return content_hash.hexdigest()
+
+
+def get_error_message(error):
+    """Readable message of an exception, some like MemoryError have none"""
+    message = str(error)
+    if message == "":
+        return type(error).__name__
+    return f"{type(error).__name__}: {message}"
+
+
+#
+# WORKER PROCESSES
+#
+# settings of the worker process and its headless editor, created on first
+# use
+worker_prc_data = ""
+worker_custom_export_path = None
+worker_editor = None
+
+
+def init_worker(prc_data, custom_export_path):
+    global worker_prc_data, worker_custom_export_path
+    worker_prc_data = prc_data
+    worker_custom_export_path = custom_export_path
+
+
+def get_worker_editor():
+    global worker_editor
+    if worker_editor is None:
+        from SceneEditor.HeadlessEditor import HeadlessEditor
+        worker_editor = HeadlessEditor(worker_prc_data, custom_export_path=worker_custom_export_path)
+    return worker_editor
+
+
+def export_project_targets(project_path, outputs):
+    """Writes the project in other project formats, outputs are (target,
+    path) pairs. Returns (target, path, error message or None) tuples."""
+    from SceneEditor.tools.ProjectReader import ProjectReader
+    from SceneEditor.tools.ProjectFiles import project_to_bytes
+
+    reader = ProjectReader(project_path)
+    project = dict(reader.header)
+    # a converted project has no journal
+    project.pop("SnapshotId", None)
+    project["Scene"] = dict(reader.entries())
+
+    results = []
+    for target, path in outputs:
+        try:
+            write_atomic(path, project_to_bytes(project, path))
+            results.append((target, path, None))
+        except Exception as e:
+            logging.exception(e)
+            results.append((target, path, get_error_message(e)))
+    return results
+
+
+def export_scene_targets(project_path, outputs):
+    """Loads the project into the workers headless editor and writes the
+    given (target, path) pairs. Returns (target, path, error message or
+    None) tuples."""
+    editor = get_worker_editor()
+    try:
+        editor.open(project_path)
+    except Exception as e:
+        logging.exception(e)
+        return [(target, path, get_error_message(e)) for target, path in outputs]
+
+    results = []
+    for target, path in outputs:
+        try:
+            editor.export(target, path)
+            results.append((target, path, None))
+        except Exception as e:
+            logging.exception(e)
+            results.append((target, path, get_error_message(e)))
+    return results
+
+
+#
+# RUNNER
+#
+class ExportRunner:
+    """Exports projects to several formats at once without a window.
+
+    Each project is handled by a pool of worker processes. Conversions to
+    other project formats only need the project data and run separately from
+    exports which load the scene into a headless editor, one per worker.
+    With an output directory, the directory structure of the projects is
+    kept below it. Outputs which would overwrite one of the projects or be
+    written from more than one project are refused.
+    Files whose project didn't change since they have been written, checked
+    by a hash of the project file and its journal, are skipped. Changes to
+    the models used by the scene are not detected, force the export in that
+    case."""
+
+    def __init__(self, targets=None, output_dir=None, jobs=None, force=False, prc_data="", custom_export_path=None):
+        self.output_dir = output_dir
+        # directory containing all exported projects, its structure is
+        # mirrored in the output directory
+        self.input_dir = None
+        self.jobs = jobs or os.cpu_count() or 1
+        self.force = force
+        self.prc_data = prc_data
+        self.custom_export_path = custom_export_path or get_custom_export_path()
+
+        # custom exporter id -> extension of the written files
+        self.custom_targets = {}
+        for exporter_id, exporter in load_headless_exporters(self.custom_export_path).items():
+            extension = ".bam"
+            if hasattr(exporter, "get_extension"):
+                extension = exporter.get_extension()
+            self.custom_targets[exporter_id] = extension
+
+        if targets is None:
+            targets = list(SCENE_TARGETS) + list(self.custom_targets)
+        self.targets = []
+        for target in targets:
+            if target in PROJECT_TARGETS or target in SCENE_TARGETS or target in self.custom_targets:
+                self.targets.append(target)
+            else:
+                logging.warning(f"Unknown export target {target}")
+
+        # cache file path -> {output path: content hash}
+        self.caches = {}
+
+    def get_available_targets(self):
+        return list(PROJECT_TARGETS) + list(SCENE_TARGETS) + list(self.custom_targets)
+
+    def get_output_path(self, project_path, target):
+        project_dir = os.path.dirname(os.path.abspath(project_path))
+        if self.output_dir is None:
+            output_dir = project_dir
+        elif self.input_dir is None:
+            output_dir = self.output_dir
+        else:
+            output_dir = os.path.join(self.output_dir, os.path.relpath(project_dir, self.input_dir))
+        name = os.path.splitext(os.path.basename(project_path))[0]
+        if target in PROJECT_TARGETS:
+            return os.path.join(output_dir, name + PROJECT_TARGETS[target])
+        if target in SCENE_TARGETS:
+            return os.path.join(output_dir, name + SCENE_TARGETS[target])
+        return os.path.join(output_dir, f"{name}_{target}{self.custom_targets[target]}")
+
+    #
+    # CONTENT HASHES
+    #
+    def __get_cache(self, output_path):
+        cache_path = os.path.join(os.path.dirname(output_path), EXPORT_CACHE_FILE_NAME)
+        if cache_path not in self.caches:
+            cache = {}
+            try:
+                with open(cache_path, "r") as infile:
+                    cache = json.load(infile)
+            except (OSError, ValueError):
+                pass
+            self.caches[cache_path] = cache
+        return self.caches[cache_path]
+
+    def __is_up_to_date(self, output_path, content_hash):
+        if self.force or not os.path.exists(output_path):
+            return False
+        return self.__get_cache(output_path).get(os.path.basename(output_path)) == content_hash
+
+    def __save_caches(self):
+        for cache_path, cache in self.caches.items():
+            try:
+                write_atomic(cache_path, json.dumps(cache, indent=2).encode("utf-8"))
+            except OSError as e:
+                logging.error(f"Couldn't write export cache {cache_path}")
+                logging.exception(e)
+
+    #
+    # RUNNING
+    #
+    def run(self, project_paths):
+        """Exports all projects to all targets. Returns a dict of (project,
+        target) -> "written", "skipped" or the error message."""
+        results = {}
+        # output path -> content hash it will be written from
+        hashes = {}
+        # absolute output path -> project it will be written from
+        sources = {}
+        inputs = set(os.path.abspath(project_path) for project_path in project_paths)
+        self.input_dir = get_common_dir(project_paths) if project_paths else None
+        jobs = []
+        for project_path in project_paths:
+            project_outputs = []
+            scene_outputs = []
+            for target in self.targets:
+                output_path = self.get_output_path(project_path, target)
+                absolute_path = os.path.abspath(output_path)
+                if absolute_path == os.path.abspath(project_path):
+                    # the project is already in this format
+                    continue
+                if absolute_path in inputs:
+                    results[(project_path, target)] = f"Refused to overwrite the project {output_path}"
+                    continue
+                if absolute_path in sources:
+                    results[(project_path, target)] = \
+                        f"{output_path} is already written from {sources[absolute_path]}"
+                    continue
+                sources[absolute_path] = project_path
+                content_hash = get_content_hash(project_path, target)
+                if self.__is_up_to_date(output_path, content_hash):
+                    results[(project_path, target)] = "skipped"
+                    continue
+                hashes[output_path] = content_hash
+                if target in PROJECT_TARGETS:
+                    project_outputs.append((target, output_path))
+                else:
+                    scene_outputs.append((target, output_path))
+            if project_outputs:
+                jobs.append((export_project_targets, project_path, project_outputs))
+            if scene_outputs:
+                jobs.append((export_scene_targets, project_path, scene_outputs))
+
+        for output_path in hashes:
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+        if jobs:
+            # spawned workers don't inherit any panda state of this process
+            with ProcessPoolExecutor(
+                    max_workers=min(self.jobs, len(jobs)),
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_worker,
+                    initargs=(self.prc_data, self.custom_export_path)) as pool:
+                futures = [
+                    (pool.submit(function, project_path, outputs), project_path, outputs)
+                    for function, project_path, outputs in jobs]
+                for future, project_path, outputs in futures:
+                    try:
+                        job_results = future.result()
+                    except Exception as e:
+                        logging.exception(e)
+                        job_results = [(target, path, get_error_message(e)) for target, path in outputs]
+                    for target, path, error in job_results:
+                        if error is None:
+                            results[(project_path, target)] = "written"
+                            self.__get_cache(path)[os.path.basename(path)] = hashes[path]
+                        else:
+                            results[(project_path, target)] = error
+
+        self.__save_caches()
+        return results
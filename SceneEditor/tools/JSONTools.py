@@ -13,17 +13,42 @@ from panda3d.core import NodePath
 
 from SceneEditor.GUI.panels.ObjectPropertiesDefinition import DEFINITIONS
 from SceneEditor.GUI.panels.PropertiesPanel import PropertyHelper
+from SceneEditor.tools.PropertyCodec import PropertyCodec, parse_literal
+
+# version 1 stores typed values instead of python representation strings
+PROJECT_VERSION = "1"
 
 class JSONTools:
-    def getProjectJSON(self, scene_objects, scene_root):
-        self.scene_objects = scene_objects
-        self.jsonElements = {}
-        self.jsonElements["ProjectVersion"] = "0"
-        self.jsonElements["Scene"] = {}
+    """Creates the project data of the scene.
 
-        self.writeScene(scene_root)
+    Reading the scene graph has to be done on the main thread, so it is
+    split from encoding the values. captureScene only copies the tags and
+    property values of the scene objects, buildProjectJSON encodes them and
+    can run on any thread."""
+
+    def getProjectJSON(self, scene_objects, scene_root, snapshot_id=None):
+        return self.buildProjectJSON(
+            self.captureScene(scene_objects, scene_root),
+            snapshot_id)
 
-        return self.jsonElements
+    def captureScene(self, scene_objects, scene_root):
+        """Returns a list of (key, entry) of all scene objects which are
+        written to the project"""
+        self.scene_objects = scene_objects
+        self.capturedEntries = []
+        self.writeScene(scene_root)
+        return self.capturedEntries
+
+    def buildProjectJSON(self, captured_entries, snapshot_id=None):
+        jsonElements = {}
+        jsonElements["ProjectVersion"] = PROJECT_VERSION
+        if snapshot_id is not None:
+            # identifies the project file a journal belongs to
+            jsonElements["SnapshotId"] = snapshot_id
+        jsonElements["Scene"] = {}
+        for key, entry in captured_entries:
+            jsonElements["Scene"][key] = self.__buildJSONEntry(entry)
+        return jsonElements
 
     def writeScene(self, root):
         index = 0
@@ -31,17 +56,28 @@ class JSONTools:
             if child in self.scene_objects:
                 if not child.is_stashed():
                     index += 1
-                    self.jsonElements["Scene"][f"{index}|{child.get_name()}"] = self.__createJSONEntry(child)
+                    self.capturedEntries.append(
+                        (f"{index}|{child.get_name()}", self.__captureEntry(child)))
                 if child.getNumChildren() > 0:
                     self.writeScene(child)
 
-    def __createJSONEntry(self, scene_object):
+    def getObjectJSON(self, scene_object):
+        """Returns the project data of a single scene object"""
+        return self.__buildJSONEntry(self.__captureEntry(scene_object))
+
+    def __captureEntry(self, scene_object):
+        """Returns the plain values of the scene object which are needed to
+        create its project data"""
         object_type = scene_object.get_tag("object_type")
 
+        # the parent name is still written for older versions of the editor
         object_dict = {
             "object_type":object_type,
-            "parent":scene_object.parent.get_name()
+            "scene_object_id":scene_object.get_tag("scene_object_id"),
+            "parent":scene_object.parent.get_name(),
+            "parent_id":scene_object.parent.get_tag("scene_object_id")
         }
+        collision_solid_info = None
 
         definition_object_type = object_type
         if object_type == "light":
@@ -61,7 +97,7 @@ class JSONTools:
 
             # additional specific properties not given in the definition
             object_dict["collision_solid_type"] = scene_object.get_tag("collision_solid_type")
-            object_dict["collision_solid_info"] = scene_object.get_tag("collision_solid_info")
+            collision_solid_info = scene_object.get_tag("collision_solid_info")
 
         elif object_type == "camera":
             #
@@ -77,11 +113,23 @@ class JSONTools:
         if scene_object.has_tag("edited_properties"):
             edit_list = scene_object.get_tag("edited_properties").split(",")
 
-        # add all edited properties
+        # values of all edited properties, they are encoded later
+        values = []
         for definition in DEFINITIONS[definition_object_type]:
             if definition.internalName in edit_list:
                 if definition.internalName == "":
                     continue
-                object_dict[definition.internalName] = str(PropertyHelper.getValues(definition, scene_object))
-
+                values.append(
+                    (definition, PropertyHelper.getValues(definition, scene_object)))
+
+        return object_dict, collision_solid_info, values
+
+    def __buildJSONEntry(self, entry):
+        captured_dict, collision_solid_info, values = entry
+        object_dict = dict(captured_dict)
+        if collision_solid_info is not None:
+            object_dict["collision_solid_info"] = PropertyCodec.encode_value(
+                parse_literal(collision_solid_info))
+        for definition, value in values:
+            object_dict[definition.internalName] = PropertyCodec.encode(definition, value)
         return object_dict
@@ -0,0 +1,48 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = "Fireclaw the Fox"
+__license__ = """
+Simplified BSD (BSD 2-Clause) License.
+See License.txt or http://opensource.org/licenses/BSD-2-Clause for more info
+"""
+
+import os
+import json
+
+from SceneEditor.tools.BinaryProjectTools import BinaryProjectTools, BINARY_PROJECT_EXTENSION
+
+
+def project_to_bytes(project, path, compress=True):
+    """Serializes the project data in the format given by the files
+    extension"""
+    if path.lower().endswith(BINARY_PROJECT_EXTENSION):
+        return BinaryProjectTools().to_bytes(project, compress)
+    return json.dumps(project, indent=2).encode("utf-8")
+
+
+def write_atomic(path, data):
+    """Writes the data to a temporary file next to the given path and
+    renames it afterwards, so the file is either completely written or left
+    untouched"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as outfile:
+        outfile.write(data)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.replace(tmp_path, path)
+
+
+def get_backup_path(path, index):
+    return f"{path}.{index}"
+
+
+def rotate_backups(path, count):
+    """Moves the file to the first of count backups, shifting older backups
+    one further and dropping the oldest one"""
+    if count <= 0 or not os.path.exists(path):
+        return
+    for index in range(count - 1, 0, -1):
+        older = get_backup_path(path, index)
+        if os.path.exists(older):
+            os.replace(older, get_backup_path(path, index + 1))
+    os.replace(path, get_backup_path(path, 1))
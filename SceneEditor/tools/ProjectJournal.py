@@ -0,0 +1,257 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = "Fireclaw the Fox"
+__license__ = """
+Simplified BSD (BSD 2-Clause) License.
+See License.txt or http://opensource.org/licenses/BSD-2-Clause for more info
+"""
+
+import os
+import json
+import logging
+
+from panda3d.core import ConfigVariableBool, ConfigVariableInt
+
+from SceneEditor.tools.JSONTools import JSONTools
+
+JOURNAL_EXTENSION = ".journal"
+JOURNAL_VERSION = 1
+
+
+def get_journal_path(project_path):
+    return project_path + JOURNAL_EXTENSION
+
+
+class ProjectJournal:
+    """Append only journal of the changes made to a project since its last
+    full save, stored next to the project file.
+
+    Changed objects are written to the journal as soon as possible, a save
+    only adds a commit record. Loading a project replays the journal on top
+    of the project file. Records after the last commit are changes which
+    haven't been saved, they are kept to recover from a crash and dropped
+    when the changes are discarded.
+
+    Each line of the journal is a json record, the first one names the
+    snapshot id of the project file the journal belongs to."""
+
+    def __init__(self, scene_objects, scene_model_parent):
+        self.scene_objects = scene_objects
+        self.scene_model_parent = scene_model_parent
+        self.json_tools = JSONTools()
+
+        self.enabled = ConfigVariableBool("scene-editor-journal", True).getValue()
+        self.max_records = ConfigVariableInt("scene-editor-journal-max-records", 1000).getValue()
+
+        self.project_path = None
+        self.snapshot_id = None
+        # size of the journal file up to the last commit
+        self.committed_size = 0
+        self.num_records = 0
+        # set if a change can't be expressed in the journal
+        self.needs_snapshot = False
+        # objects changed since the last flush
+        self.pending = set()
+
+    def is_bound(self):
+        return self.project_path is not None
+
+    def get_path(self):
+        return get_journal_path(self.project_path)
+
+    #
+    # BINDING
+    #
+    def start(self, project_path, snapshot_id):
+        """Starts a new journal for a project that has just been written
+        completely"""
+        if not self.enabled: return
+        self.__bind(project_path, snapshot_id)
+        with open(self.get_path(), "w") as outfile:
+            outfile.write(json.dumps({"journal": JOURNAL_VERSION, "snapshot_id": snapshot_id}) + "\n")
+        self.committed_size = os.path.getsize(self.get_path())
+
+    def resume(self, project_path, snapshot_id, committed_size, valid_size, num_records):
+        """Continues the journal of a project that has just been loaded"""
+        if not self.enabled: return
+        self.__bind(project_path, snapshot_id)
+        self.committed_size = committed_size
+        self.num_records = num_records
+        # drop an incomplete last record, new records are appended behind
+        with open(self.get_path(), "r+") as outfile:
+            outfile.truncate(valid_size)
+
+    def __bind(self, project_path, snapshot_id):
+        self.project_path = project_path
+        self.snapshot_id = snapshot_id
+        self.num_records = 0
+        self.needs_snapshot = False
+        self.pending = set()
+
+    def unbind(self):
+        self.project_path = None
+        self.snapshot_id = None
+        self.pending = set()
+        base.taskMgr.remove("SceneEditor_journal_flush")
+
+    #
+    # RECORDING
+    #
+    def mark_changed(self, obj):
+        if not self.is_bound(): return
+        self.pending.add(obj)
+        if not obj.is_empty():
+            # sub objects are removed together with their parent
+            for child in obj.find_all_matches("**/=scene_object_id;+s"):
+                self.pending.add(child)
+        if not base.taskMgr.hasTaskNamed("SceneEditor_journal_flush"):
+            base.taskMgr.do_method_later(
+                0, self.flush, "SceneEditor_journal_flush", extraArgs=[])
+
+    def invalidate(self):
+        """The next save has to write the complete project"""
+        self.needs_snapshot = True
+
+    def flush(self):
+        """Writes the records of all changed objects"""
+        base.taskMgr.remove("SceneEditor_journal_flush")
+        if not self.is_bound() or len(self.pending) == 0: return
+
+        lines = []
+        for obj in self.pending:
+            if obj.is_empty(): continue
+            object_id = obj.get_tag("scene_object_id")
+            if self.__is_saved(obj):
+                record = {
+                    "op": "set",
+                    "id": object_id,
+                    "name": obj.get_name(),
+                    "entry": self.json_tools.getObjectJSON(obj)}
+            else:
+                record = {"op": "remove", "id": object_id}
+            lines.append(json.dumps(record) + "\n")
+        self.pending = set()
+
+        try:
+            with open(self.get_path(), "a") as outfile:
+                outfile.writelines(lines)
+        except OSError as e:
+            logging.error(f"Couldn't write project journal {self.get_path()}")
+            logging.exception(e)
+            self.needs_snapshot = True
+            return
+        self.num_records += len(lines)
+
+    def __is_saved(self, obj):
+        """Returns True if the object would be written to the project file"""
+        if obj not in self.scene_objects:
+            return False
+        np = obj
+        while np != self.scene_model_parent:
+            if np.is_empty() or np.is_stashed():
+                return False
+            np = np.get_parent()
+        return True
+
+    #
+    # SAVING
+    #
+    def can_commit(self, project_path):
+        """Returns True if saving the project to the given path only needs
+        to commit the journal"""
+        if not self.is_bound() or self.needs_snapshot: return False
+        if os.path.abspath(project_path) != os.path.abspath(self.project_path): return False
+        if self.num_records + len(self.pending) > self.max_records:
+            # compact the journal into a new project file
+            return False
+        try:
+            project_size = os.path.getsize(project_path)
+            journal_size = os.path.getsize(self.get_path())
+        except OSError:
+            return False
+        if journal_size < self.committed_size:
+            # the journal has been changed by someone else
+            return False
+        return journal_size < project_size
+
+    def commit(self):
+        self.flush()
+        with open(self.get_path(), "a") as outfile:
+            outfile.write(json.dumps({"op": "commit"}) + "\n")
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        self.committed_size = os.path.getsize(self.get_path())
+
+    def discard(self):
+        """Drops all records written since the last commit"""
+        if not self.is_bound(): return
+        self.pending = set()
+        base.taskMgr.remove("SceneEditor_journal_flush")
+        try:
+            with open(self.get_path(), "r+") as outfile:
+                outfile.truncate(self.committed_size)
+        except OSError:
+            pass
+
+    #
+    # REPLAYING
+    #
+    @staticmethod
+    def read(project_path, snapshot_id, elements):
+        """Applies the journal of the project to the (key, info) pairs of
+        the project files elements. Returns the resulting list of elements,
+        the size of the journal up to the last commit and up to the last
+        valid record, the number of records and whether there are changes
+        which haven't been committed. Returns None if there is no journal for
+        this snapshot."""
+        journal_path = get_journal_path(project_path)
+        if snapshot_id is None or not os.path.exists(journal_path):
+            return None
+
+        with open(journal_path, "r") as infile:
+            lines = infile.readlines()
+        if len(lines) == 0:
+            return None
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            logging.warning(f"Invalid project journal {journal_path}")
+            return None
+        if header.get("snapshot_id") != snapshot_id:
+            logging.info(f"Ignoring journal {journal_path} of another project snapshot")
+            return None
+
+        # object id -> [key prefix, name, info], in order of the elements
+        objects = {}
+        for key, info in elements:
+            prefix, name = key.split("|", 1)
+            objects[info.get("scene_object_id", key)] = [prefix, name, info]
+
+        committed_size = len(lines[0].encode("utf-8"))
+        valid_size = committed_size
+        num_records = 0
+        uncommitted = False
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last line may be incomplete after a crash
+                logging.warning(f"Ignoring invalid record in journal {journal_path}")
+                break
+            valid_size += len(line.encode("utf-8"))
+            num_records += 1
+            if record["op"] == "commit":
+                committed_size = valid_size
+                uncommitted = False
+                continue
+            uncommitted = True
+            if record["op"] == "set":
+                if record["id"] in objects:
+                    objects[record["id"]][1:] = [record["name"], record["entry"]]
+                else:
+                    objects[record["id"]] = [f"j{num_records}", record["name"], record["entry"]]
+            elif record["op"] == "remove":
+                objects.pop(record["id"], None)
+
+        elements = [(f"{prefix}|{name}", info) for prefix, name, info in objects.values()]
+        return elements, committed_size, valid_size, num_records, uncommitted
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = "Fireclaw the Fox"
+__license__ = """
+Simplified BSD (BSD 2-Clause) License.
+See License.txt or http://opensource.org/licenses/BSD-2-Clause for more info
+"""
+
+import re
+import json
+import logging
+
+from SceneEditor.tools.BinaryProjectTools import BinaryProjectTools
+from SceneEditor.tools.ProjectJournal import ProjectJournal
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class ProjectReader:
+    """Reads the elements of a project file one by one.
+
+    The header values of the project like the version are read right away,
+    while the scene elements are only parsed when they are requested from
+    the entries generator. Works with json and binary project files.
+
+    If the project has a journal, it is replayed on top of the elements of
+    the file, which requires reading all elements right away."""
+
+    def __init__(self, path):
+        self.path = path
+        self.header = {}
+        self.num_elements = None
+        self.num_read = 0
+
+        self.text = None
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+        if BinaryProjectTools.is_binary_file(path):
+            with open(path, "rb") as infile:
+                data = infile.read()
+            self.header, self.num_elements, self.elements = \
+                BinaryProjectTools().iter_bytes(data)
+        else:
+            with open(path, "r") as infile:
+                self.text = infile.read()
+            self.elements = self.__read_json_header()
+
+        # committed size, valid size, number of records and uncommitted flag
+        # of the replayed journal
+        self.journal = None
+        result = ProjectJournal.read(path, self.header.get("SnapshotId"), self.elements)
+        if result is not None:
+            elements = result[0]
+            self.num_elements = len(elements)
+            self.elements = iter(elements)
+            self.journal = result[1:]
+
+    def entries(self):
+        """Generator of (key, info) pairs of the scene elements"""
+        for key, info in self.elements:
+            self.num_read += 1
+            yield key, info
+
+    def get_progress(self):
+        """Returns the done and total amount of work, either in elements or
+        in characters of the file"""
+        if self.num_elements is not None:
+            return self.num_read, self.num_elements
+        return self.pos, len(self.text)
+
+    def __read_json_header(self):
+        self.__expect("{")
+        while True:
+            self.__skip_whitespace()
+            if self.text[self.pos] == "}":
+                break
+            key = self.__decode()
+            self.__expect(":")
+            self.__skip_whitespace()
+            if key == "Scene":
+                if "ProjectVersion" not in self.header:
+                    # the header has to be known before reading the scene
+                    logging.debug("project header is not in front of the scene, reading whole file")
+                    return self.__read_json_complete()
+                return self.__iter_json_elements()
+            self.header[key] = self.__decode()
+            self.__skip_whitespace()
+            if self.text[self.pos] == ",":
+                self.pos += 1
+        return iter([])
+
+    def __read_json_complete(self):
+        project = json.loads(self.text)
+        scene = project.pop("Scene", {})
+        self.header = project
+        self.num_elements = len(scene)
+        return iter(scene.items())
+
+    def __iter_json_elements(self):
+        self.__expect("{")
+        while True:
+            self.__skip_whitespace()
+            if self.text[self.pos] == "}":
+                break
+            key = self.__decode()
+            self.__expect(":")
+            self.__skip_whitespace()
+            info = self.__decode()
+            self.__skip_whitespace()
+            if self.text[self.pos] == ",":
+                self.pos += 1
+            yield key, info
+        self.pos = len(self.text)
+
+    def __skip_whitespace(self):
+        self.pos = WHITESPACE.match(self.text, self.pos).end()
+
+    def __expect(self, char):
+        self.__skip_whitespace()
+        if self.text[self.pos] != char:
+            raise ValueError(f"Expected '{char}' at position {self.pos} of {self.path}")
+        self.pos += 1
+
+    def __decode(self):
+        value, self.pos = self.decoder.raw_decode(self.text, self.pos)
+        return value
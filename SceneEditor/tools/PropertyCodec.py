@@ -0,0 +1,194 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = "Fireclaw the Fox"
+__license__ = """
+Simplified BSD (BSD 2-Clause) License.
+See License.txt or http://opensource.org/licenses/BSD-2-Clause for more info
+"""
+
+import ast
+import struct
+import logging
+
+import panda3d.core
+from panda3d.core import LVecBase2f, LVecBase3f, LVecBase4f, LVecBase2i, LVecBase3i, LVecBase4i
+
+from SceneEditor.GUI.panels.ObjectPropertiesDefinition import PropertyEditTypes
+from SceneEditor.tools.BinaryProjectTools import ProjectLiteral, VEC_TYPE_RE
+
+FLOAT_VECTOR_TYPES = {
+    PropertyEditTypes.base2: LVecBase2f,
+    PropertyEditTypes.base3: LVecBase3f,
+    PropertyEditTypes.base4: LVecBase4f,
+}
+INT_VECTOR_TYPES = {
+    PropertyEditTypes.base2: LVecBase2i,
+    PropertyEditTypes.base3: LVecBase3i,
+    PropertyEditTypes.base4: LVecBase4i,
+}
+
+F32 = struct.Struct("<f")
+
+
+def is_tag_enabled(value):
+    """Returns True if the value of a flag that is stored as tag is set"""
+    return value.lower() not in ["", "0", "false", "no"]
+
+
+def make_vector(type_name, values):
+    """Creates the panda3d vector of the given type name. Only vector and
+    plane types are allowed"""
+    if not VEC_TYPE_RE.fullmatch(type_name) or not hasattr(panda3d.core, type_name):
+        raise ValueError(f"Unsupported vector type {type_name}")
+    return getattr(panda3d.core, type_name)(*values)
+
+
+def shorten_float(value):
+    """Returns the shortest float that results in the same single precision
+    value. Values which can't be represented as single precision float are
+    returned unchanged."""
+    try:
+        single = F32.pack(value)
+    except OverflowError:
+        return value
+    if F32.unpack(single)[0] != value:
+        return value
+    for precision in range(1, 10):
+        short = float(f"{value:.{precision}g}")
+        if F32.pack(short) == single:
+            return short
+    return value
+
+
+def parse_literal(text):
+    """Parses the python representation of a value like it has been written
+    by older versions of the editor, e.g. "LPoint3f(0, 1, 2)" or a dict of
+    those. Only literals and panda3d vector constructors are accepted, nothing
+    will be evaluated."""
+    return _LiteralParser().parse(ast.parse(text.strip(), mode="eval").body)
+
+
+class _LiteralParser:
+    def parse(self, node):
+        if isinstance(node, ast.Constant):
+            return node.value
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            value = self.parse(node.operand)
+            if type(value) not in [int, float]:
+                raise ValueError("Invalid literal")
+            return -value if isinstance(node.op, ast.USub) else value
+        elif isinstance(node, ast.Tuple):
+            return tuple(self.parse(n) for n in node.elts)
+        elif isinstance(node, ast.List):
+            return [self.parse(n) for n in node.elts]
+        elif isinstance(node, ast.Dict):
+            return {self.parse(k): self.parse(v) for k, v in zip(node.keys, node.values)}
+        elif isinstance(node, ast.Call) \
+                and isinstance(node.func, ast.Name) \
+                and len(node.keywords) == 0:
+            return make_vector(node.func.id, [self.parse(n) for n in node.args])
+        raise ValueError(f"Unsupported literal {ast.dump(node)}")
+
+
+class PropertyCodec:
+    """Converts property values to json compatible values and back.
+
+    The conversion is driven by the type and edit type of the properties
+    definition. Vectors and colors are stored as lists of numbers and option
+    menu values by the name of their option. Values written by older versions
+    of the editor as python representation strings are still readable."""
+
+    @staticmethod
+    def encode(definition, value):
+        """Returns the json compatible value of the given property value"""
+        editType = definition.editType
+        if value is None:
+            return None
+        if editType in [PropertyEditTypes.text, PropertyEditTypes.path]:
+            return str(value)
+        elif editType == PropertyEditTypes.integer:
+            return int(value)
+        elif editType == PropertyEditTypes.float:
+            return shorten_float(float(value))
+        elif editType == PropertyEditTypes.bool:
+            return bool(value)
+        elif editType in FLOAT_VECTOR_TYPES:
+            if definition.numberType == int:
+                return [int(v) for v in value]
+            return [shorten_float(float(v)) for v in value]
+        elif editType == PropertyEditTypes.optionMenu \
+                and isinstance(definition.valueOptions, dict):
+            for name, option in definition.valueOptions.items():
+                if option == value:
+                    return name
+        return PropertyCodec.encode_value(value)
+
+    @staticmethod
+    def decode(definition, value):
+        """Returns the property value for the given json value"""
+        editType = definition.editType
+        if value is None:
+            return None
+        if editType in [PropertyEditTypes.text, PropertyEditTypes.path]:
+            return str(value)
+        if isinstance(value, ProjectLiteral):
+            # the value has already been parsed by the binary project reader
+            value = value.value
+        elif isinstance(value, str):
+            if editType == PropertyEditTypes.optionMenu \
+                    and isinstance(definition.valueOptions, dict) \
+                    and value in definition.valueOptions:
+                return definition.valueOptions[value]
+            if editType == PropertyEditTypes.bool:
+                # flags which have been stored as plain tags before
+                return is_tag_enabled(value.strip())
+            # written by an older version of the editor
+            value = parse_literal(value)
+
+        if editType == PropertyEditTypes.integer:
+            return int(value)
+        elif editType == PropertyEditTypes.float:
+            return float(value)
+        elif editType == PropertyEditTypes.bool:
+            return bool(value)
+        elif editType in FLOAT_VECTOR_TYPES and isinstance(value, list):
+            if definition.numberType == int:
+                return INT_VECTOR_TYPES[editType](*value)
+            return FLOAT_VECTOR_TYPES[editType](*value)
+        return PropertyCodec.decode_value(value)
+
+    @staticmethod
+    def encode_value(value):
+        """Converts a value without definition, like the collision solid
+        info, to a json compatible value"""
+        if value is None or type(value) in [bool, int, str]:
+            return value
+        elif type(value) is float:
+            return shorten_float(value)
+        type_name = type(value).__name__
+        if VEC_TYPE_RE.fullmatch(type_name):
+            return {"type": type_name, "values": [shorten_float(float(v)) for v in value]}
+        elif isinstance(value, (list, tuple)):
+            return [PropertyCodec.encode_value(v) for v in value]
+        elif isinstance(value, dict):
+            return {str(k): PropertyCodec.encode_value(v) for k, v in value.items()}
+        logging.warning(f"Storing value of unsupported type {type_name} as string")
+        return str(value)
+
+    @staticmethod
+    def decode_value(value):
+        """Reverses encode_value"""
+        if isinstance(value, ProjectLiteral):
+            return value.value
+        if isinstance(value, str):
+            try:
+                return parse_literal(value)
+            except (ValueError, SyntaxError):
+                return value
+        elif isinstance(value, list):
+            return [PropertyCodec.decode_value(v) for v in value]
+        elif isinstance(value, dict):
+            if set(value.keys()) == {"type", "values"}:
+                return make_vector(value["type"], value["values"])
+            return {k: PropertyCodec.decode_value(v) for k, v in value.items()}
+        return value
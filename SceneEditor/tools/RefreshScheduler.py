@@ -0,0 +1,181 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = "Fireclaw the Fox"
+__license__ = """
+Simplified BSD (BSD 2-Clause) License.
+See License.txt or http://opensource.org/licenses/BSD-2-Clause for more info
+"""
+
+import logging
+
+from direct.showbase.DirectObject import DirectObject
+
+
+class RefreshScheduler(DirectObject):
+    """Collects UI refresh events sent through the messenger during a frame and
+    runs each registered refresh at most once, late in the frame.
+
+    Refreshes run in the order they have been registered. A refresh may name
+    other events it supersedes, e.g. a full structure rebuild makes a pending
+    selection patch redundant."""
+
+    # run after the regular tasks and the event handling but before igLoop
+    # renders the frame
+    TASK_SORT = 45
+
+    # number of passes a flush may take if refreshes request other refreshes
+    MAX_FLUSH_PASSES = 4
+
+    def __init__(self):
+        DirectObject.__init__(self)
+
+        # event name -> refresh function, in registration order
+        self.refreshes = {}
+        # event name -> function merging the pending and newly sent arguments
+        self.merge_functions = {}
+        # event name -> list of events made redundant by this one
+        self.superseded_events = {}
+
+        # event name -> arguments of the pending refresh
+        self.pending = {}
+
+        # statistics
+        self.requested = {}
+        self.executed = {}
+
+        self.task = None
+
+        # refreshes are held back while this is greater than zero
+        self.suspend_count = 0
+        # no events are accepted while paused
+        self.paused = False
+
+    def register(self, event, refresh_func, merge_func=None, supersedes=None):
+        """Coalesce the given messenger event into a single call of
+        refresh_func per frame. merge_func gets the pending and the new
+        arguments list and returns the arguments to use, by default the latest
+        arguments win."""
+        self.refreshes[event] = refresh_func
+        self.merge_functions[event] = merge_func
+        self.superseded_events[event] = supersedes or []
+        self.requested[event] = 0
+        self.executed[event] = 0
+        if not self.paused:
+            self.accept(event, self.request, [event])
+
+    def unregister(self, event):
+        self.ignore(event)
+        self.pending.pop(event, None)
+        del self.refreshes[event]
+        del self.merge_functions[event]
+        del self.superseded_events[event]
+
+    def request(self, event, *args):
+        """Mark the refresh of the given event dirty"""
+        self.requested[event] += 1
+        args = list(args)
+        if event in self.pending and self.merge_functions[event] is not None:
+            args = self.merge_functions[event](self.pending[event], args)
+        self.pending[event] = args
+
+        self.__schedule()
+
+    def suspend(self):
+        """Hold back all refreshes until resume is called, e.g. while a
+        project is being loaded over multiple frames. Calls can be nested."""
+        self.suspend_count += 1
+
+    def resume(self):
+        if self.suspend_count == 0:
+            return
+        self.suspend_count -= 1
+        self.__schedule()
+
+    def pause(self):
+        """Stop listening to the refresh events, e.g. while the editor is
+        disabled. Pending refreshes are held back until unpause is called and
+        the statistics are kept."""
+        if self.paused:
+            return
+        self.paused = True
+        for event in self.refreshes.keys():
+            self.ignore(event)
+
+    def unpause(self):
+        if not self.paused:
+            return
+        self.paused = False
+        for event in self.refreshes.keys():
+            self.accept(event, self.request, [event])
+        self.__schedule()
+
+    def __schedule(self):
+        if self.paused or self.suspend_count > 0 or len(self.pending) == 0:
+            return
+        if self.task is None:
+            self.task = base.taskMgr.add(
+                self.flush_task,
+                "SceneEditor_refresh_scheduler",
+                sort=self.TASK_SORT)
+
+    def flush_task(self, task):
+        self.task = None
+        if not self.paused and self.suspend_count == 0:
+            self.flush()
+        return task.done
+
+    def flush(self):
+        """Run all pending refreshes right away"""
+        passes = 0
+        while len(self.pending) > 0 and passes < self.MAX_FLUSH_PASSES:
+            passes += 1
+            pending = self.pending
+            self.pending = {}
+
+            for event in pending.keys():
+                for superseded in self.superseded_events[event]:
+                    if superseded in pending:
+                        pending[superseded] = None
+
+            for event, refresh_func in list(self.refreshes.items()):
+                if event not in pending or pending[event] is None:
+                    continue
+                self.executed[event] += 1
+                refresh_func(*pending[event])
+
+        if len(self.pending) > 0:
+            logging.warning(
+                "refresh scheduler reached the flush pass limit, "
+                f"postponing {list(self.pending.keys())} to the next frame")
+            self.__schedule()
+
+    def get_stats(self):
+        """Returns a dict of event name -> (requested, executed, suppressed)"""
+        stats = {}
+        for event in self.requested.keys():
+            requested = self.requested[event]
+            executed = self.executed[event]
+            stats[event] = (requested, executed, requested - executed)
+        return stats
+
+    def get_suppressed_count(self):
+        """Returns the total number of refreshes that have been suppressed"""
+        return sum(stats[2] for stats in self.get_stats().values())
+
+    def reset_stats(self):
+        for event in self.requested.keys():
+            self.requested[event] = 0
+            self.executed[event] = 0
+
+    def log_stats(self):
+        for event, (requested, executed, suppressed) in self.get_stats().items():
+            logging.debug(
+                f"refresh {event}: requested={requested}, "
+                f"executed={executed}, suppressed={suppressed}")
+
+    def destroy(self):
+        self.ignoreAll()
+        if self.task is not None:
+            base.taskMgr.remove(self.task)
+            self.task = None
+        self.pending = {}
@@ -0,0 +1,42 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+__author__ = "Fireclaw the Fox"
+__license__ = """
+Simplified BSD (BSD 2-Clause) License.
+See License.txt or http://opensource.org/licenses/BSD-2-Clause for more info
+"""
+
+import time
+import logging
+
+
+class StartupTimer:
+    """Measures the phases of the editor startup. Time is counted from the
+    first import of this module, so it should be imported before anything
+    else by the entry point."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.last = self.start
+        # (phase name, duration in seconds) in the order they ended
+        self.phases = []
+
+    def mark(self, phase):
+        """Ends the currently running phase and names it"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def get_total(self):
+        return self.last - self.start
+
+    def report(self):
+        lines = ["Startup times:"]
+        for phase, duration in self.phases:
+            lines.append(f"  {phase:<20} {duration * 1000:8.1f} ms")
+        lines.append(f"  {'total':<20} {self.get_total() * 1000:8.1f} ms")
+        logging.info("\n".join(lines))
+
+
+# shared by the entry point and the editor
+startup_timer = StartupTimer()
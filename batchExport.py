@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import logging
+import argparse
+
+from SceneEditor.tools.ExportRunner import ExportRunner, find_projects
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export Scene Editor projects to several formats without opening the editor")
+    parser.add_argument(
+        "projects", nargs="+",
+        help="project files or directories containing project files")
+    parser.add_argument(
+        "-t", "--targets",
+        help="comma separated list of targets to export to, defaults to all targets except the project formats")
+    parser.add_argument(
+        "-o", "--output-dir",
+        help="directory to write the exported files to, keeping the directory structure of the projects, defaults to the directory of each project")
+    parser.add_argument(
+        "-j", "--jobs", type=int,
+        help="number of worker processes, defaults to the number of CPUs")
+    parser.add_argument(
+        "-f", "--force", action="store_true",
+        help="export projects even if they didn't change since the last export")
+    parser.add_argument(
+        "--list-targets", action="store_true",
+        help="print the available targets and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    # the workers use the same configuration as the editor, e.g. for the
+    # model paths
+    prc_data = ""
+    config_file = os.path.join(os.path.expanduser("~"), ".SceneEditor", ".SceneEditor.prc")
+    if os.path.exists(config_file):
+        with open(config_file, "r") as infile:
+            prc_data = infile.read()
+
+    targets = None
+    if args.targets:
+        targets = [target.strip() for target in args.targets.split(",")]
+
+    runner = ExportRunner(
+        targets=targets,
+        output_dir=args.output_dir,
+        jobs=args.jobs,
+        force=args.force,
+        prc_data=prc_data)
+
+    if args.list_targets:
+        print("\n".join(runner.get_available_targets()))
+        return 0
+
+    results = runner.run(find_projects(args.projects))
+
+    failed = 0
+    for (project, target), result in sorted(results.items()):
+        if result not in ["written", "skipped"]:
+            failed += 1
+        print(f"{project} [{target}]: {result}")
+    written = sum(1 for result in results.values() if result == "written")
+    skipped = sum(1 for result in results.values() if result == "skipped")
+    print(f"{written} written, {skipped} skipped, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+# imported first to measure the time of all other imports
+from SceneEditor.tools.StartupTimer import startup_timer
+
 from direct.showbase.ShowBase import ShowBase
 from panda3d.core import loadPrcFileData, WindowProperties
 from editorLogHandler import setupLog
 from SceneEditor.SceneEditor import SceneEditor
 
+startup_timer.mark("imports")
+
 loadPrcFileData(
     "",
     """
@@ -17,8 +22,10 @@ loadPrcFileData(
     """)
 
 setupLog("SceneEditor")
+startup_timer.mark("log and config")
 
 base = ShowBase()
+startup_timer.mark("engine")
 
 def set_dirty_name():
     wp = WindowProperties()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Autosaves written by the worker thread and their backups"""
+
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from SceneEditor.HeadlessEditor import HeadlessEditor
+from SceneEditor.tools import AutosaveService as autosave_module
+from SceneEditor.tools.AutosaveService import AutosaveService
+from SceneEditor.tools.JSONTools import JSONTools
+
+
+@pytest.fixture(scope="module")
+def editor():
+    return HeadlessEditor()
+
+
+@pytest.fixture
+def autosave(editor, tmp_path):
+    editor.new()
+    model = editor.core.load_model("models/misc/sphere")
+    editor.set_property(model, "pos", (1, 2, 3))
+    service = AutosaveService(editor.core)
+    service.path = str(tmp_path / "autosave.scene")
+    service.backups = 2
+    editor.core.dirty = True
+    return service
+
+
+def save(service):
+    service.change_count += 1
+    assert service.save()
+    service.worker.join()
+
+
+def test_autosave(editor, autosave):
+    save(autosave)
+    with open(autosave.path) as infile:
+        project = json.load(infile)
+    assert project == JSONTools().getProjectJSON(
+        editor.core.scene_objects, editor.core.scene_model_parent)
+
+    save(autosave)
+    assert os.path.exists(autosave.path + ".1")
+
+
+def test_failed_autosave_keeps_previous(autosave, monkeypatch):
+    save(autosave)
+    with open(autosave.path, "rb") as infile:
+        previous = infile.read()
+
+    def fail(*args):
+        raise OSError("disk full")
+    monkeypatch.setattr(autosave_module, "write_atomic", fail)
+    save(autosave)
+
+    with open(autosave.path, "rb") as infile:
+        assert infile.read() == previous
+    assert not os.path.exists(autosave.path + ".1")
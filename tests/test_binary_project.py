@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Round trips of the binary project format"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from SceneEditor.tools.BinaryProjectTools import BinaryProjectTools
+from SceneEditor.tools.PropertyCodec import shorten_float
+
+
+def make_project():
+    return {
+        "ProjectVersion": "0.3",
+        "Scene": {
+            "1|model": {
+                "object_type": "model",
+                "pos": [1.0, -2.5, 1000.25],
+                "hpr": [shorten_float(0.1), 90.0, shorten_float(-33.3)],
+                "scale": [shorten_float(0.1)] * 3,
+                "filepath": "models/misc/sphere",
+            },
+            "2|light": {
+                "object_type": "light",
+                "color": [0.123456789012, 1.0, 1e300, 0.5],
+                "info": "LPoint3f(1, 2, 3)",
+            },
+        },
+    }
+
+
+def test_round_trip():
+    project = make_project()
+    tools = BinaryProjectTools()
+    for compress in [True, False]:
+        assert tools.from_bytes(tools.to_bytes(project, compress)) == project
+
+
+def test_literal_values():
+    tools = BinaryProjectTools()
+    project = tools.from_bytes(tools.to_bytes(make_project()))
+    info = project["Scene"]["2|light"]["info"]
+    assert info == "LPoint3f(1, 2, 3)"
+    assert tuple(info.value) == (1, 2, 3)
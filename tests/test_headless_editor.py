@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Smoke test of the headless editor, runs the complete open, edit, save and
+export cycle without a window"""
+
+import os
+import sys
+
+import pytest
+
+from panda3d.core import loadPrcFileData, unloadPrcFile, Point3, Vec3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from SceneEditor.HeadlessEditor import HeadlessEditor
+
+
+@pytest.fixture(scope="module")
+def editor():
+    # there can only be one ShowBase per process, so all tests share it
+    return HeadlessEditor()
+
+
+@pytest.fixture
+def project(editor, tmp_path):
+    editor.new()
+    model = editor.core.load_model("models/misc/sphere")
+    model.set_pos(1, 2, 3)
+    editor.core.add_empty()
+    editor.core.add_light("PointLight", {})
+    path = str(tmp_path / "scene.scene")
+    editor.save(path)
+    return path
+
+
+def test_startup(editor):
+    assert editor.startup_time < 1
+
+
+def test_open_edit_save(editor, project):
+    editor.open(project)
+    assert len(editor.find()) == 3
+
+    model = editor.find(object_type="model")[0]
+    editor.set_property(model, "pos", (4, 5, 6))
+    editor.save()
+
+    editor.open(project)
+    model = editor.find(object_type="model")[0]
+    assert tuple(model.get_pos()) == (4, 5, 6)
+
+
+def test_export(editor, project, tmp_path):
+    editor.open(project)
+    for target in ["py", "bam"]:
+        path = str(tmp_path / f"scene.{target}")
+        editor.export(target, path)
+        assert os.path.getsize(path) > 0
+
+
+def test_process(editor, project):
+    def move(editor):
+        for model in editor.find(object_type="model"):
+            editor.set_property(model, "pos", (0, 0, 7))
+
+    results = editor.process([project, project + ".missing"], move)
+    assert results[project] is None
+    assert results[project + ".missing"] is not None
+
+    editor.open(project)
+    assert editor.find(object_type="model")[0].get_z() == 7
+
+
+def test_set_model_path(editor, project):
+    editor.open(project)
+    model = editor.find(object_type="model")[0]
+    editor.set_model_path(model, "models/misc/rgbCube")
+    assert model.find("**/Sphere").is_empty()
+    assert not model.find("**/+GeomNode").is_empty()
+    editor.save()
+
+    editor.open(project)
+    model = editor.find(object_type="model")[0]
+    assert model.get_tag("filepath") == "models/misc/rgbCube"
+
+
+def test_rename(editor, project):
+    editor.open(project)
+    model = editor.find(object_type="model")[0]
+    editor.set_property(model, "name", "renamed")
+    assert editor.find(name="renamed") == [model]
+    assert editor.find(name="sphere.egg") == []
+
+
+def test_keep_dynamic(editor, project):
+    editor.open(project)
+    model = editor.find(object_type="model")[0]
+    editor.set_property(model, "keep_dynamic", True)
+    assert model.get_tag("keep_dynamic") == "True"
+    editor.save()
+
+    editor.open(project)
+    model = editor.find(object_type="model")[0]
+    assert editor.get_property(model, "keep_dynamic") is True
+    editor.set_property(model, "keep_dynamic", False)
+    assert not model.has_tag("keep_dynamic")
+
+
+def test_optimized_bam_export(editor, tmp_path):
+    editor.new()
+    for i in range(5):
+        model = editor.core.load_model("models/misc/sphere")
+        editor.set_property(model, "pos", (i * 3, 0, 0))
+
+    page = loadPrcFileData("", "scene-editor-bam-export-optimize #t")
+    try:
+        path = str(tmp_path / "optimized.bam")
+        editor.export("bam", path)
+    finally:
+        unloadPrcFile(page)
+
+    scene = loader.loadModel(path, noCache=True)
+    geom_nodes = scene.find_all_matches("**/+GeomNode")
+    assert sum(np.node().get_num_geoms() for np in geom_nodes) == 1
+
+
+def test_paste(editor, project):
+    editor.open(project)
+    core = editor.core
+    light = editor.find(object_type="light")[0]
+    core.select(light)
+    core.copy_elements()
+    core.paste_elements()
+    assert core.transaction_depth == 0
+    copies = editor.find(object_type="light")
+    assert len(copies) == 2
+    assert core.scene_model_parent.has_light(copies[-1].find("+Light"))
+
+
+def test_pick_collision_solid(editor):
+    editor.new()
+    core = editor.core
+    solid = core.add_collision_solid(
+        "CollisionSphere", {"center": Point3(0, 0, 0), "radius": 1.0})
+    # objects added after the first query are inserted into the hierarchy
+    core.picking_engine.update()
+    model = core.load_model("models/misc/sphere")
+    model.set_pos(5, 0, 0)
+    core.mark_object_dirty(model)
+
+    core.picker_ray.set_origin(Point3(0, -10, 0))
+    core.picker_ray.set_direction(Vec3(0, 1, 0))
+    assert core.pick_object() == solid
+    core.picker_ray.set_origin(Point3(5, -10, 0))
+    assert core.pick_object() == model